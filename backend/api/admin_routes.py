@@ -1,7 +1,9 @@
 # Admin API routes - restricted to users with the 'admin' role
 
 from flask import Blueprint, request, jsonify
-from core.security import admin_required  # decorator that verifies the current user has the 'admin' role
+from core.security import admin_required, invalidate_token_version  # decorator that verifies the current user has the 'admin' role
+from core.routing import read_only
+from core.container import container
 from models import User, db
 
 # Blueprint with prefix /api/admin
@@ -10,17 +12,48 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 @admin_bp.route('/users', methods=['GET'])
 @admin_required  # verify that the user is an admin
+@read_only  # May be served by the read replica
 def get_all_users():
-    # Return a list of all users in the system - admin only
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users]), 200
+    # Return one page of users with deck/card/session counts - admin only.
+    # The body stays a JSON array; pagination metadata goes into X-* headers. Follow X-Next-Cursor
+    # (?cursor=) to the next page in constant time; ?page= jumps by OFFSET.
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    search = request.args.get('search', '').strip() or None
+    sort_by = request.args.get('sort_by', 'id')
+    order = request.args.get('order', 'asc')
+    cursor = request.args.get('cursor', '').strip() or None
+
+    if page < 1:
+        return jsonify({'error': 'page должен быть >= 1'}), 400
+    if per_page < 1 or per_page > 200:
+        return jsonify({'error': 'per_page должен быть от 1 до 200'}), 400
+    if sort_by not in ('id', 'username', 'email', 'created_at', 'role', 'decks', 'cards', 'sessions'):
+        return jsonify({'error': 'Недопустимое значение sort_by'}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': 'Недопустимое значение order'}), 400
+
+    try:
+        total, users, next_cursor = container.admin_service.list_users(
+            search=search, sort_by=sort_by, order=order, page=page, per_page=per_page, cursor=cursor
+        )
+    except ValueError:
+        return jsonify({'error': 'Недопустимый cursor'}), 400
+    response = jsonify(users)
+    response.headers['X-Total-Count'] = str(total)
+    response.headers['X-Total-Pages'] = str((total + per_page - 1) // per_page)
+    response.headers['X-Page'] = str(page)
+    response.headers['X-Per-Page'] = str(per_page)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @admin_bp.route('/users/<int:user_id>/role', methods=['PUT'])
 @admin_required  # verify that the user is an admin
 def update_user_role(user_id):
     # Change the user's role - an admin can assign 'user' or 'admin' to another user
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
@@ -31,6 +64,22 @@ def update_user_role(user_id):
     if new_role not in ['user', 'admin']:
         return jsonify({'error': 'Invalid role'}), 400
 
-    user.role = new_role
-    db.session.commit()
+    if user.role != new_role:
+        # Revoke tokens carrying the old role claim
+        user.role = new_role
+        user.token_version = (user.token_version or 0) + 1
+        db.session.commit()
+        invalidate_token_version(user.id)
     return jsonify({'message': 'User role updated', 'user': user.to_dict()}), 200
+
+
+@admin_bp.route('/metrics', methods=['GET'])
+@admin_required  # verify that the user is an admin
+@read_only  # May be served by the read replica
+def get_metrics():
+    # Dashboard metrics (active users, decks, AI generations, cards studied, storage) from rollup tables
+    days = request.args.get('days', 30, type=int)
+    if days < 1 or days > 366:
+        return jsonify({'error': 'days должен быть от 1 до 366'}), 400
+    result, status_code = container.admin_service.get_metrics(days)
+    return jsonify(result), status_code
@@ -1,10 +1,11 @@
 # Deck and Card API routes - handles PDF uploads, CRUD operations, and CSV exports
 
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from core.container import container
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import io
-import csv
+from core.routing import read_only
+from core.conditional import conditional_get
+from repositories.card_repository import CARD_KEYS
 
 # Blueprint with common prefix /api
 deck_bp = Blueprint('deck', __name__, url_prefix='/api')
@@ -27,8 +28,42 @@ def upload_file():
     return jsonify(result), status_code
 
 
+@deck_bp.route('/decks/import', methods=['POST'])
+@jwt_required()  # Restricted to authenticated users
+def import_deck():
+    # Bulk import of a CSV/TSV file or an Anki package into a new deck (no AI).
+    # Returns 202 with the job; poll GET /api/imports/<job_id> for progress
+    if 'file' not in request.files:
+        return jsonify({'error': 'Файл не предоставлен'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'Файл не выбран'}), 400
+
+    user_id = int(get_jwt_identity())
+    title = request.form.get('title', '').strip() or None
+    result, status_code = container.import_service.start_import(user_id, file, file.filename, title)
+    response = jsonify(result)
+    if status_code == 202:
+        response.headers['Location'] = f"/api/imports/{result['job']['id']}"
+    return response, status_code
+
+
+@deck_bp.route('/imports/<int:job_id>', methods=['GET'])
+@jwt_required()  # Only the owner can see the import status
+def get_import(job_id):
+    user_id = int(get_jwt_identity())
+    result, status_code = container.import_service.get_job(job_id, user_id)
+    return jsonify(result), status_code
+
+
+def _user_decks_marker():
+    return container.deck_service.get_user_decks_marker(int(get_jwt_identity()))
+
+
 @deck_bp.route('/decks', methods=['GET'])
 @jwt_required()  # Restricted to authenticated users
+@read_only  # May be served by the read replica
+@conditional_get(_user_decks_marker)  # 304 while none of the user's decks changed
 def get_decks():
     # Return a list of decks for the authenticated user with support for sorting, filtering, and pagination
     user_id = int(get_jwt_identity())
@@ -45,7 +80,7 @@ def get_decks():
     min_cards = request.args.get('min_cards', type=int)
     max_cards = request.args.get('max_cards', type=int)
 
-    if sort_by not in ('newest', 'oldest', 'name', 'cards'):
+    if sort_by not in ('newest', 'oldest', 'name', 'cards', 'relevance'):
         return jsonify({'error': 'Недопустимое значение sort_by'}), 400
     if page < 1:
         return jsonify({'error': 'page должен быть >= 1'}), 400
@@ -58,28 +93,75 @@ def get_decks():
     if min_cards is not None and max_cards is not None and min_cards > max_cards:
         return jsonify({'error': 'min_cards не может быть больше max_cards'}), 400
 
-    pagination = container.deck_service.get_user_decks(
+    # Opt-in cursor mode: ?pagination=cursor for the first page, then ?cursor=<next_cursor>
+    cursor = request.args.get('cursor', '').strip() or None
+    if cursor or request.args.get('pagination') == 'cursor':
+        with_total = request.args.get('with_total', '').lower() in ('1', 'true')
+        try:
+            decks, next_cursor, total = container.deck_service.get_user_decks_keyset(
+                user_id, sort_by, per_page, cursor=cursor, with_total=with_total,
+                search=search, min_cards=min_cards, max_cards=max_cards,
+                date_from=date_from, date_to=date_to
+            )
+        except ValueError:
+            return jsonify({'error': 'Недопустимый cursor'}), 400
+        result = {
+            'decks': decks,
+            'next_cursor': next_cursor,
+            'per_page': per_page
+        }
+        if total is not None:
+            result['total'] = total
+        return jsonify(result), 200
+
+    decks, total, pages = container.deck_service.get_user_decks(
         user_id, sort_by, page, per_page,
         search=search, min_cards=min_cards, max_cards=max_cards,
         date_from=date_from, date_to=date_to
     )
-    decks = pagination.items
     return jsonify({
-        'decks': [deck.to_dict() for deck in decks],
-        'total': pagination.total,
-        'pages': pagination.pages,
+        'decks': decks,
+        'total': total,
+        'pages': pages,
         'current_page': page,
         'per_page': per_page
     }), 200
 
 
 @deck_bp.route('/decks/<int:deck_id>', methods=['GET'])
+@read_only  # May be served by the read replica
+@conditional_get(lambda deck_id: container.deck_service.get_deck_marker(deck_id), cache_control='public, no-cache')
 def get_deck(deck_id):
-    # Return a single deck with its nested cards - accessible publicly
-    deck = container.deck_service.get_deck(deck_id)
-    if not deck:
+    # Return a single deck with its nested cards - accessible publicly (served from the payload cache).
+    # Optional: ?include_cards=false, ?fields=id,question (card columns), ?cards_limit=&cards_cursor=
+    include_cards = request.args.get('include_cards', 'true').lower()
+    if include_cards not in ('true', 'false', '1', '0'):
+        return jsonify({'error': 'include_cards должен быть true или false'}), 400
+
+    fields = None
+    if request.args.get('fields'):
+        fields = tuple(dict.fromkeys(f.strip() for f in request.args['fields'].split(',') if f.strip()))
+        unknown = [f for f in fields if f not in CARD_KEYS]
+        if unknown or not fields:
+            return jsonify({'error': f"Недопустимые поля: {', '.join(unknown)}. Доступны: {', '.join(CARD_KEYS)}"}), 400
+
+    cards_limit = request.args.get('cards_limit', type=int)
+    if 'cards_limit' in request.args and (cards_limit is None or cards_limit < 1 or cards_limit > 500):
+        return jsonify({'error': 'cards_limit должен быть от 1 до 500'}), 400
+    cards_cursor = request.args.get('cards_cursor', '').strip() or None
+    if cards_cursor and not cards_limit:
+        return jsonify({'error': 'cards_cursor требует cards_limit'}), 400
+
+    try:
+        payload = container.deck_service.get_deck_payload(
+            deck_id, include_cards=include_cards in ('true', '1'), fields=fields,
+            cards_limit=cards_limit, cards_cursor=cards_cursor
+        )
+    except ValueError:
+        return jsonify({'error': 'Недопустимый cards_cursor'}), 400
+    if payload is None:
         return jsonify({'error': 'Not found'}), 404
-    return jsonify(deck.to_dict(include_cards=True)), 200
+    return Response(payload, mimetype='application/json'), 200
 
 
 @deck_bp.route('/decks/<int:deck_id>', methods=['PUT', 'DELETE'])
@@ -98,25 +180,23 @@ def deck_operations(deck_id):
 @deck_bp.route('/decks/<int:deck_id>/export', methods=['GET'])
 @jwt_required()  # Export is restricted to the deck owner
 def export_deck_csv(deck_id):
-    # Export deck cards to a CSV format (e.g. for Anki import)
+    # Export deck cards as CSV (default) or as a native Anki package (?format=apkg).
+    # The body is streamed while the cards are read in batches
     user_id = int(get_jwt_identity())
-    deck = container.deck_service.get_deck(deck_id)
-    if not deck:
-        return jsonify({'error': 'Not found'}), 404
-    if deck.user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 403
-
-    # Create CSV buffer in memory without writing to host disk
-    si = io.StringIO()
-    cw = csv.writer(si)
-    for card in deck.cards:
-        cw.writerow([card.question, card.answer])
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'apkg'):
+        return jsonify({'error': 'format должен быть csv или apkg'}), 400
+    result, status_code = container.deck_service.export_deck(deck_id, user_id, export_format)
+    if status_code != 200:
+        return jsonify(result), status_code
 
-    output = make_response(si.getvalue())
+    if export_format == 'apkg':
+        output = Response(stream_with_context(result['chunks']), mimetype='application/octet-stream')
+    else:
+        output = Response(stream_with_context(result['chunks']), content_type='text/csv; charset=utf-8')
     from urllib.parse import quote
-    filename = quote(f"{deck.title}.csv")  # Handle Cyrillic characters in filename encoding
+    filename = quote(f"{result['title']}.{export_format}")  # Handle Cyrillic characters in filename encoding
     output.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{filename}"
-    output.headers["Content-type"] = "text/csv; charset=utf-8"
     return output
 
 
@@ -127,6 +207,39 @@ def create_card(deck_id):
     return jsonify(result), status_code
 
 
+@deck_bp.route('/decks/<int:deck_id>/cards:batch', methods=['POST'])
+@jwt_required()  # Batch edits are restricted to the deck owner
+def batch_cards(deck_id):
+    # Apply mixed create/update/delete card operations in one request and one transaction:
+    # {"operations": [{"op": "create", "question": ..., "answer": ...}, {"op": "update", "id": 1, ...},
+    #                 {"op": "delete", "id": 2}]}
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    result, status_code = container.deck_service.batch_cards(deck_id, user_id, data.get('operations'))
+    return jsonify(result), status_code
+
+
+@deck_bp.route('/cards/search', methods=['GET'])
+@jwt_required()  # Searches only within the authenticated user's decks
+def search_cards():
+    # Full-text search over question, answer and source with cursor pagination
+    user_id = int(get_jwt_identity())
+    term = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    cursor = request.args.get('cursor', '').strip() or None
+
+    if not term:
+        return jsonify({'error': 'Параметр q обязателен'}), 400
+    if limit < 1 or limit > 50:
+        return jsonify({'error': 'limit должен быть от 1 до 50'}), 400
+
+    try:
+        result, status_code = container.deck_service.search_cards(user_id, term, limit, cursor=cursor)
+    except ValueError:
+        return jsonify({'error': 'Недопустимый cursor'}), 400
+    return jsonify(result), status_code
+
+
 @deck_bp.route('/cards/<int:card_id>', methods=['PUT', 'DELETE'])
 def card_operations(card_id):
     # Update or delete a specific card by its ID
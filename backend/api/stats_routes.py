@@ -1,8 +1,12 @@
 # Statistics API routes - handles retrieving, resetting, and saving study session statistics
 
 from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta
 from core.container import container
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from core.routing import read_only
+from core.conditional import conditional_get
+from repositories.leaderboard_repository import BOARDS as LEADERBOARDS
 
 # Blueprint with common prefix /api
 stats_bp = Blueprint('stats', __name__, url_prefix='/api')
@@ -17,8 +21,14 @@ def create_session():
     return jsonify(result), status_code
 
 
+def _stats_marker():
+    return container.stats_service.get_stats_marker(int(get_jwt_identity()))
+
+
 @stats_bp.route('/stats', methods=['GET'])
 @jwt_required()  # Restricted to authenticated users
+@read_only  # May be served by the read replica
+@conditional_get(_stats_marker)  # 304 while the stats row is unchanged
 def get_stats():
     # Retrieve statistics for the authenticated user (streaks, card count, accuracy)
     user_id = int(get_jwt_identity())
@@ -26,6 +36,62 @@ def get_stats():
     return jsonify(result), status_code
 
 
+@stats_bp.route('/stats/history', methods=['GET'])
+@jwt_required()  # Restricted to authenticated users
+@read_only  # May be served by the read replica
+def get_stats_history():
+    # Study history: per-period and per-deck series plus an activity heatmap (default: last 30 days)
+    user_id = int(get_jwt_identity())
+    granularity = request.args.get('granularity', 'day')
+    try:
+        day_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else datetime.utcnow().date()
+        day_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else day_to - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Даты должны быть в формате YYYY-MM-DD'}), 400
+
+    if granularity not in ('day', 'week', 'month'):
+        return jsonify({'error': 'Недопустимое значение granularity'}), 400
+    if day_from > day_to:
+        return jsonify({'error': 'from не может быть позже to'}), 400
+    if (day_to - day_from).days > 366:
+        return jsonify({'error': 'Диапазон не может превышать 366 дней'}), 400
+
+    result, status_code = container.stats_service.get_history(user_id, day_from, day_to, granularity)
+    return jsonify(result), status_code
+
+
+@stats_bp.route('/decks/<int:deck_id>/due', methods=['GET'])
+@jwt_required()  # The queue is personal - restricted to the deck owner
+def get_due_cards(deck_id):
+    # Spaced-repetition queue: due cards first, then new ones (?new=false to skip), at most ?limit=
+    user_id = int(get_jwt_identity())
+    limit = request.args.get('limit', 20, type=int)
+    if limit < 1 or limit > 200:
+        return jsonify({'error': 'limit должен быть от 1 до 200'}), 400
+    include_new = request.args.get('new', 'true').lower() not in ('false', '0')
+    result, status_code = container.stats_service.get_due_cards(user_id, deck_id, limit, include_new)
+    return jsonify(result), status_code
+
+
+@stats_bp.route('/leaderboards/<board>', methods=['GET'])
+@jwt_required()
+@read_only
+def get_leaderboard(board):
+    # Top ?limit= users by best correct streak ('streak') or cards studied ('cards'),
+    # all-time or for the current week (?period=week), plus the caller's own rank
+    user_id = int(get_jwt_identity())
+    if board not in LEADERBOARDS:
+        return jsonify({'error': 'Рейтинг должен быть streak или cards'}), 400
+    period = request.args.get('period', 'all')
+    if period not in ('all', 'week'):
+        return jsonify({'error': 'period должен быть all или week'}), 400
+    limit = request.args.get('limit', 10, type=int)
+    if limit < 1 or limit > 100:
+        return jsonify({'error': 'limit должен быть от 1 до 100'}), 400
+    result, status_code = container.stats_service.get_leaderboard(user_id, board, period, limit)
+    return jsonify(result), status_code
+
+
 @stats_bp.route('/stats/reset', methods=['POST'])
 @jwt_required()  # Restricted to authenticated users
 def reset_stats():
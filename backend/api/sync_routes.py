@@ -0,0 +1,27 @@
+# Delta sync API routes - lets clients keep a local copy of their decks, cards, files and stats
+
+from flask import Blueprint, request, jsonify
+from core.container import container
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from core.routing import read_only
+
+# Blueprint with common prefix /api
+sync_bp = Blueprint('sync', __name__, url_prefix='/api')
+
+
+@sync_bp.route('/sync', methods=['GET'])
+@jwt_required()  # Each user only sees their own change log
+@read_only
+def get_changes():
+    # Upserts and tombstones after ?since=<cursor>, at most ?limit= per page.
+    # Without a cursor (or with an expired one) the response asks for a full reload: reset=true
+    user_id = int(get_jwt_identity())
+    since = request.args.get('since', '').strip() or None
+    limit = request.args.get('limit', 500, type=int)
+    if limit < 1 or limit > 1000:
+        return jsonify({'error': 'limit должен быть от 1 до 1000'}), 400
+    try:
+        result, status_code = container.sync_service.get_changes(user_id, since, limit)
+    except ValueError:
+        return jsonify({'error': 'Недопустимый курсор since'}), 400
+    return jsonify(result), status_code
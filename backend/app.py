@@ -1,139 +1,345 @@
+import functools
+import json
+from datetime import datetime, timedelta
+
+import click
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_swagger_ui import get_swaggerui_blueprint
 
 from config import Config
+from core.database import install_engine_hooks
+from core.routing import init_read_routing
 from models import db
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Enable CORS with credentials support - without this, the browser will not send HttpOnly cookies to a different domain
-CORS(app, supports_credentials=True, origins=["http://localhost:3000", "http://localhost:3080", "http://localhost"])
-
-# Initialize extensions
-db.init_app(app)
-jwt = JWTManager(app)
-
 # Swagger UI configuration
 SWAGGER_URL = '/api/docs'
 API_URL = '/api/swagger.json'
-swaggerui_blueprint = get_swaggerui_blueprint(
-    SWAGGER_URL,
-    API_URL,
-    config={'app_name': "Study Cards API"}
-)
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
-
-# Create tables and run migrations inside app context
-with app.app_context():
-    db.create_all()
-    try:
-        from sqlalchemy import text
-        with db.engine.connect() as conn:
-            conn.execute(text("ALTER TABLE decks ADD COLUMN emoji VARCHAR(10)"))
-            conn.commit()
-            print("Added emoji column to decks table")
-    except Exception:
-        pass  # Column likely already exists
-
-    try:
-        from sqlalchemy import text
-        with db.engine.connect() as conn:
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS refresh_tokens (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    token VARCHAR(255) UNIQUE NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    expires_at DATETIME NOT NULL,
-                    revoked BOOLEAN DEFAULT 0,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(user_id) REFERENCES users(id)
-                )
-            """))
-            conn.commit()
-            print("Ensured refresh_tokens table exists")
-    except Exception as e:
-        print(f"Error checking refresh_tokens table: {e}")
-
-    try:
-        from sqlalchemy import text
-        with db.engine.connect() as conn:
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS deck_files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    deck_id INTEGER NOT NULL,
-                    object_name VARCHAR(500) NOT NULL,
-                    original_name VARCHAR(500) NOT NULL,
-                    size_bytes INTEGER NOT NULL,
-                    mime_type VARCHAR(100),
-                    uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(deck_id) REFERENCES decks(id)
-                )
-            """))
-            conn.commit()
-            print("Ensured deck_files table exists")
-    except Exception as e:
-        print(f"Error checking deck_files table: {e}")
-
-# Register Blueprints (API layer)
-from api.auth_routes import auth_bp
-from api.admin_routes import admin_bp
-from api.deck_routes import deck_bp
-from api.stats_routes import stats_bp
-from api.main_routes import main_bp
-from api.file_routes import file_bp
-from api.seo_routes import seo_bp
-
-app.register_blueprint(auth_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(deck_bp)
-app.register_blueprint(stats_bp)
-app.register_blueprint(main_bp)
-app.register_blueprint(file_bp)
-app.register_blueprint(seo_bp)
-
-
-# Global error handlers - returns proper HTTP statuses for SEO purposes
-@app.errorhandler(404)
-def not_found(e):
-    return jsonify({'error': 'Not Found', 'status': 404}), 404
-
-
-@app.errorhandler(403)
-def forbidden(e):
-    return jsonify({'error': 'Forbidden', 'status': 403}), 403
-
-
-@app.errorhandler(410)
-def gone(e):
-    return jsonify({'error': 'Gone', 'status': 410}), 410
-
-
-@app.errorhandler(500)
-def internal_error(e):
-    return jsonify({'error': 'Internal Server Error', 'status': 500}), 500
-
-
-# JWT error handlers - normalizes all token errors to 401 (Unauthorized)
-@jwt.invalid_token_loader
-def invalid_token_callback(error_string):
-    return jsonify({'error': 'Invalid token', 'status': 401}), 401
-
-@jwt.expired_token_loader
-def expired_token_callback(jwt_header, jwt_payload):
-    return jsonify({'error': 'Token expired', 'status': 401}), 401
-
-@jwt.unauthorized_loader
-def missing_token_callback(error_string):
-    return jsonify({'error': 'Missing token', 'status': 401}), 401
-
-
-# Swagger JSON spec endpoint
-@app.route('/api/swagger.json')
-def swagger_spec():
-    spec = {
+
+
+def create_app(config_object=Config):
+    # Application factory - nothing is built at import time, so gunicorn can preload the app once in
+    # the master (--preload) and fork the workers from it
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+
+    # Enable CORS with credentials support - without this, the browser will not send HttpOnly cookies to a different domain
+    CORS(app, supports_credentials=True, origins=["http://localhost:3000", "http://localhost:3080", "http://localhost"],
+         expose_headers=["X-Total-Count", "X-Total-Pages", "X-Page", "X-Per-Page", "X-Next-Cursor", "ETag"])
+
+    # Initialize extensions
+    db.init_app(app)
+    jwt = JWTManager(app)
+    init_read_routing(app)
+    with app.app_context():
+        # Connect-time hooks for the selected engine profile (e.g. SQLite WAL / busy_timeout / foreign_keys
+        # pragmas) - needed by every app, whether or not it runs the migrations below
+        install_engine_hooks(db.engine, app.config['DB_ENGINE_PROFILE'])
+
+    swaggerui_blueprint = get_swaggerui_blueprint(
+        SWAGGER_URL,
+        API_URL,
+        config={'app_name': "Study Cards API"}
+    )
+    app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+
+    from core.container import container
+    container.init_app(app)
+
+    register_blueprints(app)
+    register_cli(app)
+    register_error_handlers(app, jwt)
+
+    if app.config.get('AUTO_INIT_DB', True):
+        init_database(app)
+    return app
+
+
+def init_database(app):
+    # Create tables and run migrations inside app context
+    with app.app_context():
+        db.create_all()
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE decks ADD COLUMN emoji VARCHAR(10)"))
+                conn.commit()
+                print("Added emoji column to decks table")
+        except Exception:
+            pass  # Column likely already exists
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+                print("Added token_version column to users table")
+        except Exception:
+            pass  # Column likely already exists
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE decks ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+                print("Added version column to decks table")
+        except Exception:
+            pass  # Column likely already exists
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE decks ADD COLUMN card_count INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+                print("Added card_count column to decks table")
+        except Exception:
+            pass  # Column likely already exists
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE users ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+                print("Added change_seq column to users table")
+        except Exception:
+            pass  # Column likely already exists
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE user_stats ADD COLUMN updated_at DATETIME"))
+                conn.commit()
+                print("Added updated_at column to user_stats table")
+        except Exception:
+            pass  # Column likely already exists
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS refresh_tokens (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        token VARCHAR(255) UNIQUE NOT NULL,
+                        user_id INTEGER NOT NULL,
+                        expires_at DATETIME NOT NULL,
+                        revoked BOOLEAN DEFAULT 0,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY(user_id) REFERENCES users(id)
+                    )
+                """))
+                conn.commit()
+                print("Ensured refresh_tokens table exists")
+        except Exception as e:
+            print(f"Error checking refresh_tokens table: {e}")
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS deck_files (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        deck_id INTEGER NOT NULL,
+                        object_name VARCHAR(500) NOT NULL,
+                        original_name VARCHAR(500) NOT NULL,
+                        size_bytes INTEGER NOT NULL,
+                        mime_type VARCHAR(100),
+                        uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY(deck_id) REFERENCES decks(id)
+                    )
+                """))
+                conn.commit()
+                print("Ensured deck_files table exists")
+        except Exception as e:
+            print(f"Error checking deck_files table: {e}")
+
+        try:
+            # ON DELETE CASCADE on foreign keys of tables created before the rule existed
+            from core.database import upgrade_foreign_keys
+            upgrade_foreign_keys(db.engine, db.metadata)
+        except Exception as e:
+            print(f"Error upgrading foreign keys: {e}")
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                # Indexes for keyset pagination and per-deck card counts on pre-existing tables
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_decks_user_created ON decks (user_id, created_at, id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_decks_user_title ON decks (user_id, title, id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_decks_user_card_count ON decks (user_id, card_count, id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cards_deck_id ON cards (deck_id)"))
+                # Child-side indexes so ON DELETE CASCADE does not scan whole tables
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_deck_files_deck_id ON deck_files (deck_id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_study_sessions_user_id ON study_sessions (user_id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_study_sessions_deck_id ON study_sessions (deck_id)"))
+                conn.commit()
+        except Exception as e:
+            print(f"Error ensuring deck indexes: {e}")
+
+        try:
+            from sqlalchemy import text
+            with db.engine.connect() as conn:
+                # Indexes for the per-user cap and pruning on pre-existing tables; lookups by token use
+                # its unique index, so the former (token, revoked, expires_at) index only cost writes
+                conn.execute(text("DROP INDEX IF EXISTS ix_refresh_tokens_lookup"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_active ON refresh_tokens (user_id, revoked, created_at)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires_at ON refresh_tokens (expires_at)"))
+                conn.commit()
+        except Exception as e:
+            print(f"Error ensuring refresh token indexes: {e}")
+
+        try:
+            # Full-text indexes over decks and cards (FTS5 on SQLite, tsvector + GIN on Postgres)
+            from core.container import container
+            container.deck_search_repository.ensure_index(db.engine)
+            container.card_search_repository.ensure_index(db.engine)
+        except Exception as e:
+            print(f"Error ensuring search indexes: {e}")
+
+        try:
+            # Trigger-maintained decks.card_count (backfilled when the triggers are first created)
+            from core.container import container
+            container.deck_repository.ensure_card_counts(db.engine)
+        except Exception as e:
+            print(f"Error ensuring deck card counts: {e}")
+
+        # Drop the connections opened above so a preloading master hands no sockets to its workers
+        db.engine.dispose()
+
+
+def register_blueprints(app):
+    # Register Blueprints (API layer)
+    from api.auth_routes import auth_bp
+    from api.admin_routes import admin_bp
+    from api.deck_routes import deck_bp
+    from api.stats_routes import stats_bp
+    from api.main_routes import main_bp
+    from api.file_routes import file_bp
+    from api.seo_routes import seo_bp
+    from api.sync_routes import sync_bp
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(deck_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(main_bp)
+    app.register_blueprint(file_bp)
+    app.register_blueprint(seo_bp)
+    app.register_blueprint(sync_bp)
+
+    # Swagger JSON spec endpoint
+    @app.route(API_URL)
+    def swagger_spec():
+        return app.response_class(swagger_spec_json(), mimetype='application/json')
+
+
+def register_cli(app):
+    # CLI: flask --app app init-db
+    @app.cli.command('init-db')
+    def init_db_command():
+        # Create tables and run migrations (for deployments that start with AUTO_INIT_DB=false)
+        init_database(app)
+        click.echo("Database schema is up to date")
+
+    # CLI: flask --app app prune-tokens [--batch-size N] [--pause S]
+    @app.cli.command('prune-tokens')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction')
+    @click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches')
+    def prune_tokens_command(batch_size, pause):
+        # Delete expired and revoked refresh tokens in small batches (safe to run from cron)
+        from core.container import container
+        deleted = container.auth_service.prune_refresh_tokens(batch_size=batch_size, pause_seconds=pause)
+        click.echo(f"Deleted {deleted} expired or revoked refresh tokens")
+
+    # CLI: flask --app app compact-metrics [--rebuild-days N]
+    @app.cli.command('compact-metrics')
+    @click.option('--rebuild-days', default=0, show_default=True, help='Recompute this many recent days from source tables (never lowers a counter)')
+    @click.option('--keep-active-days', default=2, show_default=True, help='Days of active-user de-duplication rows to keep')
+    def compact_metrics_command(rebuild_days, keep_active_days):
+        # Periodic compaction of the admin dashboard rollups (safe to run from cron)
+        from core.container import container
+        pruned = container.admin_service.compact_metrics(rebuild_days=rebuild_days, keep_active_days=keep_active_days)
+        click.echo(f"Pruned {pruned} active-user rows" + (f", rebuilt {rebuild_days} days" if rebuild_days else ""))
+
+    # CLI: flask --app app rebuild-history
+    @app.cli.command('rebuild-history')
+    def rebuild_history_command():
+        # Backfill the user_daily_stats rollup from study_sessions (one-off, for sessions saved before it existed)
+        from core.container import container
+        rows = container.stats_repository.rebuild_daily_stats()
+        db.session.commit()
+        click.echo(f"Rebuilt {rows} daily history rows")
+
+    # CLI: flask --app app rebuild-leaderboards
+    @app.cli.command('rebuild-leaderboards')
+    def rebuild_leaderboards_command():
+        # Recompute the leaderboard rank histograms from the stored scores (repair tool)
+        from core.container import container
+        rows = container.leaderboard_repository.rebuild_histogram()
+        db.session.commit()
+        click.echo(f"Rebuilt {rows} leaderboard score buckets")
+
+    # CLI: flask --app app prune-leaderboards [--keep-weeks N]
+    @app.cli.command('prune-leaderboards')
+    @click.option('--keep-weeks', default=4, show_default=True, help='Weekly leaderboards kept, including the current week')
+    def prune_leaderboards_command(keep_weeks):
+        # Delete the entries and rank buckets of past weekly leaderboards (safe to run from cron)
+        from core.container import container
+        from repositories.leaderboard_repository import week_period
+        keep_from = week_period(datetime.utcnow().date() - timedelta(weeks=max(keep_weeks, 1) - 1))
+        deleted = container.leaderboard_repository.prune_weeks(keep_from)
+        db.session.commit()
+        click.echo(f"Deleted {deleted} leaderboard entries of weeks before {keep_from}")
+
+    # CLI: flask --app app compact-changelog
+    @app.cli.command('compact-changelog')
+    def compact_changelog_command():
+        # Purge change log entries older than SYNC_LOG_RETENTION_DAYS (safe to run from cron)
+        from core.container import container
+        purged = container.sync_service.compact()
+        click.echo(f"Purged {purged} change log entries")
+
+
+def register_error_handlers(app, jwt):
+    # Global error handlers - returns proper HTTP statuses for SEO purposes
+    @app.errorhandler(404)
+    def not_found(e):
+        return jsonify({'error': 'Not Found', 'status': 404}), 404
+
+    @app.errorhandler(403)
+    def forbidden(e):
+        return jsonify({'error': 'Forbidden', 'status': 403}), 403
+
+    @app.errorhandler(410)
+    def gone(e):
+        return jsonify({'error': 'Gone', 'status': 410}), 410
+
+    @app.errorhandler(500)
+    def internal_error(e):
+        return jsonify({'error': 'Internal Server Error', 'status': 500}), 500
+
+    # JWT error handlers - normalizes all token errors to 401 (Unauthorized)
+    @jwt.invalid_token_loader
+    def invalid_token_callback(error_string):
+        return jsonify({'error': 'Invalid token', 'status': 401}), 401
+
+    @jwt.expired_token_loader
+    def expired_token_callback(jwt_header, jwt_payload):
+        return jsonify({'error': 'Token expired', 'status': 401}), 401
+
+    @jwt.unauthorized_loader
+    def missing_token_callback(error_string):
+        return jsonify({'error': 'Missing token', 'status': 401}), 401
+
+
+@functools.lru_cache(maxsize=1)
+def swagger_spec_json():
+    # The spec is static - build and serialize it once per process instead of on every request
+    return json.dumps(build_swagger_spec())
+
+
+def build_swagger_spec():
+    return {
         "openapi": "3.0.0",
         "info": {
             "title": "Study Cards API",
@@ -285,8 +491,14 @@ def swagger_spec():
                 "get": {
                     "tags": ["Decks"],
                     "summary": "Get deck with cards",
-                    "parameters": [{"name": "deck_id", "in": "path", "required": True, "schema": {"type": "integer"}}],
-                    "responses": {"200": {"description": "Deck details"}, "404": {"description": "Not found"}}
+                    "parameters": [
+                        {"name": "deck_id", "in": "path", "required": True, "schema": {"type": "integer"}},
+                        {"name": "include_cards", "in": "query", "schema": {"type": "boolean", "default": True}},
+                        {"name": "fields", "in": "query", "description": "Card fields, e.g. id,question", "schema": {"type": "string"}},
+                        {"name": "cards_limit", "in": "query", "schema": {"type": "integer", "minimum": 1, "maximum": 500}},
+                        {"name": "cards_cursor", "in": "query", "schema": {"type": "string"}}
+                    ],
+                    "responses": {"200": {"description": "Deck details"}, "304": {"description": "Not modified"}, "404": {"description": "Not found"}}
                 },
                 "put": {
                     "tags": ["Decks"],
@@ -302,6 +514,19 @@ def swagger_spec():
                     "responses": {"200": {"description": "Deck deleted"}}
                 }
             },
+            "/api/cards/search": {
+                "get": {
+                    "tags": ["Decks"],
+                    "summary": "Full-text search over the user's cards",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [
+                        {"name": "q", "in": "query", "required": True, "schema": {"type": "string"}},
+                        {"name": "limit", "in": "query", "schema": {"type": "integer"}},
+                        {"name": "cursor", "in": "query", "schema": {"type": "string"}}
+                    ],
+                    "responses": {"200": {"description": "Matching cards with highlights"}, "400": {"description": "Invalid query"}}
+                }
+            },
             "/api/stats": {
                 "get": {
                     "tags": ["Statistics"],
@@ -333,11 +558,61 @@ def swagger_spec():
                     "security": [{"bearerAuth": []}],
                     "responses": {"200": {"description": "Cards generated"}, "400": {"description": "Invalid file"}}
                 }
+            },
+            "/api/decks/import": {
+                "post": {
+                    "tags": ["Decks"],
+                    "summary": "Import a CSV/TSV file or an Anki package (.apkg) into a new deck (background job)",
+                    "security": [{"bearerAuth": []}],
+                    "responses": {"202": {"description": "Import job started"}, "400": {"description": "Unsupported file"}}
+                }
+            },
+            "/api/imports/{job_id}": {
+                "get": {
+                    "tags": ["Decks"],
+                    "summary": "Import job status and progress",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [{"name": "job_id", "in": "path", "required": True, "schema": {"type": "integer"}}],
+                    "responses": {"200": {"description": "Job status"}, "404": {"description": "Not found"}}
+                }
+            },
+            "/api/leaderboards/{board}": {
+                "get": {
+                    "tags": ["Statistics"],
+                    "summary": "Leaderboard top-N and the caller's rank (board: streak or cards)",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [
+                        {"name": "board", "in": "path", "required": True, "schema": {"type": "string", "enum": ["streak", "cards"]}},
+                        {"name": "period", "in": "query", "schema": {"type": "string", "enum": ["all", "week"], "default": "all"}},
+                        {"name": "limit", "in": "query", "schema": {"type": "integer", "default": 10}}
+                    ],
+                    "responses": {"200": {"description": "Leaderboard"}, "400": {"description": "Invalid parameters"}}
+                }
+            },
+            "/api/sync": {
+                "get": {
+                    "tags": ["Sync"],
+                    "summary": "Deck, card, file and stats changes after a cursor (reset=true asks for a full reload)",
+                    "security": [{"bearerAuth": []}],
+                    "parameters": [
+                        {"name": "since", "in": "query", "schema": {"type": "string"}},
+                        {"name": "limit", "in": "query", "schema": {"type": "integer", "default": 500}}
+                    ],
+                    "responses": {"200": {"description": "Changes page"}, "400": {"description": "Invalid cursor"}}
+                }
             }
         }
     }
-    return jsonify(spec)
+
+
+def __getattr__(name):
+    # `app:app` (gunicorn), `flask --app app` and `from app import app` build the default app on first access
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    create_app().run(debug=True, port=5000)
@@ -0,0 +1,102 @@
+# Benchmark for account deletion: database-level ON DELETE CASCADE versus the old ORM cascade
+# (load every deck, card, session and file into the session and DELETE them one row at a time).
+# Seeds a user with DECKS x CARDS cards (500 x 50 by default) into a temporary SQLite database
+# and reports wall time, SQL statement count and peak Python memory for both strategies.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_cascade_delete.py [--decks 500] [--cards 50]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.exc import SAWarning
+
+
+def seed(db, models, n_decks, n_cards):
+    from sqlalchemy import insert
+    user = models.User(username='heavy', email='heavy@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(models.UserStats(user_id=user.id))
+    db.session.execute(insert(models.Deck), [{'title': f'Deck {i}', 'user_id': user.id} for i in range(n_decks)])
+    deck_ids = [row[0] for row in db.session.query(models.Deck.id).filter_by(user_id=user.id)]
+    db.session.execute(insert(models.Card), [
+        {'question': f'Q{j}', 'answer': f'A{j}', 'deck_id': deck_id, 'times_studied': 0, 'times_correct': 0}
+        for deck_id in deck_ids for j in range(n_cards)
+    ])
+    db.session.execute(insert(models.StudySession), [{'user_id': user.id, 'deck_id': d} for d in deck_ids])
+    db.session.execute(insert(models.DeckFile), [
+        {'deck_id': d, 'object_name': f'deck_{d}.pdf', 'original_name': 'a.pdf', 'size_bytes': 1} for d in deck_ids[:50]
+    ])
+    db.session.commit()
+    return user.id
+
+
+def legacy_delete(db, models, user_id):
+    # What cascade='all, delete-orphan' without passive_deletes did: hydrate everything, delete row by row.
+    # The database cascade now also fires underneath, so row-count mismatch warnings are silenced.
+    warnings.simplefilter('ignore', SAWarning)
+    user = db.session.get(models.User, user_id)
+    for deck in models.Deck.query.filter_by(user_id=user_id).all():
+        for card in models.Card.query.filter_by(deck_id=deck.id).all():
+            db.session.delete(card)
+        for deck_file in models.DeckFile.query.filter_by(deck_id=deck.id).all():
+            db.session.delete(deck_file)
+        for session in models.StudySession.query.filter_by(deck_id=deck.id).all():
+            db.session.delete(session)
+        db.session.delete(deck)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def measure(label, app, db, fn):
+    from sqlalchemy import event
+    statements = []
+    listener = lambda *args: statements.append(1)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        tracemalloc.start()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    print(f"{label:<22} {elapsed * 1000:>9.1f} ms {len(statements):>8} statements {peak / 1024 / 1024:>8.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark account deletion strategies')
+    parser.add_argument('--decks', type=int, default=500)
+    parser.add_argument('--cards', type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    from app import app
+    from models import db
+    import models
+    from core.container import container
+    import services.deck_service as deck_service
+    deck_service.remove_storage_objects = lambda names: None  # no MinIO in the benchmark
+
+    print(f"Deleting a user with {args.decks} decks x {args.cards} cards")
+    with app.app_context():
+        user_id = seed(db, models, args.decks, args.cards)
+    measure('ORM row-by-row', app, db, lambda: legacy_delete(db, models, user_id))
+
+    with app.app_context():
+        db.session.remove()
+        user_id = seed(db, models, args.decks, args.cards)
+    measure('ON DELETE CASCADE', app, db, lambda: container.auth_service.delete_user(user_id))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# Concurrency benchmark for database engine profiles (see core/database.py).
+# Simulates several gunicorn workers (separate processes) doing a mix of reads and
+# short write transactions against the same database, and reports throughput and
+# "database is locked" failures for each profile.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_engine_profiles.py [--workers 3] [--ops 300] [--write-ratio 0.2]
+# Set BENCH_POSTGRES_URI to also benchmark the 'default' and 'postgres' profiles on Postgres.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from core.database import engine_options, install_engine_hooks
+
+
+def make_engine(uri, profile):
+    engine = create_engine(uri, **engine_options(profile))
+    install_engine_hooks(engine, profile)
+    return engine
+
+
+def setup(uri, profile):
+    engine = make_engine(uri, profile)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_cards"))
+        conn.execute(text("CREATE TABLE bench_cards (id INTEGER PRIMARY KEY, times_studied INTEGER NOT NULL DEFAULT 0)"))
+        conn.execute(text("INSERT INTO bench_cards (id, times_studied) VALUES (:id, 0)"), [{'id': i} for i in range(1, 1001)])
+    engine.dispose()
+
+
+def worker(args):
+    uri, profile, ops, write_ratio, seed = args
+    rng = random.Random(seed)
+    engine = make_engine(uri, profile)
+    done = errors = 0
+    for _ in range(ops):
+        try:
+            with engine.begin() as conn:
+                if rng.random() < write_ratio:
+                    ids = [rng.randint(1, 1000) for _ in range(20)]
+                    conn.execute(text("UPDATE bench_cards SET times_studied = times_studied + 1 WHERE id = :id"),
+                                 [{'id': i} for i in ids])
+                else:
+                    conn.execute(text("SELECT SUM(times_studied) FROM bench_cards WHERE id BETWEEN :a AND :b"),
+                                 {'a': rng.randint(1, 500), 'b': rng.randint(500, 1000)}).scalar()
+            done += 1
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    return done, errors
+
+
+def run(uri, profile, workers, ops, write_ratio):
+    setup(uri, profile)
+    started = time.perf_counter()
+    with Pool(workers) as pool:
+        results = pool.map(worker, [(uri, profile, ops, write_ratio, seed) for seed in range(workers)])
+    elapsed = time.perf_counter() - started
+    done = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    print(f"{profile:<10} {uri.split(':')[0]:<12} {done / elapsed:>10.1f} tx/s {errors:>8} errors  ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark database engine profiles under concurrent workers')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--ops', type=int, default=300)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10} {'dialect':<12} {'throughput':>13} {'failures':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ('default', 'sqlite'):
+            # Fresh file per profile: WAL mode is persistent once set on a database file
+            uri = f"sqlite:///{os.path.join(tmp, f'bench_{profile}.db')}"
+            run(uri, profile, args.workers, args.ops, args.write_ratio)
+
+    pg_uri = os.environ.get('BENCH_POSTGRES_URI')
+    if pg_uri:
+        for profile in ('default', 'postgres'):
+            run(pg_uri, profile, args.workers, args.ops, args.write_ratio)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Benchmark for bulk deck import: N cards (10,000 by default) from a CSV file and from an Anki
+# package, parsed as a stream and inserted in IMPORT_BATCH_SIZE batches, versus the same cards
+# added one POST /api/decks/<id>/cards-style create_card() call (one commit) at a time.
+# Uses a temporary SQLite database; reports wall time and cards per second.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_import.py [--cards 10000]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class Upload:
+    # Minimal stand-in for werkzeug's FileStorage
+    def __init__(self, data):
+        self.data = data
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+def report(label, n_cards, elapsed):
+    print(f"{label:<26} {elapsed:>8.2f} s {n_cards / elapsed:>10.0f} cards/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk deck import')
+    parser.add_argument('--cards', type=int, default=10000)
+    parser.add_argument('--single', type=int, default=500, help='cards for the one-by-one baseline')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ['BACKGROUND_TASKS_INLINE'] = 'true'
+    from app import app
+    from models import db, User, Deck
+    from core.container import container
+    from services.anki_package import stream_apkg
+
+    csv_data = '\n'.join(f'"Вопрос {i}, подробный","Ответ {i}"' for i in range(args.cards)).encode('utf-8')
+    batches = [[(i, f'Вопрос {i}', f'Ответ {i}') for i in range(start, min(start + 1000, args.cards))]
+               for start in range(0, args.cards, 1000)]
+    with app.app_context():
+        apkg_data = b''.join(stream_apkg(1, 'bench', batches))
+        user = User(username='importer', email='importer@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    print(f"Importing {args.cards} cards")
+    with app.test_request_context():
+        for label, name, data in (('CSV import', 'bench.csv', csv_data), ('.apkg import', 'bench.apkg', apkg_data)):
+            started = time.perf_counter()
+            result, _ = container.import_service.start_import(user_id, Upload(data), name)
+            report(label, result['job']['cards_imported'], time.perf_counter() - started)
+
+        deck = Deck(title='one by one', user_id=user_id)
+        db.session.add(deck)
+        db.session.commit()
+        started = time.perf_counter()
+        for i in range(args.single):
+            container.deck_service.create_card(deck.id, {'question': f'Q{i}', 'answer': f'A{i}'})
+        report(f'create_card x{args.single}', args.single, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
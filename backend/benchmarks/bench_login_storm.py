@@ -0,0 +1,98 @@
+# Benchmark for a login storm: LOGIN_THREADS clients keep calling POST /api/auth/login while one
+# client measures GET /api/decks latency, first with password hashes computed inline in the request
+# thread (PASSWORD_HASH_WORKERS=0) and then in the bounded password pool (core/passwords.py).
+# Uses a temporary SQLite database and the Flask test client in one process, like a gthread worker;
+# reports login throughput and deck-listing p50/p95/max latency for each mode.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_login_storm.py [--login-threads 6] [--seconds 5] [--pool-workers 1]
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def seed(db, models, n_users):
+    from core.passwords import hash_password
+    from core.security import issue_access_token
+    password_hash = hash_password('storm-password')
+    users = [models.User(username=f'student{i}', email=f'student{i}@example.com', password_hash=password_hash)
+             for i in range(n_users)]
+    db.session.add_all(users)
+    db.session.flush()
+    for j in range(20):
+        db.session.add(models.Deck(title=f'Deck {j}', user_id=users[0].id))
+    db.session.commit()
+    return issue_access_token(users[0])
+
+
+def run(label, app, token, n_threads, n_users, seconds):
+    stop = threading.Event()
+    logins, lock = [0], threading.Lock()
+    latencies = []
+
+    def login_loop(index):
+        client = app.test_client()
+        while not stop.is_set():
+            response = client.post('/api/auth/login', json={
+                'username': f'student{index % n_users}', 'password': 'storm-password'
+            })
+            if response.status_code == 200:
+                with lock:
+                    logins[0] += 1
+
+    def deck_loop():
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/api/decks', headers=headers)
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(n_threads)]
+    threads.append(threading.Thread(target=deck_loop))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{label:<12} logins {logins[0] / seconds:>6.1f}/s   GET /api/decks p50 {p(0.5):>7.1f} ms"
+          f"  p95 {p(0.95):>7.1f} ms  max {latencies[-1] * 1000:>7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark deck listing latency during a login storm')
+    parser.add_argument('--login-threads', type=int, default=6)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--pool-workers', type=int, default=1)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    from app import app
+    from models import db
+    import models
+
+    app.config['PASSWORD_HASH_WORKERS'] = 0
+    with app.app_context():
+        token = seed(db, models, args.login_threads)
+
+    print(f"{args.login_threads} login threads for {args.seconds:g} s, method {app.config['PASSWORD_HASH_METHOD']}")
+    run('no storm', app, token, 0, args.login_threads, args.seconds)
+    run('inline', app, token, args.login_threads, args.login_threads, args.seconds)
+    app.config['PASSWORD_HASH_WORKERS'] = args.pool_workers
+    run(f'pool x{args.pool_workers}', app, token, args.login_threads, args.login_threads, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
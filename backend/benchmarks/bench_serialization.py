@@ -0,0 +1,101 @@
+# Benchmark for deck serialization: ORM hydration + to_dict() versus the column projection path
+# (plain rows, accuracy computed in SQL, straight to JSON bytes) used by GET /api/decks/<id>,
+# GET /api/decks and CSV export. Seeds one deck with CARDS cards (2,000 by default) into a
+# temporary SQLite database and reports the best-of-N time per request and per card row.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_serialization.py [--cards 2000] [--repeat 20]
+
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def seed(db, models, n_cards):
+    from sqlalchemy import insert
+    user = models.User(username='reader', email='reader@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    deck = models.Deck(title='Big deck', description='Benchmark', user_id=user.id)
+    db.session.add(deck)
+    db.session.flush()
+    db.session.execute(insert(models.Card), [
+        {'question': f'Вопрос {j}', 'answer': f'Ответ {j}', 'source': 'bench', 'deck_id': deck.id,
+         'times_studied': j % 7, 'times_correct': j % 5 if j % 7 else 0}
+        for j in range(n_cards)
+    ])
+    db.session.commit()
+    return user.id, deck.id
+
+
+def orm_detail(app, db, models, deck_id):
+    # Previous GET /api/decks/<id> path
+    deck = db.session.get(models.Deck, deck_id)
+    return app.json.dumps(deck.to_dict(include_cards=True)).encode('utf-8')
+
+
+def projection_detail(container, deck_id):
+    container.deck_cache.clear()  # measure the miss path, not the cache
+    return container.deck_service.get_deck_payload(deck_id)
+
+
+def orm_export(db, models, deck_id):
+    # Previous CSV export path
+    deck = db.session.get(models.Deck, deck_id)
+    si = io.StringIO()
+    cw = csv.writer(si)
+    for card in deck.cards:
+        cw.writerow([card.question, card.answer])
+    return si.getvalue()
+
+
+def projection_export(container, user_id, deck_id):
+    return container.deck_service.export_deck_csv(deck_id, user_id)[0]['csv']
+
+
+def measure(label, app, db, fn, n_rows, repeat):
+    best = None
+    with app.app_context():
+        for _ in range(repeat):
+            db.session.expire_all()
+            db.session.remove()  # every request starts with an empty identity map
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<24} {best * 1000:>9.2f} ms {best / n_rows * 1e6:>9.2f} us/row")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark deck serialization paths')
+    parser.add_argument('--cards', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    from app import app
+    from models import db
+    import models
+    from core.container import container
+
+    with app.app_context():
+        user_id, deck_id = seed(db, models, args.cards)
+        # Both paths must produce the same document
+        assert app.json.loads(orm_detail(app, db, models, deck_id)) == app.json.loads(projection_detail(container, deck_id))
+
+    print(f"Serializing a deck with {args.cards} cards (best of {args.repeat})")
+    measure('detail: ORM + to_dict', app, db, lambda: orm_detail(app, db, models, deck_id), args.cards, args.repeat)
+    measure('detail: projection', app, db, lambda: projection_detail(container, deck_id), args.cards, args.repeat)
+    measure('CSV: ORM', app, db, lambda: orm_export(db, models, deck_id), args.cards, args.repeat)
+    measure('CSV: projection', app, db, lambda: projection_export(container, user_id, deck_id), args.cards, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
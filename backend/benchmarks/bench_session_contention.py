@@ -0,0 +1,101 @@
+# Benchmark for POST /api/sessions under contention: THREADS clients keep saving sessions over the
+# same shared deck (every session touches the same CARDS card rows), first with per-request card
+# counter UPDATEs and then with the write-behind buffer (CARD_COUNTER_WRITE_BEHIND). Uses a
+# temporary SQLite database and the Flask test client; reports p50/p95/max latency and throughput.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_session_contention.py [--threads 8] [--sessions 50] [--cards 20]
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def seed(db, models, n_cards):
+    from sqlalchemy import insert
+    from core.security import issue_access_token
+    user = models.User(username='student', email='student@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(models.UserStats(user_id=user.id))  # concurrent first sessions would race to create it
+    deck = models.Deck(title='Exam deck', user_id=user.id)
+    db.session.add(deck)
+    db.session.flush()
+    db.session.execute(insert(models.Card), [
+        {'question': f'Q{j}', 'answer': f'A{j}', 'deck_id': deck.id, 'times_studied': 0, 'times_correct': 0}
+        for j in range(n_cards)
+    ])
+    db.session.commit()
+    card_ids = [card_id for (card_id,) in db.session.query(models.Card.id).filter_by(deck_id=deck.id)]
+    return issue_access_token(user), deck.id, card_ids
+
+
+def run(label, app, token, deck_id, card_ids, n_threads, n_sessions):
+    latencies, lock = [], threading.Lock()
+    body = {
+        'deck_id': deck_id, 'cards_studied': len(card_ids), 'cards_correct': len(card_ids) // 2,
+        'card_results': [{'card_id': cid, 'correct': i % 2 == 0} for i, cid in enumerate(card_ids)]
+    }
+
+    def client_loop():
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        for _ in range(n_sessions):
+            started = time.perf_counter()
+            response = client.post('/api/sessions', headers=headers, json=body)
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 201, response.get_data(as_text=True)
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(n_threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{label:<16} p50 {p(0.5):>7.1f} ms  p95 {p(0.95):>7.1f} ms  max {latencies[-1] * 1000:>7.1f} ms"
+          f"  {len(latencies) / wall:>7.1f} sessions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark session saves on a shared deck')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=50, help='sessions per thread')
+    parser.add_argument('--cards', type=int, default=20, help='cards per session (all in the same deck)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    from app import app
+    from models import db
+    import models
+    from core.container import container
+
+    with app.app_context():
+        token, deck_id, card_ids = seed(db, models, args.cards)
+
+    print(f"{args.threads} threads x {args.sessions} sessions, {args.cards} shared cards per session")
+    app.config['CARD_COUNTER_WRITE_BEHIND'] = False
+    run('per-request', app, token, deck_id, card_ids, args.threads, args.sessions)
+    app.config['CARD_COUNTER_WRITE_BEHIND'] = True
+    run('write-behind', app, token, deck_id, card_ids, args.threads, args.sessions)
+    container.card_counter_buffer.flush()
+
+    with app.app_context():
+        studied = db.session.query(db.func.sum(models.Card.times_studied)).scalar()
+    # No increment may be lost in either mode
+    assert studied == 2 * args.threads * args.sessions * args.cards, studied
+
+
+if __name__ == '__main__':
+    main()
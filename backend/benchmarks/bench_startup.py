@@ -0,0 +1,98 @@
+# Benchmark for worker startup: each run is a fresh interpreter that imports the app module, calls
+# create_app() and serves a first request, reporting the time of each step, the resident memory
+# (VmRSS) and whether minio / PyPDF2 / requests got imported. The 'eager' mode pre-imports those
+# modules and builds the MinIO client first, like the module-level imports used to.
+# The fork run mimics gunicorn --preload: the app is created once, workers are forked from it and
+# each reports its private (unshared) memory after serving a request.
+# Uses a temporary SQLite database whose schema is created once up front.
+#
+# Usage (from backend/):
+#   python benchmarks/bench_startup.py [--runs 5] [--workers 3]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = r'''
+import json, os, sys, time
+sys.path.insert(0, BACKEND)
+HEAVY = ('minio', 'PyPDF2', 'requests')
+
+
+def memory(field):
+    with open('/proc/self/' + ('smaps_rollup' if field.startswith('Private') else 'status')) as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith(field)) // 1024
+
+
+started = time.perf_counter()
+if MODE == 'eager':
+    import minio, PyPDF2, ai_service
+    from services.deck_service import get_minio_client
+    get_minio_client()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+app.test_client().get('/api/swagger.json')
+served = time.perf_counter()
+result = {
+    'import': imported - started, 'create': created - imported, 'request': served - created,
+    'rss': memory('VmRSS'), 'heavy': [name for name in HEAVY if name in sys.modules],
+}
+
+if MODE == 'fork':
+    # Workers forked from the preloaded app; each reports the memory it does not share with the master
+    pipes = []
+    for _ in range(WORKERS):
+        read_fd, write_fd = os.pipe()
+        if os.fork() == 0:
+            os.close(read_fd)
+            app.test_client().get('/api/swagger.json')
+            os.write(write_fd, str(memory('Private')).encode())
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append(read_fd)
+    result['private'] = [int(os.read(fd, 64)) for fd in pipes]
+    for _ in pipes:
+        os.wait()
+print(json.dumps(result))
+'''
+
+
+def run_child(mode, workers, env):
+    code = f"BACKEND = {BACKEND!r}\nMODE = {mode!r}\nWORKERS = {workers}\n" + CHILD
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=BACKEND,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark app import, create_app and worker memory')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+    run_child('lazy', 0, env)  # creates the schema so every measured run only checks it
+
+    print(f"{'mode':<6} {'import':>10} {'create_app':>11} {'1st request':>12} {'RSS':>8}  heavy modules")
+    for mode in ('eager', 'lazy'):
+        results = [run_child(mode, 0, env) for _ in range(args.runs)]
+        median = lambda key: sorted(r[key] for r in results)[len(results) // 2]
+        print(f"{mode:<6} {median('import') * 1000:>7.0f} ms {median('create') * 1000:>8.0f} ms"
+              f" {median('request') * 1000:>9.1f} ms {median('rss'):>5} MB  {', '.join(results[0]['heavy']) or '-'}")
+
+    if sys.platform.startswith('linux'):
+        result = run_child('fork', args.workers, env)
+        print(f"preload master RSS {result['rss']} MB; private MB per forked worker: "
+              f"{', '.join(str(mb) for mb in result['private'])}")
+
+
+if __name__ == '__main__':
+    main()
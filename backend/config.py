@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from core.database import resolve_profile, engine_options
 
 load_dotenv()
 
@@ -12,6 +13,15 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI') or 'sqlite:///study_cards.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Engine profile: 'default', 'sqlite' or 'postgres' (see core/database.py)
+    DB_ENGINE_PROFILE = resolve_profile(os.environ.get('DB_ENGINE_PROFILE'), SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DB_ENGINE_PROFILE)
+    # Run create_all and the column migrations when the app is created; set to false when several
+    # replicas start at once and run `flask --app app init-db` as a release step instead
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', 'True').lower() == 'true'
+    # Optional read replica for read-only endpoints (see core/routing.py)
+    SQLALCHEMY_REPLICA_URI = os.environ.get('SQLALCHEMY_REPLICA_URI')
+    REPLICA_READ_AFTER_WRITE_SECONDS = int(os.environ.get('REPLICA_READ_AFTER_WRITE_SECONDS', 5))
     
     # API Keys and URLs
     API_KEY = os.environ.get('API_KEY') or os.environ.get('GEMINI_API_KEY')
@@ -26,6 +36,39 @@ class Config:
     MINIO_SECURE = os.environ.get('MINIO_SECURE', 'False').lower() == 'true'
     MINIO_BUCKET = os.environ.get('MINIO_BUCKET', 'uploads')
     JWT_ACCESS_TOKEN_EXPIRES = False  # Tokens never expire (for development)
+    # Deck import: cards per COPY/executemany batch, background thread pool size per process.
+    # BACKGROUND_TASKS_INLINE runs background tasks synchronously (tests, scripts)
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 2000))
+    BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 2))
+    BACKGROUND_TASKS_INLINE = os.environ.get('BACKGROUND_TASKS_INLINE', 'False').lower() == 'true'
+    # Upper bound for POST /api/decks/<id>/cards:batch
+    CARD_BATCH_MAX_OPERATIONS = int(os.environ.get('CARD_BATCH_MAX_OPERATIONS', 500))
+    # Password hashing (core/passwords.py): werkzeug method string, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:600000'; stored hashes with other parameters are rehashed on login.
+    # Hashes run in PASSWORD_HASH_WORKERS processes per web worker (0 = inline) with at most
+    # PASSWORD_HASH_MAX_PENDING queued per web worker; callers wait PASSWORD_HASH_QUEUE_TIMEOUT for a slot
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+    PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', 5))
+    # Write-behind card study counters: sessions buffer times_studied/times_correct deltas in memory
+    # and a per-worker thread applies them every CARD_COUNTER_FLUSH_SECONDS (or once
+    # CARD_COUNTER_MAX_PENDING cards are waiting); a crashed worker loses at most one interval
+    CARD_COUNTER_WRITE_BEHIND = os.environ.get('CARD_COUNTER_WRITE_BEHIND', 'False').lower() == 'true'
+    CARD_COUNTER_FLUSH_SECONDS = float(os.environ.get('CARD_COUNTER_FLUSH_SECONDS', 2))
+    CARD_COUNTER_MAX_PENDING = int(os.environ.get('CARD_COUNTER_MAX_PENDING', 5000))
+    # Days of change log kept for GET /api/sync; older cursors get a full resync (reset)
+    SYNC_LOG_RETENTION_DAYS = int(os.environ.get('SYNC_LOG_RETENTION_DAYS', 30))
+    # Rows fetched per round trip when streaming deck exports (CSV / .apkg)
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 500))
+    # Per-worker LRU cache of serialized GET /api/decks/<id> responses
+    DECK_CACHE_MAX_ENTRIES = int(os.environ.get('DECK_CACHE_MAX_ENTRIES', 1024))
+    DECK_CACHE_MAX_BYTES = int(os.environ.get('DECK_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    # How long a worker trusts its cached per-user token version (role-change revocation delay)
+    TOKEN_VERSION_CACHE_TTL = int(os.environ.get('TOKEN_VERSION_CACHE_TTL', 30))
+    # Oldest active refresh tokens beyond this many per user are deleted on login/refresh
+    MAX_ACTIVE_REFRESH_TOKENS = int(os.environ.get('MAX_ACTIVE_REFRESH_TOKENS', 10))
     
     OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
     MODEL = "nvidia/nemotron-3-super-120b-a12b:free"
\ No newline at end of file
@@ -0,0 +1,83 @@
+# In-process LRU cache for serialized API payloads.
+# Bounded both by entry count and by the total size of the stored bytes; the least recently
+# used entries are evicted first. Each gunicorn worker holds its own copy, so entries must be
+# validated against a version stored in the database (see DeckService.get_deck_payload).
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        # Payload cached for this exact version, or None (a stale version counts as a miss)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, payload):
+        with self._lock:
+            self._pop(key)
+            if self.max_bytes is not None and len(payload) > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._entries[key] = (version, payload)
+            self._bytes += len(payload)
+            self._evict()
+
+    def resize(self, max_entries, max_bytes=None):
+        # Apply new bounds (e.g. from the app config), evicting the least recently used entries if needed
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def discard(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _evict(self):
+        # Caller holds self._lock
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
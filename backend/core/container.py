@@ -4,8 +4,16 @@
 from repositories.user_repository import UserRepository
 from repositories.token_repository import TokenRepository
 from repositories.deck_repository import DeckRepository
+from repositories.search_repository import DeckSearchRepository, CardSearchRepository
 from repositories.card_repository import CardRepository
 from repositories.stats_repository import StatsRepository
+from repositories.metrics_repository import MetricsRepository
+from repositories.import_repository import ImportRepository
+from repositories.schedule_repository import ScheduleRepository
+from repositories.change_log_repository import ChangeLogRepository
+from repositories.leaderboard_repository import LeaderboardRepository
+from core.cache import LRUCache
+from core.write_behind import CounterBuffer
 
 
 class Container:
@@ -13,32 +21,90 @@ class Container:
         # Instantiate repositories (data access layer)
         self.user_repository = UserRepository()
         self.token_repository = TokenRepository()
-        self.deck_repository = DeckRepository()
-        self.card_repository = CardRepository()
+        self.deck_search_repository = DeckSearchRepository()
+        self.deck_repository = DeckRepository(self.deck_search_repository)
+        self.card_search_repository = CardSearchRepository()
+        self.card_repository = CardRepository(self.card_search_repository)
         self.stats_repository = StatsRepository()
+        self.metrics_repository = MetricsRepository()
+        self.import_repository = ImportRepository()
+        self.schedule_repository = ScheduleRepository()
+        self.change_log_repository = ChangeLogRepository()
+        self.leaderboard_repository = LeaderboardRepository()
+
+        # Serialized deck payloads, validated against decks.version on every read (sized in init_app)
+        self.deck_cache = LRUCache()
+        # Per-process buffer of card study counters, flushed by StatsService (CARD_COUNTER_WRITE_BEHIND);
+        # interval and size are set in init_app
+        self.card_counter_buffer = CounterBuffer(
+            lambda studied, correct, studied_at: self.stats_service.flush_card_counters(studied, correct, studied_at)
+        )
 
         # Import services locally to avoid circular dependencies
         from services.auth_service import AuthService
         from services.deck_service import DeckService
         from services.stats_service import StatsService
+        from services.admin_service import AdminService
+        from services.import_service import ImportService
+        from services.sync_service import SyncService
 
         # Instantiate services and inject required repositories (Constructor Dependency Injection)
         self.auth_service = AuthService(
             self.user_repository,
             self.token_repository,
-            self.stats_repository
+            self.stats_repository,
+            self.metrics_repository,
+            self.leaderboard_repository
         )
         self.deck_service = DeckService(
             self.deck_repository,
             self.card_repository,
             self.user_repository,
-            self.stats_repository
+            self.stats_repository,
+            self.metrics_repository,
+            self.deck_cache,
+            self.change_log_repository
         )
         self.stats_service = StatsService(
             self.stats_repository,
             self.deck_repository,
             self.card_repository,
-            self.user_repository
+            self.user_repository,
+            self.metrics_repository,
+            self.schedule_repository,
+            self.change_log_repository,
+            self.card_counter_buffer,
+            self.leaderboard_repository
+        )
+        self.import_service = ImportService(
+            self.deck_repository,
+            self.card_repository,
+            self.stats_repository,
+            self.metrics_repository,
+            self.import_repository,
+            self.change_log_repository
+        )
+        self.sync_service = SyncService(
+            self.change_log_repository,
+            self.deck_repository,
+            self.card_repository,
+            self.stats_repository
+        )
+        self.admin_service = AdminService(
+            self.user_repository,
+            self.metrics_repository,
+            self.deck_cache
+        )
+
+    def init_app(self, app):
+        # Apply the app's config to the process-wide caches (called by create_app)
+        self.deck_cache.resize(
+            app.config.get('DECK_CACHE_MAX_ENTRIES', 1024),
+            app.config.get('DECK_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        )
+        self.card_counter_buffer.configure(
+            app.config.get('CARD_COUNTER_FLUSH_SECONDS', 2.0),
+            app.config.get('CARD_COUNTER_MAX_PENDING', 5000)
         )
 
 
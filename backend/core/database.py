@@ -0,0 +1,151 @@
+# Database engine profiles - pool sizing, pre-ping, SQLite pragmas and Postgres statement timeouts.
+# A profile is selected per environment with DB_ENGINE_PROFILE (auto-detected from the URI otherwise)
+# and turned into Flask-SQLAlchemy's SQLALCHEMY_ENGINE_OPTIONS plus connect-time hooks.
+
+import os
+from sqlalchemy import event, text
+from sqlalchemy.schema import CreateTable
+
+
+def _env_int(name, default):
+    # Integer override from the environment, falling back to the profile default
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+ENGINE_PROFILES = {
+    # SQLAlchemy defaults, no connect hooks (what the app used before profiles existed)
+    'default': {},
+    # Dev/single host: WAL lets readers run alongside a writer, busy_timeout makes
+    # concurrent gunicorn workers wait for the write lock instead of failing with "database is locked".
+    # The pragma is the only lock wait: it replaces the driver's own timeout on every connection.
+    'sqlite': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'busy_timeout': _env_int('DB_BUSY_TIMEOUT_MS', 5000),
+            'synchronous': 'NORMAL',
+        },
+    },
+    # Production Postgres: bounded pool per worker, recycle before server-side idle timeouts,
+    # pre-ping to survive database restarts, and a timeout bounding each statement on every connection
+    'postgres': {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        'pool_pre_ping': True,
+        'statement_timeout_ms': _env_int('DB_STATEMENT_TIMEOUT_MS', 15000),
+    },
+}
+
+
+def resolve_profile(name, uri):
+    # Explicit profile name wins; otherwise pick one from the database URI scheme
+    if name:
+        if name not in ENGINE_PROFILES:
+            raise ValueError(f"Unknown DB_ENGINE_PROFILE '{name}'")
+        return name
+    if uri.startswith('sqlite'):
+        return 'sqlite'
+    if uri.startswith('postgres'):
+        return 'postgres'
+    return 'default'
+
+
+def engine_options(profile_name):
+    # Translate a profile into keyword arguments for sqlalchemy.create_engine
+    profile = ENGINE_PROFILES[profile_name]
+    options = {key: value for key, value in profile.items() if key not in ('pragmas', 'statement_timeout_ms')}
+    options['connect_args'] = dict(profile.get('connect_args', {}))
+    if profile.get('statement_timeout_ms'):
+        # libpq startup option: bounds every single statement on the connection (not a whole request)
+        options['connect_args']['options'] = f"-c statement_timeout={profile['statement_timeout_ms']}"
+    if not options['connect_args']:
+        del options['connect_args']
+    return options
+
+
+def install_engine_hooks(engine, profile_name):
+    # Register connect-time hooks for the profile (SQLite pragmas run on every new DB-API connection).
+    # foreign_keys is always enabled on SQLite: ON DELETE CASCADE is what deletes a deck's cards.
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = {'foreign_keys': 'ON', **ENGINE_PROFILES[profile_name].get('pragmas', {})}
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+
+def _wanted_cascades(table):
+    # {(local column, referred table): ondelete} for the table's model-declared foreign keys
+    return {
+        (fk.parent.name, fk.column.table.name): (fk.ondelete or '').upper()
+        for fk in table.foreign_keys
+    }
+
+
+def upgrade_foreign_keys(engine, metadata):
+    # Bring ON DELETE rules of existing tables in line with the models (create_all never alters tables).
+    # Postgres: drop and re-add the affected constraints. SQLite cannot alter constraints, so affected
+    # tables are rebuilt with the documented create-copy-drop-rename procedure.
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        _upgrade_foreign_keys_postgres(engine, metadata)
+    elif dialect == 'sqlite':
+        _upgrade_foreign_keys_sqlite(engine, metadata)
+
+
+def _upgrade_foreign_keys_postgres(engine, metadata):
+    with engine.connect() as conn:
+        for table in metadata.sorted_tables:
+            for fk in table.foreign_keys:
+                if (fk.ondelete or '').upper() != 'CASCADE':
+                    continue
+                row = conn.execute(text("""
+                    SELECT con.conname, con.confdeltype FROM pg_constraint con
+                    JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+                    WHERE con.contype = 'f' AND con.conrelid = CAST(:table AS regclass) AND att.attname = :column
+                """), {'table': table.name, 'column': fk.parent.name}).first()
+                if row is None or row.confdeltype == 'c':
+                    continue
+                conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{row.conname}"'))
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD CONSTRAINT "{row.conname}" FOREIGN KEY ({fk.parent.name}) '
+                    f'REFERENCES {fk.column.table.name} ({fk.column.name}) ON DELETE CASCADE'
+                ))
+        conn.commit()
+
+
+def _upgrade_foreign_keys_sqlite(engine, metadata):
+    with engine.connect() as conn:
+        stale = []
+        for table in metadata.sorted_tables:
+            existing = conn.execute(text(f"PRAGMA foreign_key_list({table.name})")).all()
+            actual = {(row[3], row[2]): (row[6] or '').upper() for row in existing}
+            wanted = _wanted_cascades(table)
+            if any(rule == 'CASCADE' and actual.get(key, 'CASCADE') != 'CASCADE' for key, rule in wanted.items()):
+                stale.append(table)
+        if not stale:
+            return
+
+        # foreign_keys must be switched off outside a transaction, before the copy starts
+        conn.commit()
+        conn.execute(text("PRAGMA foreign_keys=OFF"))
+        for table in stale:
+            new_name = f'{table.name}__new'
+            old_columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table.name})"))}
+            columns = ', '.join(c.name for c in table.columns if c.name in old_columns)
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+            conn.execute(text(ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {new_name} ', 1)))
+            conn.execute(text(f"INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {new_name} RENAME TO {table.name}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+            print(f"Rebuilt {table.name} with ON DELETE CASCADE foreign keys")
+        conn.commit()
+        conn.execute(text("PRAGMA foreign_keys=ON"))
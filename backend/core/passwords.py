@@ -0,0 +1,117 @@
+# Password hashing off the request threads.
+# scrypt/pbkdf2 are deliberately CPU-heavy; a login burst hashed inside the web workers starves every
+# other request. Hashes are computed in a small per-process pool (PASSWORD_HASH_WORKERS processes,
+# running at lower CPU priority) and at most PASSWORD_HASH_MAX_PENDING hashes per web worker may be
+# queued or running - beyond that callers wait up to PASSWORD_HASH_QUEUE_TIMEOUT and then get
+# PasswordHasherBusy (503) instead of piling up. PASSWORD_HASH_WORKERS=0 hashes inline.
+# The settings are read from the current app's config on every call; a pool built with other
+# settings is replaced.
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+_slots = None
+_slots_key = None
+_canonical_methods = {}
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def _lower_priority(increment):
+    # Pool processes yield the CPU to the web workers
+    try:
+        os.nice(increment)
+    except (AttributeError, OSError):
+        pass
+
+
+def _get_pool():
+    # One pool per process, created on first use (never inherited across a fork) and rebuilt when
+    # the app's PASSWORD_HASH_WORKERS / PASSWORD_HASH_NICE / PASSWORD_HASH_MAX_PENDING change
+    global _pool, _pool_key, _slots, _slots_key
+    config = current_app.config
+    pid = os.getpid()
+    pool_key = (pid, config.get('PASSWORD_HASH_WORKERS', 1), config.get('PASSWORD_HASH_NICE', 5))
+    slots_key = (pid, config.get('PASSWORD_HASH_MAX_PENDING', 4))
+    stale = None
+    with _pool_lock:
+        if _slots_key != slots_key:
+            _slots = threading.BoundedSemaphore(slots_key[1])
+            _slots_key = slots_key
+        if _pool_key != pool_key:
+            # A pool inherited across a fork is unusable here and must not be shut down
+            stale = _pool if _pool_key and _pool_key[0] == pid else None
+            _pool = None
+            _pool_key = pool_key
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _pool = ProcessPoolExecutor(max_workers=pool_key[1], mp_context=context,
+                                        initializer=_lower_priority, initargs=(pool_key[2],))
+        pool, slots = _pool, _slots
+    if stale is not None:
+        stale.shutdown(wait=False)
+    return pool, slots
+
+
+def _discard_pool(broken):
+    # Forget a pool whose process died; the next _get_pool builds a fresh one (slots are kept)
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    if current_app.config.get('PASSWORD_HASH_WORKERS', 1) <= 0:
+        return fn(*args)
+    pool, slots = _get_pool()
+    if not slots.acquire(timeout=current_app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5)):
+        raise PasswordHasherBusy()
+    try:
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A pool process was killed (OOM killer, crash) - replace the pool and retry once
+            _discard_pool(pool)
+            pool, _ = _get_pool()
+            return pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def canonical_method(method):
+    # Full parameter string werkzeug stores for a method, e.g. 'scrypt' -> 'scrypt:32768:8:1';
+    # found by hashing an empty password once per process, in the pool like any other hash
+    if method not in _canonical_methods:
+        _canonical_methods[method] = _run(generate_password_hash, '', method, 1).split('$', 1)[0]
+    return _canonical_methods[method]
+
+
+def _method():
+    return current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _method())
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    # True when the stored hash was made with other parameters than PASSWORD_HASH_METHOD
+    # (stronger or weaker - the configured method always wins)
+    return password_hash.split('$', 1)[0] != canonical_method(_method())
@@ -0,0 +1,110 @@
+# Read-replica routing - read-only endpoints send their SELECTs to SQLALCHEMY_REPLICA_URI when configured.
+# Writes (flushes, UPDATE/DELETE statements) always use the primary. After a write, the same client
+# stays on the primary for REPLICA_READ_AFTER_WRITE_SECONDS (read-your-writes), tracked both by a
+# short-lived cookie (works across gunicorn workers) and an in-process per-user map.
+
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+
+READ_AFTER_WRITE_COOKIE = 'rw_until'
+
+# user_id -> unix time until which that user's reads must go to the primary
+_recent_writers = {}
+# unix time of the last sweep of expired _recent_writers entries
+_last_sweep = [0.0]
+
+
+def current_user_id():
+    # JWT identity if the request was authenticated, otherwise None (public endpoints)
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        identity = get_jwt_identity()
+        return int(identity) if identity is not None else None
+    except Exception:
+        return None
+
+
+def get_replica_engine(app):
+    # Lazily create (and cache per URI) the replica engine with the same engine profile as the primary
+    uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if not uri:
+        return None
+    engines = app.extensions.setdefault('replica_engines', {})
+    if uri not in engines:
+        from core.database import engine_options, install_engine_hooks, resolve_profile
+        profile = resolve_profile(app.config.get('DB_REPLICA_ENGINE_PROFILE'), uri)
+        engine = create_engine(uri, **engine_options(profile))
+        install_engine_hooks(engine, profile)
+        engines[uri] = engine
+    return engines[uri]
+
+
+def read_after_write_window_active(user_id=None):
+    # True while the client (by cookie) or the user (by id) has written recently
+    now = time.time()
+    try:
+        if float(request.cookies.get(READ_AFTER_WRITE_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    return user_id is not None and _recent_writers.get(user_id, 0) > now
+
+
+def read_only(fn):
+    # Mark an endpoint as read-only so its queries may be served by the replica.
+    # Apply below @jwt_required() so the user identity is available for the read-your-writes check.
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if current_app.config.get('SQLALCHEMY_REPLICA_URI'):
+            g.use_replica = not read_after_write_window_active(current_user_id())
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def remember_writer(user_id, until, window):
+    # Expired entries are swept at most once per window, so the map only holds recent writers
+    now = time.time()
+    if now - _last_sweep[0] >= window:
+        _last_sweep[0] = now
+        for writer, writer_until in list(_recent_writers.items()):
+            if writer_until <= now:
+                _recent_writers.pop(writer, None)
+    _recent_writers[user_id] = until
+
+
+def init_read_routing(app):
+    # Every request starts on the primary; only @read_only endpoints opt in to the replica
+    @app.before_request
+    def reset_routing():
+        g.use_replica = False
+
+    # Remember successful writes so follow-up reads from the same client hit the primary
+    @app.after_request
+    def remember_write(response):
+        if (app.config.get('SQLALCHEMY_REPLICA_URI')
+                and request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and response.status_code < 400):
+            window = app.config.get('REPLICA_READ_AFTER_WRITE_SECONDS', 5)
+            until = time.time() + window
+            user_id = current_user_id()
+            if user_id is not None:
+                remember_writer(user_id, until, window)
+            response.set_cookie(READ_AFTER_WRITE_COOKIE, str(until), max_age=window, httponly=True, samesite='Lax')
+        return response
+
+
+class RoutingSession(Session):
+    # Flask-SQLAlchemy session that sends plain SELECTs to the replica during read-only requests
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None
+                and not self._flushing
+                and has_app_context()
+                and g.get('use_replica')
+                and getattr(clause, 'is_select', False)):
+            replica = get_replica_engine(current_app)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
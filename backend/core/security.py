@@ -1,10 +1,56 @@
 # Decorators for Access Control (RBAC)
-# Applying @admin_required to a route automatically verifies the user's role before execution
+# Applying @admin_required to a route automatically verifies the user's role before execution.
+# The role travels in the access token as a claim together with the user's token_version;
+# instead of loading the user, the decorator compares that version with a short-lived
+# in-process cache, so bumping User.token_version (e.g. on a role change) revokes old tokens.
 
+import threading
+import time
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User
+from flask import current_app, jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, create_access_token
+from models import db, User
+
+ROLE_CLAIM = 'role'
+TOKEN_VERSION_CLAIM = 'ver'
+
+# user_id -> (token_version, cached_at); None version means the user no longer exists
+_token_versions = {}
+_token_versions_lock = threading.Lock()
+
+
+def issue_access_token(user):
+    # Access token carrying the role and token version, so authorization needs no user lookup
+    return create_access_token(
+        identity=str(user.id),
+        additional_claims={ROLE_CLAIM: user.role, TOKEN_VERSION_CLAIM: user.token_version or 0}
+    )
+
+
+def get_token_version(user_id):
+    # Current token version of the user, served from the cache for TOKEN_VERSION_CACHE_TTL seconds.
+    # Other workers pick up a bump once their cached entry expires.
+    ttl = current_app.config.get('TOKEN_VERSION_CACHE_TTL', 30)
+    now = time.monotonic()
+    cached = _token_versions.get(user_id)
+    if cached and now - cached[1] < ttl:
+        return cached[0]
+
+    version = db.session.query(User.token_version).filter(User.id == user_id).scalar()
+    with _token_versions_lock:
+        _token_versions[user_id] = (version, now)
+    return version
+
+
+def invalidate_token_version(user_id):
+    # Drop the cached version after a bump so this worker sees it immediately
+    with _token_versions_lock:
+        _token_versions.pop(user_id, None)
+
+
+def clear_token_version_cache():
+    with _token_versions_lock:
+        _token_versions.clear()
 
 
 def role_required(required_role):
@@ -15,12 +61,26 @@ def role_required(required_role):
         def wrapper(*args, **kwargs):
             # Extract the user ID from the JWT token identity
             current_user_id = int(get_jwt_identity())
-            user = User.query.get(current_user_id)
-            if not user:
-                return jsonify({'error': 'User not found'}), 404
+            claims = get_jwt()
+            role = claims.get(ROLE_CLAIM)
+            token_version = claims.get(TOKEN_VERSION_CLAIM)
+
+            if role is None or token_version is None:
+                # Token issued before role claims existed - fall back to reading the role from the DB
+                user = db.session.get(User, current_user_id)
+                if not user:
+                    return jsonify({'error': 'User not found'}), 404
+                role = user.role
+            else:
+                current_version = get_token_version(current_user_id)
+                if current_version is None:
+                    return jsonify({'error': 'User not found'}), 404
+                if current_version != token_version:
+                    # Role changed (or tokens were revoked) after this token was issued
+                    return jsonify({'error': 'Token has been revoked'}), 401
 
             # Admin bypasses all checks; regular user is authorized only if they have the required role
-            if user.role != required_role and user.role != 'admin':
+            if role != required_role and role != 'admin':
                 return jsonify({'error': 'Insufficient permissions'}), 403
 
             return fn(*args, **kwargs)
@@ -0,0 +1,32 @@
+# Background tasks - a small per-process thread pool for work that must outlive the request
+# (e.g. deck imports). Tasks run inside their own app context, so they get a fresh
+# db.session; progress is reported through the database, not through the returned future.
+# With BACKGROUND_TASKS_INLINE the task runs synchronously (tests, one-off scripts).
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+_executor = None
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('BACKGROUND_WORKERS', 2),
+            thread_name_prefix='background'
+        )
+    return _executor
+
+
+def run_in_background(fn, *args, **kwargs):
+    app = current_app._get_current_object()
+
+    def task():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    if app.config.get('BACKGROUND_TASKS_INLINE'):
+        task()
+        return None
+    return _get_executor(app).submit(task)
@@ -0,0 +1,91 @@
+# Write-behind buffer for per-card study counters (CARD_COUNTER_WRITE_BEHIND).
+# Sessions add their {card_id: delta} maps here instead of updating the card rows in the request
+# transaction; a daemon thread merges everything that arrived during the interval and hands it to
+# the flush function, which applies it as one set-based UPDATE ... SET x = x + delta. Popular
+# cards are then locked once per interval per worker instead of once per session.
+# Loss window: a worker that dies without a clean exit loses at most one interval of deltas;
+# a normal shutdown (SIGTERM -> interpreter exit) flushes through atexit.
+
+import atexit
+import threading
+
+
+class CounterBuffer:
+    def __init__(self, flush_fn, interval=2.0, max_pending=5000):
+        # flush_fn(studied, correct, studied_at) runs inside the app context the deltas came from and
+        # must commit; studied_at maps each card to the time it was last studied
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending  # cards pending before the flusher is woken early
+        self._pending = {}  # app -> (studied, correct, studied_at) - apps may use different databases
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def configure(self, interval, max_pending):
+        # Apply new settings (e.g. from the app config); a running flusher picks them up on its next wait
+        self.interval = interval
+        self.max_pending = max_pending
+
+    def add(self, app, studied, correct, studied_at):
+        # Merge the deltas of one session of `app`; starts the flusher in this process on first use
+        with self._lock:
+            self._merge(app, studied, correct, {card_id: studied_at for card_id in studied})
+            pending = sum(len(deltas[0]) for deltas in self._pending.values())
+            if self._thread is None:
+                self._start()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return sum(len(deltas[0]) for deltas in self._pending.values())
+
+    def flush(self):
+        # Apply everything buffered so far, app by app; failed deltas are merged back for the next attempt
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            flushed = 0
+            for app, (studied, correct, studied_at) in pending.items():
+                try:
+                    with app.app_context():
+                        self.flush_fn(studied, correct, studied_at)
+                    flushed += len(studied)
+                except Exception as e:
+                    print(f"Card counter flush failed, will retry: {e}")
+                    with self._lock:
+                        self._merge(app, studied, correct, studied_at)
+            return flushed
+
+    def stop(self):
+        # Final flush on shutdown
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+    def _merge(self, app, studied, correct, studied_at):
+        # Caller holds self._lock
+        pending_studied, pending_correct, pending_at = self._pending.setdefault(app, ({}, {}, {}))
+        for card_id, delta in studied.items():
+            pending_studied[card_id] = pending_studied.get(card_id, 0) + delta
+        for card_id, delta in correct.items():
+            pending_correct[card_id] = pending_correct.get(card_id, 0) + delta
+        for card_id, at in studied_at.items():
+            if card_id not in pending_at or at > pending_at[card_id]:
+                pending_at[card_id] = at
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='card-counter-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
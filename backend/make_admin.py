@@ -8,6 +8,8 @@ def promote_user(username):
         if user:
             # Change role to admin
             user.role = 'admin'
+            # Old access tokens still carry the 'user' role claim - make the user log in again
+            user.token_version = (user.token_version or 0) + 1
             db.session.commit()
             print(f"Успешно! Пользователь '{username}' теперь администратор.")
         else:
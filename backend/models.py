@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
+from core.routing import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession sends SELECTs of read-only requests to the replica when one is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -13,19 +15,25 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     role = db.Column(db.String(20), nullable=False, default='user')
+    # Bumped to invalidate issued access tokens (role claims) - see core.security
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Last sequence number handed out to this user's change log (see ChangeLogRepository)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
-    # Relationships with CASCADE DELETE
-    decks = db.relationship('Deck', backref='user', lazy=True, cascade='all, delete-orphan')
-    stats = db.relationship('UserStats', backref='user', uselist=False, cascade='all, delete-orphan')
-    sessions = db.relationship('StudySession', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Relationships with CASCADE DELETE - performed by the database (ON DELETE CASCADE),
+    # passive_deletes stops the ORM from loading children just to delete them row by row
+    decks = db.relationship('Deck', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    stats = db.relationship('UserStats', backref='user', uselist=False, cascade='all, delete-orphan', passive_deletes=True)
+    sessions = db.relationship('StudySession', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
-        from werkzeug.security import generate_password_hash
-        self.password_hash = generate_password_hash(password)
+        # Hashed in the password pool with PASSWORD_HASH_METHOD (see core.passwords)
+        from core.passwords import hash_password
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        from werkzeug.security import check_password_hash
-        return check_password_hash(self.password_hash, password)
+        from core.passwords import verify_password
+        return verify_password(self.password_hash, password)
     
     def to_dict(self):
         return {
@@ -39,10 +47,16 @@ class User(db.Model):
 
 class RefreshToken(db.Model):
     __tablename__ = 'refresh_tokens'
+    __table_args__ = (
+        # Per-user active token cap (oldest first)
+        db.Index('ix_refresh_tokens_user_active', 'user_id', 'revoked', 'created_at'),
+        # Batched pruning of expired tokens
+        db.Index('ix_refresh_tokens_expires_at', 'expires_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(255), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     expires_at = db.Column(db.DateTime, nullable=False)
     revoked = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -50,19 +64,29 @@ class RefreshToken(db.Model):
 
 class Deck(db.Model):
     __tablename__ = 'decks'
+    # Composite indexes backing keyset pagination (user filter + sort key + id tiebreaker)
+    __table_args__ = (
+        db.Index('ix_decks_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_decks_user_title', 'user_id', 'title', 'id'),
+        db.Index('ix_decks_user_card_count', 'user_id', 'card_count', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_studied = db.Column(db.DateTime)
     emoji = db.Column(db.String(10))
+    # Bumped on every change to the deck or its cards; validates cached deck payloads
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Number of cards, kept up to date by triggers on the cards table (DeckRepository.ensure_card_counts)
+    card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationship with cards
-    cards = db.relationship('Card', backref='deck', lazy=True, cascade='all, delete-orphan')
+    cards = db.relationship('Card', backref='deck', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     # Relationship with attached files
-    files = db.relationship('DeckFile', backref='deck', lazy=True, cascade='all, delete-orphan')
+    files = db.relationship('DeckFile', backref='deck', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def to_dict(self, include_cards=False):
         result = {
@@ -87,7 +111,7 @@ class Card(db.Model):
     question = db.Column(db.Text, nullable=False)
     answer = db.Column(db.Text, nullable=False)
     source = db.Column(db.String(200))
-    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id'), nullable=False)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id', ondelete='CASCADE'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Card learning statistics
@@ -108,11 +132,30 @@ class Card(db.Model):
         }
 
 
+class CardSchedule(db.Model):
+    # Spaced-repetition state (SM-2) of a card for a user; cards without a row are new
+    __tablename__ = 'card_schedules'
+    __table_args__ = (
+        db.Index('ix_card_schedules_user_due', 'user_id', 'next_due'),
+        db.Index('ix_card_schedules_user_deck_due', 'user_id', 'deck_id', 'next_due'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    card_id = db.Column(db.Integer, db.ForeignKey('cards.id', ondelete='CASCADE'), primary_key=True)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id', ondelete='CASCADE'), nullable=False)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)  # successful reviews in a row
+    interval_days = db.Column(db.Integer, nullable=False, default=0)
+    ease = db.Column(db.Float, nullable=False, default=2.5)
+    lapses = db.Column(db.Integer, nullable=False, default=0)
+    next_due = db.Column(db.DateTime, nullable=False)
+    last_reviewed = db.Column(db.DateTime)
+
+
 class DeckFile(db.Model):
     __tablename__ = 'deck_files'
 
     id = db.Column(db.Integer, primary_key=True)
-    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id'), nullable=False)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id', ondelete='CASCADE'), nullable=False, index=True)
     object_name = db.Column(db.String(500), nullable=False)  # Object key in MinIO
     original_name = db.Column(db.String(500), nullable=False)  # Original file name
     size_bytes = db.Column(db.Integer, nullable=False)
@@ -130,12 +173,43 @@ class DeckFile(db.Model):
         }
 
 
+class ImportJob(db.Model):
+    # Background CSV/TSV/.apkg import; progress is committed per batch so any worker can report it
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id', ondelete='SET NULL'))
+    filename = db.Column(db.String(500), nullable=False)
+    source_format = db.Column(db.String(10), nullable=False)  # 'csv', 'tsv' or 'apkg'
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/running/done/failed
+    cards_imported = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0-100
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'deck_id': self.deck_id,
+            'filename': self.filename,
+            'format': self.source_format,
+            'status': self.status,
+            'cards_imported': self.cards_imported,
+            'progress': round(self.progress, 1),
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
 class StudySession(db.Model):
     __tablename__ = 'study_sessions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id', ondelete='CASCADE'), nullable=False, index=True)
     date = db.Column(db.Date, default=datetime.utcnow)
     cards_studied = db.Column(db.Integer, default=0)
     cards_correct = db.Column(db.Integer, default=0)
@@ -153,16 +227,31 @@ class StudySession(db.Model):
         }
 
 
+class UserDailyStats(db.Model):
+    # Per-user, per-day, per-deck study rollup, updated in the same transaction as each session insert.
+    # deck_id has no foreign key on purpose: history survives deck deletion.
+    __tablename__ = 'user_daily_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    deck_id = db.Column(db.Integer, primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    cards_studied = db.Column(db.Integer, nullable=False, default=0)
+    cards_correct = db.Column(db.Integer, nullable=False, default=0)
+    duration_seconds = db.Column(db.Integer, nullable=False, default=0)
+
+
 class UserStats(db.Model):
     __tablename__ = 'user_stats'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True)
     total_decks_created = db.Column(db.Integer, default=0)  # Включая удаленные
     unique_cards_studied = db.Column(db.Text, default='[]')  # JSON список ID изученных карточек
     max_correct_streak = db.Column(db.Integer, default=0)   # Максимальная серия
     current_streak = db.Column(db.Integer, default=0)       # Текущая серия
     current_streak_cards = db.Column(db.Text, default='[]') # JSON список карточек в текущей серии
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ETag для GET /api/stats
     
     # Relationship is now defined on User side with cascade
     
@@ -227,6 +316,36 @@ class UserStats(db.Model):
         except ValueError:
             return False
     
+    def apply_card_results(self, results):
+        """Apply (card_id, correct) answers in order, writing the JSON columns only once.
+
+        Returns the longest streak reached during these answers (for weekly leaderboards).
+        """
+        unique_cards = set(self.get_unique_cards_studied())
+        streak_cards = self.get_current_streak_cards()
+        streak_set = set(streak_cards)
+        max_streak = self.max_correct_streak or 0
+        peak_streak = len(streak_cards)
+
+        for card_id, correct in results:
+            if correct:
+                unique_cards.add(card_id)
+                if card_id not in streak_set:
+                    streak_set.add(card_id)
+                    streak_cards.append(card_id)
+                    max_streak = max(max_streak, len(streak_cards))
+                    peak_streak = max(peak_streak, len(streak_cards))
+            else:
+                # Reset streak on incorrect answer
+                streak_cards = []
+                streak_set = set()
+
+        self.set_unique_cards_studied(unique_cards)
+        self.set_current_streak_cards(streak_cards)
+        self.current_streak = len(streak_cards)
+        self.max_correct_streak = max_streak
+        return peak_streak
+
     def reset_stats(self):
         """Fully reset all user statistics."""
         self.total_decks_created = 0
@@ -240,4 +359,74 @@ class UserStats(db.Model):
             'cards_studied': len(self.get_unique_cards_studied()),
             'max_streak': self.max_correct_streak,
             'current_streak': self.current_streak
-        }
\ No newline at end of file
+        }
+
+
+class LeaderboardEntry(db.Model):
+    # A user's score on a leaderboard ('streak' or 'cards') for a period ('all' or an ISO week
+    # like '2026-W42'); maintained on session writes, top-N is an index range scan
+    __tablename__ = 'leaderboard_entries'
+    __table_args__ = (
+        db.Index('ix_leaderboard_entries_rank', 'board', 'period', 'score', 'user_id'),
+    )
+
+    board = db.Column(db.String(20), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class LeaderboardScore(db.Model):
+    # Number of users per score on a leaderboard: a rank is 1 + the users summed over the
+    # higher scores, so its cost depends on the number of distinct scores, not of users
+    __tablename__ = 'leaderboard_scores'
+
+    board = db.Column(db.String(20), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)
+    score = db.Column(db.Integer, primary_key=True)
+    users = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ChangeLogEntry(db.Model):
+    # Delta sync log: the latest change of each of a user's decks, cards, files and stats,
+    # ordered by a per-user sequence; older entries of the same entity are replaced
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_entity', 'user_id', 'entity', 'entity_id'),
+        db.Index('ix_change_log_deck', 'user_id', 'deck_id'),
+        db.Index('ix_change_log_created_at', 'created_at'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(10), nullable=False)  # 'deck', 'card', 'file' or 'stats'
+    entity_id = db.Column(db.Integer, nullable=False)
+    deck_id = db.Column(db.Integer)  # parent deck (no FK - tombstones outlive the deck)
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class DailyMetric(db.Model):
+    # Admin dashboard rollup: one counter per (day, metric), incremented as data is written
+    __tablename__ = 'daily_metrics'
+
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)  # e.g. 'active_users', 'cards_studied'
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class MetricTotal(db.Model):
+    # Admin dashboard rollup: running all-time counters (e.g. 'storage_bytes')
+    __tablename__ = 'metric_totals'
+
+    metric = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class DailyActiveUser(db.Model):
+    # De-duplication set for the 'active_users' counter; old days are pruned by the compaction job
+    __tablename__ = 'daily_active_users'
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
@@ -1,13 +1,211 @@
 # Repository for Cards - handles basic database operations
 
-from models import db, Card
+from models import db, Card, Deck
+from sqlalchemy import update, delete, case, cast, func, insert, select, Float
+from datetime import datetime
+import csv
+import io
+from repositories.deck_repository import encode_cursor, decode_cursor, check_cursor_value
+
+
+def card_columns():
+    # Columns of Card.to_dict() with accuracy computed by the database
+    # (same operation order as the Python version, so the floats are identical)
+    times_studied = func.coalesce(Card.times_studied, 0)
+    times_correct = func.coalesce(Card.times_correct, 0)
+    accuracy = case(
+        (times_studied > 0, cast(times_correct, Float) / times_studied * 100),
+        else_=0
+    )
+    return (Card.id, Card.question, Card.answer, Card.source, Card.deck_id,
+            times_studied.label('times_studied'), times_correct.label('times_correct'),
+            accuracy.label('accuracy'))
+
+
+CARD_KEYS = ('id', 'question', 'answer', 'source', 'deck_id', 'times_studied', 'times_correct', 'accuracy')
 
 
 class CardRepository:
+    # Receives the card full-text search repository via constructor injection
+    def __init__(self, search_repo):
+        self.search_repo = search_repo
+
     def get_by_id(self, card_id):
         # Retrieve a card by its ID
         return Card.query.get(card_id)
 
+    def get_owned_ids(self, card_ids, deck_id, user_id):
+        # Return the subset of card_ids that belong to deck_id owned by user_id - one IN query
+        if not card_ids:
+            return set()
+        rows = (db.session.query(Card.id)
+                .join(Deck, Deck.id == Card.deck_id)
+                .filter(Card.id.in_(card_ids), Card.deck_id == deck_id, Deck.user_id == user_id)
+                .all())
+        return {row[0] for row in rows}
+
+    def get_ids_in_deck(self, deck_id, card_ids):
+        # Subset of card_ids that belong to deck_id - one IN query
+        if not card_ids:
+            return set()
+        rows = db.session.query(Card.id).filter(Card.deck_id == deck_id, Card.id.in_(card_ids)).all()
+        return {row[0] for row in rows}
+
+    def get_rows_by_ids(self, card_ids):
+        # {id: Card.to_dict()-shaped dict} for the given cards (see card_columns)
+        if not card_ids:
+            return {}
+        rows = db.session.query(*card_columns()).filter(Card.id.in_(card_ids)).all()
+        return {row[0]: dict(zip(CARD_KEYS, row)) for row in rows}
+
+    def create_many(self, deck_id, cards):
+        # INSERT ... RETURNING id for a list of {question, answer, source} dicts (one batched statement);
+        # ids are returned in input order
+        if not cards:
+            return []
+        now = datetime.utcnow()
+        result = db.session.execute(
+            insert(Card).returning(Card.id, sort_by_parameter_order=True),
+            [{**card, 'deck_id': deck_id, 'created_at': now, 'times_studied': 0, 'times_correct': 0} for card in cards]
+        )
+        return [row[0] for row in result]
+
+    def update_many(self, deck_id, changes):
+        # Apply {card_id: {field: value}} as one UPDATE with a CASE per field;
+        # cards not mentioned for a field keep their current value
+        if not changes:
+            return
+        values = {}
+        for field in ('question', 'answer', 'source'):
+            per_card = {card_id: data[field] for card_id, data in changes.items() if field in data}
+            if per_card:
+                column = getattr(Card, field)
+                values[field] = case(per_card, value=Card.id, else_=column)
+        if not values:
+            return
+        db.session.execute(
+            update(Card)
+            .where(Card.deck_id == deck_id, Card.id.in_(list(changes)))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    def delete_many(self, deck_id, card_ids):
+        # One DELETE for all given cards of the deck
+        if not card_ids:
+            return
+        db.session.execute(
+            delete(Card)
+            .where(Card.deck_id == deck_id, Card.id.in_(list(card_ids)))
+            .execution_options(synchronize_session=False)
+        )
+
+    def increment_study_counters(self, studied, correct, studied_at):
+        # Apply per-card deltas ({card_id: delta}) as a single SQL-side UPDATE
+        # times_studied = times_studied + delta is evaluated by the DB, so concurrent sessions don't lose increments.
+        # studied_at is one timestamp for all cards or a {card_id: timestamp} map (write-behind flushes)
+        if not studied:
+            return
+        correct_delta = case(correct, value=Card.id, else_=0) if correct else 0
+        if isinstance(studied_at, dict):
+            studied_at = case(studied_at, value=Card.id, else_=Card.last_studied)
+        db.session.execute(
+            update(Card)
+            .where(Card.id.in_(list(studied)))
+            .values(
+                times_studied=Card.times_studied + case(studied, value=Card.id, else_=0),
+                times_correct=Card.times_correct + correct_delta,
+                last_studied=studied_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def get_owners(self, card_ids):
+        # (card_id, deck_id, owner user_id) rows for the given cards
+        if not card_ids:
+            return []
+        return (db.session.query(Card.id, Card.deck_id, Deck.user_id)
+                .join(Deck, Deck.id == Card.deck_id)
+                .filter(Card.id.in_(card_ids))
+                .all())
+
+    def search(self, user_id, term, limit=20, cursor=None):
+        # Full-text search over question/answer/source across all decks owned by user_id.
+        # Ordered by relevance with id as tiebreaker; returns ([(card, deck_title, score)], next_cursor)
+        match = self.search_repo.match_subquery(term)
+        query = (db.session.query(Card, Deck.title, match.c.score)
+                 .join(match, Card.id == match.c.card_id)
+                 .join(Deck, Deck.id == Card.deck_id)
+                 .filter(Deck.user_id == user_id))
+        if cursor:
+            last_score, last_id = decode_cursor(cursor)
+            check_cursor_value(last_score, (int, float))
+            query = query.filter(db.tuple_(match.c.score, Card.id) < (last_score, last_id))
+
+        rows = query.order_by(match.c.score.desc(), Card.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_card, _, last_score = rows[-1]
+            next_cursor = encode_cursor([last_score, last_card.id])
+        return rows, next_cursor
+
+    def get_deck_card_rows(self, deck_id, keys=CARD_KEYS, limit=None, after_id=None):
+        # Card.to_dict() fields (only `keys`, in that order) of the deck's cards as plain tuples,
+        # ordered by id; limit/after_id page through them by keyset
+        columns = dict(zip(CARD_KEYS, card_columns()))
+        query = (db.session.query(*[columns[key] for key in keys])
+                 .filter(Card.deck_id == deck_id)
+                 .order_by(Card.id))
+        if after_id is not None:
+            query = query.filter(Card.id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    def iter_deck_card_batches(self, deck_id, batch_size=500):
+        # Lists of (id, question, answer) rows for export, fetched batch_size rows at a time
+        # (yield_per) so the whole deck is never held in memory
+        statement = (select(Card.id, Card.question, Card.answer)
+                     .where(Card.deck_id == deck_id)
+                     .order_by(Card.id)
+                     .execution_options(yield_per=batch_size))
+        for batch in db.session.execute(statement).partitions():
+            yield batch
+
+    def get_deck_ids_after(self, deck_id, after_id):
+        # Ids of the deck's cards above after_id, ascending (cards inserted without RETURNING)
+        return [card_id for (card_id,) in db.session.query(Card.id)
+                .filter(Card.deck_id == deck_id, Card.id > after_id)
+                .order_by(Card.id)
+                .all()]
+
+    def bulk_insert(self, deck_id, cards):
+        # Insert (question, answer, source) tuples in one statement: COPY on PostgreSQL,
+        # a single executemany INSERT elsewhere. Runs in the session's transaction.
+        if not cards:
+            return
+        now = datetime.utcnow()
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for question, answer, source in cards:
+                writer.writerow((question, answer, source, deck_id, now.isoformat(), 0, 0))
+            buffer.seek(0)
+            with connection.connection.cursor() as cursor:
+                cursor.copy_expert(
+                    'COPY cards (question, answer, source, deck_id, created_at, times_studied, times_correct) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+        else:
+            connection.execute(insert(Card), [
+                {'question': question, 'answer': answer, 'source': source, 'deck_id': deck_id,
+                 'created_at': now, 'times_studied': 0, 'times_correct': 0}
+                for question, answer, source in cards
+            ])
+
     def add(self, card):
         # Add a card to the database session
         db.session.add(card)
@@ -0,0 +1,74 @@
+# Repository for the delta sync change log (GET /api/sync).
+# Sequence numbers come from users.change_seq, bumped with UPDATE ... RETURNING in the writing
+# transaction: the row lock serializes one user's writers, so a reader never sees seq N+1
+# committed before seq N. Each entity keeps only its latest entry (inline compaction), and
+# entries older than the retention window are purged by the compact-changelog command.
+
+from datetime import datetime
+from sqlalchemy import update, delete, insert
+from models import db, User, ChangeLogEntry
+
+ENTITIES = ('deck', 'card', 'file', 'stats')
+
+
+class ChangeLogRepository:
+    def record(self, user_id, changes):
+        # Append (entity, entity_id, op, deck_id) changes for the user; a later change of the same
+        # entity wins. One UPDATE, one DELETE per entity type and one executemany INSERT.
+        latest = {}
+        for entity, entity_id, op, deck_id in changes:
+            latest.pop((entity, entity_id), None)
+            latest[(entity, entity_id)] = (op, deck_id)
+        if not latest:
+            return
+        head = db.session.execute(
+            update(User).where(User.id == user_id)
+            .values(change_seq=User.change_seq + len(latest))
+            .returning(User.change_seq)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if head is None:
+            return  # user deleted concurrently
+
+        by_entity = {}
+        for entity, entity_id in latest:
+            by_entity.setdefault(entity, []).append(entity_id)
+        for entity, ids in by_entity.items():
+            db.session.execute(delete(ChangeLogEntry).where(
+                ChangeLogEntry.user_id == user_id,
+                ChangeLogEntry.entity == entity,
+                ChangeLogEntry.entity_id.in_(ids)
+            ))
+
+        now = datetime.utcnow()
+        first = head - len(latest) + 1
+        db.session.execute(insert(ChangeLogEntry), [
+            {'user_id': user_id, 'seq': first + i, 'entity': entity, 'entity_id': entity_id,
+             'deck_id': deck_id, 'op': op, 'created_at': now}
+            for i, ((entity, entity_id), (op, deck_id)) in enumerate(latest.items())
+        ])
+
+    def forget_deck_children(self, user_id, deck_id):
+        # A deck tombstone implies its cards and files are gone - drop their entries
+        db.session.execute(delete(ChangeLogEntry).where(
+            ChangeLogEntry.user_id == user_id,
+            ChangeLogEntry.deck_id == deck_id,
+            ChangeLogEntry.entity != 'deck'
+        ))
+
+    def get_head(self, user_id):
+        return db.session.query(User.change_seq).filter(User.id == user_id).scalar()
+
+    def get_page(self, user_id, after_seq, limit):
+        # Entries after the cursor in sequence order, limit + 1 rows to detect another page
+        return (db.session.query(ChangeLogEntry.seq, ChangeLogEntry.entity, ChangeLogEntry.entity_id,
+                                 ChangeLogEntry.deck_id, ChangeLogEntry.op)
+                .filter(ChangeLogEntry.user_id == user_id, ChangeLogEntry.seq > after_seq)
+                .order_by(ChangeLogEntry.seq)
+                .limit(limit + 1)
+                .all())
+
+    def purge_before(self, before):
+        # Compaction: drop entries older than the retention window (their cursors get a reset)
+        result = db.session.execute(delete(ChangeLogEntry).where(ChangeLogEntry.created_at < before))
+        return result.rowcount
@@ -1,27 +1,171 @@
 # Repository for Decks - handles retrieval, creation, deletion, sorting, and pagination
 
-from models import db, Deck, Card
-from sqlalchemy import func
-from datetime import datetime
+from models import db, Deck, DeckFile
+from sqlalchemy import func, text
+from datetime import datetime, timedelta
+import base64
+import json
+
+
+def encode_cursor(values):
+    # Pack the keyset position (sort value + id) into an opaque URL-safe token
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length=2):
+    # Reverse of encode_cursor; raises ValueError on a malformed or tampered token.
+    # The last of the `length` values is always the integer id tiebreaker.
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if (not isinstance(values, list) or len(values) != length
+            or not isinstance(values[-1], int) or isinstance(values[-1], bool)):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def check_cursor_value(value, types):
+    # Raise ValueError unless a decoded sort value has one of the JSON types the sort key produces
+    # (bool is an int subclass in Python, so it is rejected explicitly)
+    if isinstance(value, bool) or not isinstance(value, types):
+        raise ValueError('Invalid cursor')
+    return value
+
+
+def deck_summary_columns():
+    # Columns of Deck.to_dict() selected directly; the card count is the trigger-maintained
+    # decks.card_count instead of loading deck.cards for every deck in the page
+    return (Deck.id, Deck.title, Deck.description, Deck.emoji, Deck.user_id,
+            Deck.created_at, Deck.last_studied, Deck.card_count)
+
+
+def deck_row_to_dict(row):
+    # Same shape as Deck.to_dict() for a row selected with deck_summary_columns()
+    return {
+        'id': row.id,
+        'title': row.title,
+        'description': row.description,
+        'emoji': row.emoji,
+        'user_id': row.user_id,
+        'created_at': row.created_at.isoformat(),
+        'last_studied': row.last_studied.isoformat() if row.last_studied else None,
+        'card_count': row.card_count
+    }
 
 
 class DeckRepository:
+    # Receives the full-text search repository via constructor injection
+    def __init__(self, search_repo):
+        self.search_repo = search_repo
+
     def get_by_id(self, deck_id):
         # Retrieve a deck by its ID
         return Deck.query.get(deck_id)
 
-    def get_user_decks(self, user_id, sort_by='newest', page=1, per_page=10,
-                       search=None, min_cards=None, max_cards=None,
-                       date_from=None, date_to=None):
+    def get_summary(self, deck_id):
+        # Deck.to_dict() columns of a single deck as a plain row, or None
+        return db.session.query(*deck_summary_columns()).filter(Deck.id == deck_id).first()
+
+    def get_summaries(self, deck_ids):
+        # {id: Deck.to_dict()-shaped dict} for the given decks in one query
+        if not deck_ids:
+            return {}
+        rows = db.session.query(*deck_summary_columns()).filter(Deck.id.in_(deck_ids)).all()
+        return {row.id: deck_row_to_dict(row) for row in rows}
+
+    def get_owner_id(self, deck_id):
+        return db.session.query(Deck.user_id).filter(Deck.id == deck_id).scalar()
+
+    def get_version(self, deck_id):
+        # (version, created_at) of the deck without loading it, or None if it does not exist.
+        # created_at guards against a reused id matching a cached payload of a deleted deck.
+        row = db.session.query(Deck.version, Deck.created_at).filter(Deck.id == deck_id).first()
+        return tuple(row) if row else None
+
+    def get_user_decks_marker(self, user_id):
+        # Changes whenever the user's deck list would: a deck is added/removed (count, newest id/date)
+        # or any deck or its cards change (versions only grow, so their sum does too)
+        row = db.session.query(
+            func.count(Deck.id),
+            func.coalesce(func.sum(Deck.version), 0),
+            func.max(Deck.id),
+            func.max(Deck.created_at)
+        ).filter(Deck.user_id == user_id).one()
+        return tuple(row)
+
+    def bump_version(self, deck_id):
+        # Invalidate cached payloads of the deck in every worker
+        Deck.query.filter(Deck.id == deck_id).update(
+            {Deck.version: Deck.version + 1}, synchronize_session=False
+        )
+
+    def ensure_card_counts(self, engine):
+        # Keep decks.card_count in sync through triggers on cards, so every insert path (ORM, bulk
+        # executemany, ON DELETE CASCADE) is covered; safe to call on every startup.
+        # Cards never move between decks, so only inserts and deletes change the counts.
+        dialect = engine.dialect.name
+        with engine.connect() as conn:
+            if dialect == 'sqlite':
+                has_triggers = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'cards_card_count_ai'"
+                )).first()
+                conn.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS cards_card_count_ai AFTER INSERT ON cards BEGIN
+                        UPDATE decks SET card_count = card_count + 1 WHERE id = new.deck_id;
+                    END
+                """))
+                conn.execute(text("""
+                    CREATE TRIGGER IF NOT EXISTS cards_card_count_ad AFTER DELETE ON cards BEGIN
+                        UPDATE decks SET card_count = card_count - 1 WHERE id = old.deck_id;
+                    END
+                """))
+            elif dialect == 'postgresql':
+                has_triggers = conn.execute(text(
+                    "SELECT 1 FROM pg_trigger WHERE tgname = 'cards_card_count_ai'"
+                )).first()
+                # Statement-level triggers with transition tables: one UPDATE per deck per statement
+                for name, table, sign in (('ins', 'new_cards', '+'), ('del', 'old_cards', '-')):
+                    conn.execute(text(f"""
+                        CREATE OR REPLACE FUNCTION cards_card_count_{name}() RETURNS trigger AS $$
+                        BEGIN
+                            UPDATE decks SET card_count = decks.card_count {sign} changed.cnt
+                            FROM (SELECT deck_id, COUNT(*) AS cnt FROM {table} GROUP BY deck_id) AS changed
+                            WHERE decks.id = changed.deck_id;
+                            RETURN NULL;
+                        END
+                        $$ LANGUAGE plpgsql
+                    """))
+                if not has_triggers:
+                    conn.execute(text("""
+                        CREATE TRIGGER cards_card_count_ai AFTER INSERT ON cards
+                        REFERENCING NEW TABLE AS new_cards
+                        FOR EACH STATEMENT EXECUTE FUNCTION cards_card_count_ins()
+                    """))
+                    conn.execute(text("""
+                        CREATE TRIGGER cards_card_count_ad AFTER DELETE ON cards
+                        REFERENCING OLD TABLE AS old_cards
+                        FOR EACH STATEMENT EXECUTE FUNCTION cards_card_count_del()
+                    """))
+            else:
+                return
+            if not has_triggers:
+                # New column, or the table was recreated (dropping its triggers) - recount from scratch
+                conn.execute(text(
+                    "UPDATE decks SET card_count = (SELECT COUNT(*) FROM cards WHERE cards.deck_id = decks.id)"
+                ))
+            conn.commit()
+
+    def _filtered_query(self, user_id, search_sub=None, min_cards=None, max_cards=None,
+                        date_from=None, date_to=None):
         # Base query filtering by user_id
         query = Deck.query.filter_by(user_id=user_id)
 
-        # Text filter: searches within title and description (case-insensitive ILIKE)
-        if search:
-            pattern = f'%{search}%'
-            query = query.filter(
-                db.or_(Deck.title.ilike(pattern), Deck.description.ilike(pattern))
-            )
+        # Text filter: join against the full-text match subquery (title and description)
+        if search_sub is not None:
+            query = query.join(search_sub, Deck.id == search_sub.c.deck_id)
 
         # Filter by creation date range
         if date_from:
@@ -34,45 +178,117 @@ class DeckRepository:
             try:
                 dt_to = datetime.strptime(date_to, '%Y-%m-%d')
                 # Include the entire final day (up to the next midnight)
-                from datetime import timedelta
                 query = query.filter(Deck.created_at < dt_to + timedelta(days=1))
             except ValueError:
                 pass
 
-        # Filter by card count (requires a subquery to aggregate counts)
-        if min_cards is not None or max_cards is not None:
-            card_count_sub = (db.session.query(
-                Card.deck_id,
-                func.count(Card.id).label('cnt')
-            ).group_by(Card.deck_id).subquery())
-            query = query.outerjoin(card_count_sub, Deck.id == card_count_sub.c.deck_id)
-            if min_cards is not None:
-                query = query.filter(
-                    db.or_(card_count_sub.c.cnt >= min_cards, card_count_sub.c.cnt.is_(None) if min_cards == 0 else False)
-                )
-            if max_cards is not None:
-                query = query.filter(
-                    db.or_(card_count_sub.c.cnt <= max_cards, card_count_sub.c.cnt.is_(None))
-                )
+        # Filter by card count
+        if min_cards is not None:
+            query = query.filter(Deck.card_count >= min_cards)
+        if max_cards is not None:
+            query = query.filter(Deck.card_count <= max_cards)
+        return query
+
+    def get_user_decks(self, user_id, sort_by='newest', page=1, per_page=10,
+                       search=None, min_cards=None, max_cards=None,
+                       date_from=None, date_to=None):
+        search_sub = self.search_repo.match_subquery(search) if search else None
+        query = self._filtered_query(
+            user_id, search_sub=search_sub, min_cards=min_cards, max_cards=max_cards,
+            date_from=date_from, date_to=date_to
+        )
+
+        # Plain rows (see deck_summary_columns) instead of Deck entities
+        query = query.with_entities(*deck_summary_columns())
 
         # Apply the requested ordering
-        if sort_by == 'newest':
+        if sort_by == 'relevance' and search_sub is not None:
+            query = query.order_by(search_sub.c.score.desc(), Deck.id.desc())
+        elif sort_by == 'newest' or sort_by == 'relevance':
             query = query.order_by(Deck.created_at.desc())
         elif sort_by == 'oldest':
             query = query.order_by(Deck.created_at.asc())
         elif sort_by == 'name':
             query = query.order_by(Deck.title.asc())
         elif sort_by == 'cards':
-            # Order by card count - joins with the cards table
-            query = query.outerjoin(Card, Deck.id == Card.deck_id).group_by(Deck.id).order_by(func.count(Card.id).desc())
+            query = query.order_by(Deck.card_count.desc())
 
         # Return a Flask-SQLAlchemy Pagination object instead of a raw list
         return query.paginate(page=page, per_page=per_page, error_out=False)
 
+    def get_user_decks_keyset(self, user_id, sort_by='newest', limit=10, cursor=None,
+                              with_total=False, search=None, min_cards=None, max_cards=None,
+                              date_from=None, date_to=None):
+        # Keyset (cursor) pagination: seeks past the last seen (sort value, id) instead of OFFSET,
+        # so the cost of a page does not depend on how deep the client has scrolled.
+        # Returns (rows, next_cursor, total) - total is only computed when with_total is set.
+        # The cursor records sort_by; a cursor from a different ordering raises ValueError.
+        search_sub = self.search_repo.match_subquery(search) if search else None
+
+        query = self._filtered_query(
+            user_id, search_sub=search_sub, min_cards=min_cards, max_cards=max_cards,
+            date_from=date_from, date_to=date_to
+        )
+
+        total = query.order_by(None).count() if with_total else None
+
+        # Sort key column, direction and cursor value type for each sort_by option;
+        # id is the stable tiebreaker
+        if sort_by == 'oldest':
+            key, descending, value_types = Deck.created_at, False, str
+        elif sort_by == 'name':
+            key, descending, value_types = Deck.title, False, str
+        elif sort_by == 'cards':
+            key, descending, value_types = Deck.card_count, True, int
+        elif sort_by == 'relevance' and search_sub is not None:
+            key, descending, value_types = search_sub.c.score, True, (int, float)
+        else:
+            key, descending, value_types = Deck.created_at, True, str
+
+        if cursor:
+            cursor_sort, last_value, last_id = decode_cursor(cursor, length=3)
+            if cursor_sort != sort_by:
+                raise ValueError('Invalid cursor')
+            check_cursor_value(last_value, value_types)
+            if key is Deck.created_at:
+                try:
+                    last_value = datetime.fromisoformat(last_value)
+                except ValueError:
+                    raise ValueError('Invalid cursor')
+            position = db.tuple_(key, Deck.id)
+            query = query.filter(position < (last_value, last_id) if descending else position > (last_value, last_id))
+
+        if descending:
+            query = query.order_by(key.desc(), Deck.id.desc())
+        else:
+            query = query.order_by(key.asc(), Deck.id.asc())
+
+        # Plain rows (see deck_summary_columns); the sort key is selected last for the cursor
+        rows = query.with_entities(*deck_summary_columns(), key.label('sort_key')).limit(limit + 1).all()
+
+        # Fetching one extra row tells us whether another page exists without a COUNT
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            last_value = last.created_at.isoformat() if key is Deck.created_at else last.sort_key
+            next_cursor = encode_cursor([sort_by, last_value, last.id])
+        return rows, next_cursor, total
+
+    def get_file_objects(self, deck_id):
+        # (object_name, size_bytes) of the deck's attachments, collected before the rows are cascaded away
+        return db.session.query(DeckFile.object_name, DeckFile.size_bytes).filter(DeckFile.deck_id == deck_id).all()
+
+    def get_files_by_ids(self, file_ids):
+        # {id: DeckFile.to_dict()} for the given attachments
+        if not file_ids:
+            return {}
+        return {f.id: f.to_dict() for f in DeckFile.query.filter(DeckFile.id.in_(file_ids)).all()}
+
     def add(self, deck):
         # Add a deck to the database session
         db.session.add(deck)
 
     def delete(self, deck):
-        # Delete the deck (cascades to all associated cards)
+        # Delete the deck; cards, files and sessions are removed by ON DELETE CASCADE in the database
         db.session.delete(deck)
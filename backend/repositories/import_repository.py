@@ -0,0 +1,11 @@
+# Repository for import jobs - tracks background deck imports and their progress
+
+from models import db, ImportJob
+
+
+class ImportRepository:
+    def get_by_id(self, job_id):
+        return db.session.get(ImportJob, job_id)
+
+    def add(self, job):
+        db.session.add(job)
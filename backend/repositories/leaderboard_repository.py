@@ -0,0 +1,128 @@
+# Repository for leaderboards - per-user scores (leaderboard_entries) plus a users-per-score
+# histogram (leaderboard_scores) that is adjusted in the same transaction as every score change.
+# Top-N reads the (board, period, score, user_id) index backwards; "my rank" sums the histogram
+# rows above the user's score instead of counting users.
+
+from datetime import datetime
+from sqlalchemy import delete, func
+from models import db, User, LeaderboardEntry, LeaderboardScore
+from repositories.metrics_repository import insert_for_dialect
+
+BOARDS = ('streak', 'cards')
+ALL_TIME = 'all'
+
+
+def week_period(day):
+    # ISO week key of a date, e.g. '2026-W42'
+    year, week, _ = day.isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+class LeaderboardRepository:
+    def get_user_scores(self, user_id, periods=None, lock=False):
+        # {(board, period): score} of the user; lock=True holds the rows until commit (PostgreSQL)
+        query = (db.session.query(LeaderboardEntry.board, LeaderboardEntry.period, LeaderboardEntry.score)
+                 .filter(LeaderboardEntry.user_id == user_id))
+        if periods is not None:
+            query = query.filter(LeaderboardEntry.period.in_(periods))
+        if lock:
+            query = query.with_for_update()
+        return {(board, period): score for board, period, score in query.all()}
+
+    def save_scores(self, user_id, old_scores, new_scores):
+        # Upsert the changed {(board, period): score} entries and move the user between histogram buckets
+        changed = {key: score for key, score in new_scores.items() if old_scores.get(key) != score}
+        if not changed:
+            return
+        insert = insert_for_dialect()
+        now = datetime.utcnow()
+        stmt = insert(LeaderboardEntry)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['board', 'period', 'user_id'],
+                set_={'score': stmt.excluded.score, 'updated_at': stmt.excluded.updated_at}
+            ),
+            [{'board': board, 'period': period, 'user_id': user_id, 'score': score, 'updated_at': now}
+             for (board, period), score in changed.items()]
+        )
+
+        deltas = {}
+        for key, score in changed.items():
+            if key in old_scores:
+                deltas[key + (old_scores[key],)] = deltas.get(key + (old_scores[key],), 0) - 1
+            deltas[key + (score,)] = deltas.get(key + (score,), 0) + 1
+        self._adjust_histogram(deltas)
+
+    def remove_user(self, user_id):
+        # Take the user out of every histogram before the entries are cascaded away
+        scores = self.get_user_scores(user_id, lock=True)
+        self._adjust_histogram({key + (score,): -1 for key, score in scores.items()})
+        db.session.execute(delete(LeaderboardEntry).where(LeaderboardEntry.user_id == user_id))
+
+    def get_top(self, board, period, limit):
+        # (user_id, username, score) of the best scores; ties are broken by the earlier user
+        return (db.session.query(LeaderboardEntry.user_id, User.username, LeaderboardEntry.score)
+                .join(User, User.id == LeaderboardEntry.user_id)
+                .filter(LeaderboardEntry.board == board, LeaderboardEntry.period == period)
+                .order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.user_id)
+                .limit(limit)
+                .all())
+
+    def get_score(self, board, period, user_id):
+        return (db.session.query(LeaderboardEntry.score)
+                .filter(LeaderboardEntry.board == board, LeaderboardEntry.period == period,
+                        LeaderboardEntry.user_id == user_id)
+                .scalar())
+
+    def get_rank(self, board, period, score):
+        # Competition rank (equal scores share a rank) and the number of ranked users
+        above, total = db.session.query(
+            func.coalesce(func.sum(LeaderboardScore.users).filter(LeaderboardScore.score > score), 0),
+            func.coalesce(func.sum(LeaderboardScore.users), 0)
+        ).filter(LeaderboardScore.board == board, LeaderboardScore.period == period).one()
+        return above + 1, total
+
+    def prune_weeks(self, keep_from):
+        # Delete weekly entries and buckets of weeks before the period key keep_from (ISO week keys
+        # sort chronologically) plus any empty buckets; returns the number of entries deleted
+        past = db.and_(LeaderboardEntry.period != ALL_TIME, LeaderboardEntry.period < keep_from)
+        deleted = db.session.execute(delete(LeaderboardEntry).where(past)).rowcount
+        db.session.execute(delete(LeaderboardScore).where(db.or_(
+            db.and_(LeaderboardScore.period != ALL_TIME, LeaderboardScore.period < keep_from),
+            LeaderboardScore.users <= 0
+        )))
+        return deleted
+
+    def rebuild_histogram(self):
+        # Recompute leaderboard_scores from the entries (repair after manual edits)
+        db.session.execute(delete(LeaderboardScore))
+        rows = (db.session.query(LeaderboardEntry.board, LeaderboardEntry.period, LeaderboardEntry.score,
+                                 func.count(LeaderboardEntry.user_id))
+                .group_by(LeaderboardEntry.board, LeaderboardEntry.period, LeaderboardEntry.score)
+                .all())
+        for board, period, score, users in rows:
+            db.session.add(LeaderboardScore(board=board, period=period, score=score, users=users))
+        return len(rows)
+
+    def _adjust_histogram(self, deltas):
+        # {(board, period, score): delta} applied as one executemany upsert
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        insert = insert_for_dialect()
+        stmt = insert(LeaderboardScore)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['board', 'period', 'score'],
+                set_={'users': LeaderboardScore.users + stmt.excluded.users}
+            ),
+            [{'board': board, 'period': period, 'score': score, 'users': delta}
+             for (board, period, score), delta in deltas.items()]
+        )
+        # Buckets a user has just left may be empty now - drop them instead of keeping zero rows
+        emptied = [key for key, delta in deltas.items() if delta < 0]
+        if emptied:
+            db.session.execute(delete(LeaderboardScore).where(
+                db.tuple_(LeaderboardScore.board, LeaderboardScore.period, LeaderboardScore.score).in_(emptied),
+                LeaderboardScore.users <= 0
+            ))
@@ -0,0 +1,111 @@
+# Repository for admin dashboard rollups - daily counters, running totals and the daily-active-user set.
+# Counters are bumped with a single upsert (INSERT ... ON CONFLICT DO UPDATE SET value = value + delta)
+# in the same transaction as the write they describe, so reading the dashboard never scans source tables.
+
+from datetime import date, timedelta
+from sqlalchemy import func, delete, distinct
+from models import db, DailyMetric, MetricTotal, DailyActiveUser, StudySession, Deck, DeckFile
+
+DAILY_METRICS = ('active_users', 'sessions', 'cards_studied', 'decks_created', 'ai_generations')
+
+
+def insert_for_dialect():
+    # Dialect-specific INSERT construct that supports ON CONFLICT (SQLite and PostgreSQL)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+class MetricsRepository:
+    def increment(self, day, metric, delta=1):
+        # Add delta to a daily counter, creating the row on first use
+        if not delta:
+            return
+        insert = insert_for_dialect()
+        stmt = insert(DailyMetric).values(day=day, metric=metric, value=delta)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['day', 'metric'],
+            set_={'value': DailyMetric.value + stmt.excluded.value}
+        ))
+
+    def increment_total(self, metric, delta):
+        # Add delta (may be negative) to an all-time counter
+        if not delta:
+            return
+        insert = insert_for_dialect()
+        stmt = insert(MetricTotal).values(metric=metric, value=delta)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['metric'],
+            set_={'value': MetricTotal.value + stmt.excluded.value}
+        ))
+
+    def mark_active(self, day, user_id):
+        # Record the user as active on day; returns True only the first time that day
+        insert = insert_for_dialect()
+        result = db.session.execute(
+            insert(DailyActiveUser).values(day=day, user_id=user_id).on_conflict_do_nothing()
+        )
+        return result.rowcount == 1
+
+    def get_daily(self, day_from, day_to):
+        # {day: {metric: value}} for the range - bounded by the number of days, not by history size
+        rows = (db.session.query(DailyMetric.day, DailyMetric.metric, DailyMetric.value)
+                .filter(DailyMetric.day >= day_from, DailyMetric.day <= day_to)
+                .all())
+        result = {}
+        for day, metric, value in rows:
+            result.setdefault(day, {})[metric] = value
+        return result
+
+    def get_totals(self):
+        return {metric: value for metric, value in db.session.query(MetricTotal.metric, MetricTotal.value).all()}
+
+    def prune_active_users(self, before_day):
+        # Drop de-duplication rows that can no longer receive writes
+        result = db.session.execute(delete(DailyActiveUser).where(DailyActiveUser.day < before_day))
+        return result.rowcount
+
+    def rebuild(self, day_from, day_to):
+        # Recompute the derivable daily counters and the storage total from the source tables.
+        # ai_generations is not derivable and keeps its incrementally maintained values.
+        # Deleting a deck or a user also deletes its decks and sessions, so the source tables can only
+        # undercount the past: a rebuilt daily counter never drops below its incremental value
+        # (e.g. decks_created keeps decks that were created and deleted later).
+        derived = {
+            'sessions': db.session.query(StudySession.date, func.count(StudySession.id))
+                .filter(StudySession.date >= day_from, StudySession.date <= day_to)
+                .group_by(StudySession.date).all(),
+            'cards_studied': db.session.query(StudySession.date, func.coalesce(func.sum(StudySession.cards_studied), 0))
+                .filter(StudySession.date >= day_from, StudySession.date <= day_to)
+                .group_by(StudySession.date).all(),
+            'active_users': db.session.query(StudySession.date, func.count(distinct(StudySession.user_id)))
+                .filter(StudySession.date >= day_from, StudySession.date <= day_to)
+                .group_by(StudySession.date).all(),
+            'decks_created': db.session.query(func.date(Deck.created_at), func.count(Deck.id))
+                .filter(Deck.created_at >= day_from, Deck.created_at < day_to + timedelta(days=1))
+                .group_by(func.date(Deck.created_at)).all(),
+        }
+        current = {
+            (day, metric): value for day, metric, value in
+            db.session.query(DailyMetric.day, DailyMetric.metric, DailyMetric.value)
+            .filter(DailyMetric.day >= day_from, DailyMetric.day <= day_to, DailyMetric.metric.in_(list(derived)))
+            .all()
+        }
+        insert = insert_for_dialect()
+        for metric, rows in derived.items():
+            for day, value in rows:
+                if isinstance(day, str):  # SQLite returns date() results as text
+                    day = date.fromisoformat(day)
+                if value <= current.get((day, metric), 0):
+                    continue
+                stmt = insert(DailyMetric).values(day=day, metric=metric, value=value)
+                db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=['day', 'metric'], set_={'value': stmt.excluded.value}
+                ))
+
+        storage = db.session.query(func.coalesce(func.sum(DeckFile.size_bytes), 0)).scalar()
+        db.session.execute(delete(MetricTotal).where(MetricTotal.metric == 'storage_bytes'))
+        db.session.add(MetricTotal(metric='storage_bytes', value=storage))
@@ -0,0 +1,65 @@
+# Repository for spaced-repetition state - card_schedules rows keyed by (user_id, card_id).
+# Due queues are read through the (user_id, deck_id, next_due) index, so their cost depends
+# on the page size, not on the size of the deck.
+
+from sqlalchemy import func
+from models import db, Card, CardSchedule
+from repositories.card_repository import card_columns
+from repositories.metrics_repository import insert_for_dialect
+
+SCHEDULE_FIELDS = ('repetitions', 'interval_days', 'ease', 'lapses', 'next_due', 'last_reviewed')
+
+
+class ScheduleRepository:
+    def get_states(self, user_id, card_ids):
+        # {card_id: state dict} for the cards that have been reviewed before - one IN query
+        if not card_ids:
+            return {}
+        rows = (db.session.query(CardSchedule.card_id, *[getattr(CardSchedule, f) for f in SCHEDULE_FIELDS])
+                .filter(CardSchedule.user_id == user_id, CardSchedule.card_id.in_(card_ids))
+                .all())
+        return {row[0]: dict(zip(SCHEDULE_FIELDS, row[1:])) for row in rows}
+
+    def save_states(self, user_id, deck_id, states):
+        # Upsert {card_id: state} in one executemany INSERT ... ON CONFLICT DO UPDATE
+        if not states:
+            return
+        insert = insert_for_dialect()
+        stmt = insert(CardSchedule)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['user_id', 'card_id'],
+                set_={f: getattr(stmt.excluded, f) for f in SCHEDULE_FIELDS}
+            ),
+            [{'user_id': user_id, 'card_id': card_id, 'deck_id': deck_id,
+              **{f: state[f] for f in SCHEDULE_FIELDS}} for card_id, state in states.items()]
+        )
+
+    def get_due(self, user_id, deck_id, now, limit):
+        # (card columns..., schedule fields...) of cards due by now, most overdue first
+        return (db.session.query(*card_columns(), *[getattr(CardSchedule, f) for f in SCHEDULE_FIELDS])
+                .join(Card, Card.id == CardSchedule.card_id)
+                .filter(CardSchedule.user_id == user_id,
+                        CardSchedule.deck_id == deck_id,
+                        CardSchedule.next_due <= now)
+                .order_by(CardSchedule.next_due, CardSchedule.card_id)
+                .limit(limit)
+                .all())
+
+    def count_due(self, user_id, deck_id, now):
+        # Index-only range count
+        return (db.session.query(func.count())
+                .select_from(CardSchedule)
+                .filter(CardSchedule.user_id == user_id,
+                        CardSchedule.deck_id == deck_id,
+                        CardSchedule.next_due <= now)
+                .scalar())
+
+    def get_new(self, user_id, deck_id, limit):
+        # Card columns of cards the user has never reviewed, in deck order
+        return (db.session.query(*card_columns())
+                .outerjoin(CardSchedule, (CardSchedule.card_id == Card.id) & (CardSchedule.user_id == user_id))
+                .filter(Card.deck_id == deck_id, CardSchedule.card_id.is_(None))
+                .order_by(Card.id)
+                .limit(limit)
+                .all())
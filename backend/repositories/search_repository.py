@@ -0,0 +1,195 @@
+# Repositories for full-text search over decks and cards - one interface over dialect-specific indexes:
+#   SQLite     -> FTS5 external-content table kept in sync by triggers (dev and tests)
+#   PostgreSQL -> generated tsvector column with a GIN index and the 'russian' configuration (production)
+#   other      -> plain ILIKE fallback (no index, no ranking)
+
+import html
+import re
+from sqlalchemy import text, select, literal, or_
+from models import db, Deck, Card
+
+# Common Russian inflectional endings, longest first. FTS5 has no Russian stemmer,
+# so in SQLite we strip an ending and run a prefix query as a light-weight approximation.
+RU_ENDINGS = sorted([
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ах', 'ях', 'ам', 'ям', 'ом', 'ем',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ов', 'ев', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь'
+], key=len, reverse=True)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-яё]')
+
+
+def stem_token(token):
+    # Strip one Russian ending, keeping a stem of at least 3 characters
+    token = token.lower()
+    if CYRILLIC_RE.search(token):
+        for ending in RU_ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= 3:
+                return token[:-len(ending)]
+    return token
+
+
+def build_stems(term):
+    # Stemmed search tokens, shared by the FTS5 query builder and the highlighter
+    return [t for t in (stem_token(t) for t in TOKEN_RE.findall(term)) if t]
+
+
+def build_fts5_query(term):
+    # Turn free user input into a safe FTS5 MATCH expression: every word quoted, prefix-matched, AND-ed
+    return ' '.join(f'"{t}"*' for t in build_stems(term))
+
+
+def highlight(value, stems, open_tag='<mark>', close_tag='</mark>'):
+    # HTML-escape value and wrap every word that starts with one of the stems
+    if not value:
+        return value
+    parts = []
+    last = 0
+    for m in TOKEN_RE.finditer(value):
+        word = m.group(0)
+        if any(word.lower().startswith(stem) for stem in stems):
+            parts.append(html.escape(value[last:m.start()]))
+            parts.append(f'{open_tag}{html.escape(word)}{close_tag}')
+            last = m.end()
+    parts.append(html.escape(value[last:]))
+    return ''.join(parts)
+
+
+class FullTextSearchRepository:
+    # Subclasses describe the indexed table: (column, bm25 weight, tsvector weight) per searchable column
+    model = None
+    table = None
+    id_label = None
+    columns = ()
+
+    def __init__(self):
+        # Engine URLs where the FTS5 index has been verified (FTS5 may be compiled out of SQLite)
+        self._fts5_ready = set()
+
+    def fts5_ready(self, engine):
+        # The index may have been created by another process (flask init-db), so look it up on first use;
+        # only a positive answer is cached - a missing index is checked again on the next search
+        url = str(engine.url)
+        if url not in self._fts5_ready:
+            with engine.connect() as conn:
+                found = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"
+                ), {'name': f'{self.fts_table}_ai'}).first()
+            if found:
+                self._fts5_ready.add(url)
+        return url in self._fts5_ready
+
+    @property
+    def fts_table(self):
+        return f'{self.table}_fts'
+
+    def ensure_index(self, engine):
+        # Create the full-text index for the engine's dialect; safe to call on every startup
+        dialect = engine.dialect.name
+        names = [name for name, _, _ in self.columns]
+        cols = ', '.join(names)
+        new_values = ', '.join(f'new.{n}' for n in names)
+        old_values = ', '.join(f'old.{n}' for n in names)
+        fts = self.fts_table
+        with engine.connect() as conn:
+            if dialect == 'sqlite':
+                conn.execute(text(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                        {cols},
+                        content='{self.table}', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                """))
+                has_triggers = conn.execute(text(
+                    f"SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = '{fts}_ai'"
+                )).first()
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {self.table} BEGIN
+                        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+                    END
+                """))
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {self.table} BEGIN
+                        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                    END
+                """))
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {self.table} BEGIN
+                        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+                    END
+                """))
+                if not has_triggers:
+                    # New index, or the table was recreated (dropping its triggers) - reindex from scratch
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+                self._fts5_ready.add(str(engine.url))
+            elif dialect == 'postgresql':
+                vector = ' || '.join(
+                    f"setweight(to_tsvector('russian', coalesce({name}, '')), '{weight}')"
+                    for name, _, weight in self.columns
+                )
+                conn.execute(text(f"""
+                    ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+                    GENERATED ALWAYS AS ({vector}) STORED
+                """))
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{self.table}_search_vector ON {self.table} USING GIN (search_vector)"
+                ))
+            conn.commit()
+
+    def drop_index(self, engine):
+        # Remove the SQLite FTS table (used by the test teardown; Postgres drops the column with the table)
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {self.fts_table}"))
+                conn.commit()
+            self._fts5_ready.discard(str(engine.url))
+
+    def match_subquery(self, term):
+        # Subquery of (<id_label>, score) for rows matching term; a higher score means more relevant
+        engine = db.engine
+        dialect = engine.dialect.name
+        name = f'{self.table}_search'
+
+        if dialect == 'sqlite' and self.fts5_ready(engine):
+            match = build_fts5_query(term)
+            if match:
+                # bm25() is lower-is-better, so it is negated; weights follow self.columns
+                weights = ', '.join(str(w) for _, w, _ in self.columns)
+                return text(
+                    f"SELECT rowid AS {self.id_label}, -bm25({self.fts_table}, {weights}) AS score "
+                    f"FROM {self.fts_table} WHERE {self.fts_table} MATCH :match"
+                ).bindparams(match=match).columns(
+                    **{self.id_label: db.Integer, 'score': db.Float}
+                ).subquery(name)
+
+        if dialect == 'postgresql':
+            return text(
+                f"SELECT id AS {self.id_label}, ts_rank(search_vector, websearch_to_tsquery('russian', :term)) AS score "
+                f"FROM {self.table} WHERE search_vector @@ websearch_to_tsquery('russian', :term)"
+            ).bindparams(term=term).columns(
+                **{self.id_label: db.Integer, 'score': db.Float}
+            ).subquery(name)
+
+        # Fallback: unindexed substring search without ranking
+        pattern = f'%{term}%'
+        return (select(self.model.id.label(self.id_label), literal(1.0).label('score'))
+                .where(or_(*[getattr(self.model, n).ilike(pattern) for n, _, _ in self.columns]))
+                .subquery(name))
+
+
+class DeckSearchRepository(FullTextSearchRepository):
+    # Deck title matches weigh 10x description matches
+    model = Deck
+    table = 'decks'
+    id_label = 'deck_id'
+    columns = (('title', 10.0, 'A'), ('description', 1.0, 'B'))
+
+
+class CardSearchRepository(FullTextSearchRepository):
+    # Question > answer > source
+    model = Card
+    table = 'cards'
+    id_label = 'card_id'
+    columns = (('question', 10.0, 'A'), ('answer', 5.0, 'B'), ('source', 1.0, 'C'))
@@ -1,6 +1,10 @@
-# Repository for statistics - interacts with user_stats and study_sessions tables
+# Repository for statistics - interacts with user_stats, study_sessions and user_daily_stats tables
 
-from models import db, UserStats, StudySession
+from sqlalchemy import func, delete
+from models import db, UserStats, StudySession, UserDailyStats, Deck
+from repositories.metrics_repository import insert_for_dialect
+
+DAILY_COUNTERS = ('sessions', 'cards_studied', 'cards_correct', 'duration_seconds')
 
 
 class StatsRepository:
@@ -8,6 +12,11 @@ class StatsRepository:
         # Retrieve statistics records for a specific user ID
         return UserStats.query.filter_by(user_id=user_id).first()
 
+    def get_marker(self, user_id):
+        # (id, updated_at) of the user's stats row without loading it, or None if there is none yet
+        row = db.session.query(UserStats.id, UserStats.updated_at).filter(UserStats.user_id == user_id).first()
+        return tuple(row) if row else None
+
     def add_stats(self, stats):
         # Add a new user statistics record (initialized during registration)
         db.session.add(stats)
@@ -15,3 +24,42 @@ class StatsRepository:
     def add_session(self, session):
         # Save study session records
         db.session.add(session)
+
+    def add_daily_stats(self, user_id, day, deck_id, **deltas):
+        # Add the session's counters to the (user, day, deck) rollup row with one upsert
+        insert = insert_for_dialect()
+        values = {name: deltas.get(name, 0) for name in DAILY_COUNTERS}
+        stmt = insert(UserDailyStats).values(user_id=user_id, day=day, deck_id=deck_id, **values)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day', 'deck_id'],
+            set_={name: getattr(UserDailyStats, name) + getattr(stmt.excluded, name) for name in DAILY_COUNTERS}
+        ))
+
+    def get_daily_stats(self, user_id, day_from, day_to):
+        # Rollup rows for the range with deck titles (None for deleted decks);
+        # the row count depends on days x decks studied, not on the number of sessions
+        return (db.session.query(UserDailyStats, Deck.title)
+                .outerjoin(Deck, Deck.id == UserDailyStats.deck_id)
+                .filter(UserDailyStats.user_id == user_id,
+                        UserDailyStats.day >= day_from,
+                        UserDailyStats.day <= day_to)
+                .order_by(UserDailyStats.day)
+                .all())
+
+    def rebuild_daily_stats(self):
+        # Recompute the whole rollup from study_sessions (one-off backfill for existing data)
+        db.session.execute(delete(UserDailyStats))
+        rows = (db.session.query(
+                    StudySession.user_id, StudySession.date, StudySession.deck_id,
+                    func.count(StudySession.id),
+                    func.coalesce(func.sum(StudySession.cards_studied), 0),
+                    func.coalesce(func.sum(StudySession.cards_correct), 0),
+                    func.coalesce(func.sum(StudySession.duration_seconds), 0))
+                .group_by(StudySession.user_id, StudySession.date, StudySession.deck_id)
+                .all())
+        db.session.add_all([
+            UserDailyStats(user_id=user_id, day=day, deck_id=deck_id, sessions=sessions,
+                           cards_studied=studied, cards_correct=correct, duration_seconds=duration)
+            for user_id, day, deck_id, sessions, studied, correct, duration in rows
+        ])
+        return len(rows)
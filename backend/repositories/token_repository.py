@@ -2,6 +2,7 @@
 # Active tokens are stored in the database and can be revoked upon logout or rotation
 
 from models import db, RefreshToken
+from sqlalchemy import delete
 
 
 class TokenRepository:
@@ -16,3 +17,37 @@ class TokenRepository:
     def add(self, token):
         # Add a new refresh token to the database session
         db.session.add(token)
+
+    def delete_excess_active(self, user_id, keep, now):
+        # Delete the user's oldest active tokens so that at most `keep` remain.
+        # Expired tokens are not active (prune_batch removes them), so they do not count toward the cap.
+        excess_ids = [row[0] for row in (
+            db.session.query(RefreshToken.id)
+            .filter(RefreshToken.user_id == user_id, RefreshToken.revoked.is_(False),
+                    RefreshToken.expires_at > now)
+            .order_by(RefreshToken.created_at.desc(), RefreshToken.id.desc())
+            .offset(keep)
+            .all()
+        )]
+        if excess_ids:
+            db.session.execute(
+                delete(RefreshToken).where(RefreshToken.id.in_(excess_ids)),
+                execution_options={'synchronize_session': False}
+            )
+        return len(excess_ids)
+
+    def prune_batch(self, now, batch_size):
+        # Delete up to batch_size expired or revoked tokens; returns the number deleted.
+        # Selecting ids first keeps each DELETE short, so no long table locks are held.
+        ids = [row[0] for row in (
+            db.session.query(RefreshToken.id)
+            .filter(db.or_(RefreshToken.revoked.is_(True), RefreshToken.expires_at < now))
+            .limit(batch_size)
+            .all()
+        )]
+        if ids:
+            db.session.execute(
+                delete(RefreshToken).where(RefreshToken.id.in_(ids)),
+                execution_options={'synchronize_session': False}
+            )
+        return len(ids)
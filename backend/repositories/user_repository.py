@@ -1,7 +1,8 @@
 # Repository for Users - handles basic database queries and actions on the User model
 # Focuses solely on DB access operations (business logic is handled by the services)
 
-from models import db, User
+from models import db, User, Deck, Card, DeckFile, StudySession
+from sqlalchemy import func, select
 
 
 class UserRepository:
@@ -21,10 +22,93 @@ class UserRepository:
         # Retrieve all users (used in the administrative panel)
         return User.query.all()
 
+    def _count_subqueries(self, user_ids=None):
+        # Per-user deck/card/session counts, each pre-aggregated with a single GROUP BY
+        # (restricted to user_ids when only one page of users needs them)
+        decks = select(Deck.user_id, func.count(Deck.id).label('n')).group_by(Deck.user_id)
+        cards = (select(Deck.user_id, func.count(Card.id).label('n'))
+                 .join(Card, Card.deck_id == Deck.id).group_by(Deck.user_id))
+        sessions = select(StudySession.user_id, func.count(StudySession.id).label('n')).group_by(StudySession.user_id)
+        if user_ids is not None:
+            decks = decks.where(Deck.user_id.in_(user_ids))
+            cards = cards.where(Deck.user_id.in_(user_ids))
+            sessions = sessions.where(StudySession.user_id.in_(user_ids))
+        return decks.subquery('deck_counts'), cards.subquery('card_counts'), sessions.subquery('session_counts')
+
+    def _with_counts(self, query, subqueries):
+        # Outer-join the count subqueries and select (User, deck_count, card_count, session_count)
+        for sub in subqueries:
+            query = query.outerjoin(sub, sub.c.user_id == User.id)
+        return query.add_columns(*[func.coalesce(sub.c.n, 0) for sub in subqueries])
+
+    def get_users_page(self, search=None, sort_by='id', order='asc', page=1, per_page=50, after=None):
+        # One page of users with their deck/card/session counts. Paging is keyset when `after`
+        # (the (sort value, id) of the previous page's last row) is given, OFFSET by page otherwise.
+        # Sorting by a user column picks the page from the users table first and counts only its
+        # users; sorting by a count aggregates every user once (one GROUP BY per table) and pages
+        # over the joined result. Returns (rows, last_key, total) - each row is
+        # (User, deck_count, card_count, session_count), last_key is None on the last page.
+        query = User.query
+        if search:
+            pattern = f'%{search}%'
+            query = query.filter(db.or_(User.username.ilike(pattern), User.email.ilike(pattern)))
+        total = query.order_by(None).count()
+
+        by_count = sort_by in ('decks', 'cards', 'sessions')
+        if by_count:
+            subqueries = self._count_subqueries()
+            query = self._with_counts(query, subqueries)
+            key = func.coalesce(subqueries[('decks', 'cards', 'sessions').index(sort_by)].c.n, 0)
+        else:
+            key = {
+                'username': User.username,
+                'email': User.email,
+                'created_at': User.created_at,
+                'role': User.role,
+            }.get(sort_by, User.id)
+
+        descending = order == 'desc'
+        if after is not None:
+            position = db.tuple_(key, User.id)
+            query = query.filter(position < tuple(after) if descending else position > tuple(after))
+        if descending:
+            query = query.order_by(key.desc(), User.id.desc())
+        else:
+            query = query.order_by(key.asc(), User.id.asc())
+        if after is None:
+            query = query.offset((page - 1) * per_page)
+
+        # One extra row tells whether another page exists
+        rows = query.add_columns(key.label('sort_key')).limit(per_page + 1).all()
+        last_key = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            last_key = (rows[-1].sort_key, rows[-1][0].id)
+
+        if by_count:
+            return [tuple(row[:4]) for row in rows], last_key, total
+        users = [row[0] for row in rows]
+        counts = {}
+        if users:
+            counted = self._with_counts(
+                db.session.query(User.id).filter(User.id.in_([u.id for u in users])),
+                self._count_subqueries([u.id for u in users])
+            )
+            counts = {user_id: (decks, cards, sessions) for user_id, decks, cards, sessions in counted.all()}
+        return [(user, *counts.get(user.id, (0, 0, 0))) for user in users], last_key, total
+
+    def get_file_objects(self, user_id):
+        # (object_name, size_bytes) of all attachments in the user's decks, collected before account deletion
+        return (db.session.query(DeckFile.object_name, DeckFile.size_bytes)
+                .join(Deck, Deck.id == DeckFile.deck_id)
+                .filter(Deck.user_id == user_id)
+                .all())
+
     def add(self, user):
         # Add a user to the database session (without committing the transaction)
         db.session.add(user)
 
     def delete(self, user):
-        # Mark a user for deletion in the database session (without committing)
+        # Mark a user for deletion in the database session (without committing);
+        # decks, cards, sessions, stats and tokens are removed by ON DELETE CASCADE
         db.session.delete(user)
@@ -0,0 +1,78 @@
+# Admin Service - user management queries for the administrative panel
+
+from datetime import datetime, timedelta
+from models import db
+from repositories.deck_repository import encode_cursor, decode_cursor
+from repositories.metrics_repository import DAILY_METRICS
+
+
+class AdminService:
+    # Receives repository instances via constructor injection
+    def __init__(self, user_repo, metrics_repo, deck_cache):
+        self.user_repo = user_repo        # users table + per-user aggregates
+        self.metrics_repo = metrics_repo  # precomputed dashboard rollups
+        self.deck_cache = deck_cache      # deck payload cache (hit/miss counters of this worker)
+
+    def list_users(self, search=None, sort_by='id', order='asc', page=1, per_page=50, cursor=None):
+        # Return (total, users, next_cursor). The cursor carries the sort it was issued for, so it
+        # cannot be replayed with another sort_by/order (ValueError, like a malformed cursor)
+        after = None
+        if cursor:
+            cursor_sort, cursor_order, last_value, last_id = decode_cursor(cursor, length=4)
+            if (cursor_sort, cursor_order) != (sort_by, order):
+                raise ValueError('Cursor was issued for another sort')
+            if sort_by == 'created_at':
+                try:
+                    last_value = datetime.fromisoformat(last_value)
+                except (TypeError, ValueError):
+                    raise ValueError('Invalid cursor')
+            after = (last_value, last_id)
+
+        rows, last_key, total = self.user_repo.get_users_page(
+            search=search, sort_by=sort_by, order=order, page=page, per_page=per_page, after=after
+        )
+        users = [{
+            **user.to_dict(),
+            'deck_count': deck_count,
+            'card_count': card_count,
+            'session_count': session_count
+        } for user, deck_count, card_count, session_count in rows]
+
+        next_cursor = None
+        if last_key is not None:
+            last_value, last_id = last_key
+            if isinstance(last_value, datetime):
+                last_value = last_value.isoformat()
+            next_cursor = encode_cursor([sort_by, order, last_value, last_id])
+        return total, users, next_cursor
+
+    def get_metrics(self, days=30):
+        # Dashboard series for the last `days` days, read only from the rollup tables
+        day_to = datetime.utcnow().date()
+        day_from = day_to - timedelta(days=days - 1)
+        daily = self.metrics_repo.get_daily(day_from, day_to)
+        totals = self.metrics_repo.get_totals()
+
+        series = []
+        for offset in range(days):
+            day = day_from + timedelta(days=offset)
+            values = daily.get(day, {})
+            series.append({'date': day.isoformat(), **{m: values.get(m, 0) for m in DAILY_METRICS}})
+
+        return {
+            'from': day_from.isoformat(),
+            'to': day_to.isoformat(),
+            'daily': series,
+            'totals': {'storage_bytes': totals.get('storage_bytes', 0)},
+            'deck_cache': self.deck_cache.stats()
+        }, 200
+
+    def compact_metrics(self, rebuild_days=0, keep_active_days=2):
+        # Periodic job: prune the active-user de-duplication set and optionally
+        # recompute the last `rebuild_days` days of derivable counters from source tables
+        today = datetime.utcnow().date()
+        pruned = self.metrics_repo.prune_active_users(today - timedelta(days=keep_active_days - 1))
+        if rebuild_days:
+            self.metrics_repo.rebuild(today - timedelta(days=rebuild_days - 1), today)
+        db.session.commit()
+        return pruned
@@ -0,0 +1,170 @@
+# Anki package (.apkg) export - a zip holding `collection.anki2` (an Anki schema 11 SQLite
+# database with one "Basic" note type and one deck) and an empty `media` map.
+# Cards are written into the temporary collection in the batches they are read from the
+# database, and the zip is streamed out in chunks, so memory use does not grow with deck size.
+
+import hashlib
+import html
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+# Stable note type id, so re-importing an updated export updates the same notes in Anki
+MODEL_ID = 1607392319
+CHUNK_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+
+def _deck_json(deck_id, name, now):
+    return {
+        'id': deck_id, 'name': name, 'desc': '', 'mod': now, 'usn': -1, 'conf': 1, 'dyn': 0,
+        'collapsed': False, 'browserCollapsed': False, 'extendNew': 10, 'extendRev': 50,
+        'newToday': [0, 0], 'revToday': [0, 0], 'lrnToday': [0, 0], 'timeToday': [0, 0]
+    }
+
+
+def _collection_row(deck_id, deck_title, now):
+    model = {
+        'id': MODEL_ID, 'name': 'Study Cards Basic', 'type': 0, 'mod': now, 'usn': -1, 'sortf': 0,
+        'did': deck_id, 'tags': [], 'vers': [], 'latexPre': '', 'latexPost': '', 'req': [[0, 'all', [0]]],
+        'css': '.card { font-family: arial; font-size: 20px; text-align: center; }',
+        'flds': [
+            {'name': name, 'ord': i, 'sticky': False, 'rtl': False, 'font': 'Arial', 'size': 20, 'media': []}
+            for i, name in enumerate(('Front', 'Back'))
+        ],
+        'tmpls': [{
+            'name': 'Card 1', 'ord': 0, 'did': None, 'bqfmt': '', 'bafmt': '',
+            'qfmt': '{{Front}}', 'afmt': '{{FrontSide}}<hr id=answer>{{Back}}'
+        }]
+    }
+    conf = {
+        'activeDecks': [deck_id], 'curDeck': deck_id, 'curModel': str(MODEL_ID), 'nextPos': 1,
+        'newSpread': 0, 'collapseTime': 1200, 'timeLim': 0, 'estTimes': True, 'dueCounts': True,
+        'addToCur': True, 'sortType': 'noteFld', 'sortBackwards': False
+    }
+    dconf = {'1': {
+        'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0, 'maxTaken': 60, 'autoplay': True, 'timer': 0, 'replayq': True,
+        'new': {'delays': [1, 10], 'ints': [1, 4, 7], 'initialFactor': 2500, 'order': 1, 'perDay': 20,
+                'bury': True, 'separate': True},
+        'rev': {'perDay': 100, 'ease4': 1.3, 'fuzz': 0.05, 'ivlFct': 1, 'maxIvl': 36500, 'minSpace': 1, 'bury': True},
+        'lapse': {'delays': [10], 'mult': 0, 'minInt': 1, 'leechFails': 8, 'leechAction': 0}
+    }}
+    decks = {'1': _deck_json(1, 'Default', now), str(deck_id): _deck_json(deck_id, deck_title, now)}
+    return (1, now - now % 86400, now, now * 1000, 11, 0, 0, 0,
+            json.dumps(conf), json.dumps({str(MODEL_ID): model}), json.dumps(decks), json.dumps(dconf), '{}')
+
+
+def _field(text):
+    # Anki fields are HTML
+    return html.escape(text or '').replace('\n', '<br>')
+
+
+def _checksum(text):
+    # Anki's duplicate-check checksum: first 8 hex digits of SHA-1 of the sort field
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def write_collection(path, deck_id, deck_title, card_batches):
+    # Build collection.anki2 at `path` from batches of (card_id, question, answer) rows
+    now = int(time.time())
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.execute('INSERT INTO col VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)', _collection_row(deck_id, deck_title, now))
+        base_id = now * 1000  # note/card ids are millisecond timestamps in Anki
+        position = 0
+        for batch in card_batches:
+            notes, cards = [], []
+            for card_id, question, answer in batch:
+                position += 1
+                front, back = _field(question), _field(answer)
+                guid = hashlib.sha1(f'study-cards:{card_id}'.encode('utf-8')).hexdigest()[:10]
+                notes.append((base_id + position, guid, MODEL_ID, now, -1, '', f'{front}\x1f{back}',
+                              front, _checksum(front), 0, ''))
+                cards.append((base_id + position, base_id + position, deck_id, 0, now, -1,
+                              0, 0, position, 0, 0, 0, 0, 0, 0, 0, 0, ''))
+            conn.executemany('INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)', notes)
+            conn.executemany('INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', cards)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class _ChunkSink:
+    # Write-only, non-seekable file object: zipfile falls back to data descriptors and
+    # everything it writes is collected here until the generator hands it out
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_apkg(deck_id, deck_title, card_batches):
+    # Generator of .apkg bytes; the temporary collection is removed once the stream ends
+    workdir = tempfile.mkdtemp(prefix='apkg_')
+    try:
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('media', '{}')
+            yield sink.drain()  # first bytes go out before the collection is built
+
+            collection = os.path.join(workdir, 'collection.anki2')
+            write_collection(collection, deck_id, deck_title, card_batches)
+            with open(collection, 'rb') as source, archive.open('collection.anki2', 'w') as target:
+                while True:
+                    block = source.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    target.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        yield sink.drain()  # central directory
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
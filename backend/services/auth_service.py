@@ -3,16 +3,36 @@
 
 from datetime import datetime, timedelta
 import secrets
-from flask_jwt_extended import create_access_token
+import time
+from core.security import issue_access_token, invalidate_token_version
+from core.passwords import PasswordHasherBusy, needs_rehash
 from models import User, RefreshToken, UserStats, db
+from flask import current_app
 
 
 class AuthService:
     # Receives repository instances via constructor injection
-    def __init__(self, user_repo, token_repo, stats_repo):
-        self.user_repo = user_repo    # users table
-        self.token_repo = token_repo  # refresh_tokens table
-        self.stats_repo = stats_repo  # initialize user stats on registration
+    def __init__(self, user_repo, token_repo, stats_repo, metrics_repo, leaderboard_repo):
+        self.user_repo = user_repo        # users table
+        self.token_repo = token_repo      # refresh_tokens table
+        self.stats_repo = stats_repo      # initialize user stats on registration
+        self.metrics_repo = metrics_repo  # admin dashboard rollups (storage used)
+        self.leaderboard_repo = leaderboard_repo  # leaderboard rank histograms
+
+    def _issue_refresh_token(self, user_id):
+        # Create a refresh token with a 7-day TTL and enforce the per-user cap on active tokens
+        refresh_token = secrets.token_hex(32)  # 64-char random hex string
+        now = datetime.utcnow()
+        self.token_repo.add(RefreshToken(
+            token=refresh_token,
+            user_id=user_id,
+            expires_at=now + timedelta(days=7)
+        ))
+        db.session.flush()
+        max_active = current_app.config.get('MAX_ACTIVE_REFRESH_TOKENS', 10)
+        if max_active:
+            self.token_repo.delete_excess_active(user_id, max_active, now)
+        return refresh_token
 
     def register(self, username, email, password):
         # Verify uniqueness of username and email, create user, issue token pair
@@ -22,7 +42,10 @@ class AuthService:
             return {'error': 'Email already exists'}, 400
 
         new_user = User(username=username, email=email)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except PasswordHasherBusy:
+            return {'error': 'Server is busy, please try again'}, 503
         self.user_repo.add(new_user)
         db.session.flush()  # flush to get the auto-incremented user ID
 
@@ -31,16 +54,8 @@ class AuthService:
         self.stats_repo.add_stats(user_stats)
         db.session.commit()
 
-        access_token = create_access_token(identity=str(new_user.id))
-        refresh_token = secrets.token_hex(32)  # 64-char random hex string
-
-        # Persist the refresh token with a 7-day TTL
-        new_refresh_token = RefreshToken(
-            token=refresh_token,
-            user_id=new_user.id,
-            expires_at=datetime.utcnow() + timedelta(days=7)
-        )
-        self.token_repo.add(new_refresh_token)
+        access_token = issue_access_token(new_user)
+        refresh_token = self._issue_refresh_token(new_user.id)
         db.session.commit()
 
         return {
@@ -53,19 +68,19 @@ class AuthService:
     def login(self, username, password):
         # Validate credentials and return a new token pair
         user = self.user_repo.get_by_username(username)
-        if not user or not user.check_password(password):
-            # Generic message to prevent username enumeration
-            return {'error': 'Invalid username or password'}, 401
-
-        access_token = create_access_token(identity=str(user.id))
-        refresh_token = secrets.token_hex(32)
-
-        new_refresh_token = RefreshToken(
-            token=refresh_token,
-            user_id=user.id,
-            expires_at=datetime.utcnow() + timedelta(days=7)
-        )
-        self.token_repo.add(new_refresh_token)
+        try:
+            if not user or not user.check_password(password):
+                # Generic message to prevent username enumeration
+                return {'error': 'Invalid username or password'}, 401
+            # Hashes made with other parameters than PASSWORD_HASH_METHOD are upgraded (or downgraded)
+            # while the plain password is at hand
+            if needs_rehash(user.password_hash):
+                user.set_password(password)
+        except PasswordHasherBusy:
+            return {'error': 'Server is busy, please try again'}, 503
+
+        access_token = issue_access_token(user)
+        refresh_token = self._issue_refresh_token(user.id)
         db.session.commit()
 
         return {
@@ -87,18 +102,12 @@ class AuthService:
             return {'error': 'Refresh token expired'}, 401
 
         # Revoke the old token and issue a new one (enforces secure rotation)
-        new_refresh_token_str = secrets.token_hex(32)
         token_entry.revoked = True
-
-        new_token_entry = RefreshToken(
-            token=new_refresh_token_str,
-            user_id=token_entry.user_id,
-            expires_at=datetime.utcnow() + timedelta(days=7)
-        )
-        self.token_repo.add(new_token_entry)
+        new_refresh_token_str = self._issue_refresh_token(token_entry.user_id)
         db.session.commit()
 
-        access_token = create_access_token(identity=str(token_entry.user_id))
+        # Claims are taken from the current user row, so a changed role applies from here on
+        access_token = issue_access_token(self.user_repo.get_by_id(token_entry.user_id))
 
         return {
             'access_token': access_token,
@@ -114,11 +123,32 @@ class AuthService:
                 db.session.commit()
         return {'message': 'Logged out successfully'}, 200
 
+    def prune_refresh_tokens(self, batch_size=1000, pause_seconds=0.0):
+        # Delete expired and revoked refresh tokens in short batches, committing after each one
+        now = datetime.utcnow()
+        total = 0
+        while True:
+            deleted = self.token_repo.prune_batch(now, batch_size)
+            db.session.commit()
+            total += deleted
+            if deleted < batch_size:
+                return total
+            if pause_seconds:
+                time.sleep(pause_seconds)  # give concurrent writers a chance between batches
+
     def delete_user(self, user_id):
-        # Delete the account; cascades to all user decks and cards
+        # Delete the account; the database cascades to decks, cards, sessions, stats and tokens.
+        # Attachment object names are collected first so MinIO can be cleaned up afterwards.
         user = self.user_repo.get_by_id(user_id)
         if not user:
             return {'error': 'User not found'}, 404
+        file_objects = self.user_repo.get_file_objects(user_id)
+        self.leaderboard_repo.remove_user(user_id)
         self.user_repo.delete(user)
+        self.metrics_repo.increment_total('storage_bytes', -sum(size for _, size in file_objects))
         db.session.commit()
+        invalidate_token_version(user_id)
+
+        from services.deck_service import remove_storage_objects
+        remove_storage_objects([name for name, _ in file_objects])
         return {'message': 'User deleted successfully'}, 200
@@ -2,27 +2,68 @@
 
 from models import db, Deck, Card, UserStats, DeckFile
 import io
+import csv
 import time
-import urllib3
-from minio import Minio
+from datetime import datetime
+from flask import current_app
 from config import Config
-from ai_service import generate_cards_from_text
-import PyPDF2
+from repositories.search_repository import build_stems, highlight
+from repositories.deck_repository import deck_row_to_dict, encode_cursor, decode_cursor
+from repositories.card_repository import CARD_KEYS
+from services.anki_package import stream_apkg
+
+# MinIO client - S3-compatible object storage. Built on first use: minio, urllib3 and PyPDF2 are
+# only imported by the requests that need them, which keeps worker startup cheap.
+_minio_client = None
+
+
+def get_minio_client():
+    global _minio_client
+    if _minio_client is None:
+        import urllib3
+        from minio import Minio
+        # Short timeout for MinIO so the backend doesn't hang if the storage is down
+        http_client = urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=2.0, read=2.0),
+            retries=urllib3.Retry(total=0)
+        )
+        _minio_client = Minio(
+            Config.MINIO_ENDPOINT,
+            access_key=Config.MINIO_ACCESS_KEY,
+            secret_key=Config.MINIO_SECRET_KEY,
+            secure=Config.MINIO_SECURE,
+            http_client=http_client
+        )
+    return _minio_client
+
+
+def csv_chunks(card_batches):
+    # One CSV chunk (question, answer per line) per batch of (id, question, answer) rows
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for batch in card_batches:
+        writer.writerows((question, answer) for _, question, answer in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def remove_storage_objects(object_names):
+    # Best-effort bulk removal of objects from MinIO once their DB rows are gone
+    if not object_names:
+        return
+    try:
+        from minio.deleteobjects import DeleteObject
+        errors = get_minio_client().remove_objects(Config.MINIO_BUCKET, [DeleteObject(name) for name in object_names])
+        for error in errors:  # remove_objects is lazy - iterating performs the deletion
+            print(f"MinIO delete error (non-fatal): {error}")
+    except Exception as e:
+        print(f"MinIO delete error (non-fatal): {e}")
 
-# Short timeout for MinIO so the backend doesn't hang if the storage is down
-http_client = urllib3.PoolManager(
-    timeout=urllib3.Timeout(connect=2.0, read=2.0),
-    retries=urllib3.Retry(total=0)
-)
 
-# MinIO client - S3-compatible object storage
-minio_client = Minio(
-    Config.MINIO_ENDPOINT,
-    access_key=Config.MINIO_ACCESS_KEY,
-    secret_key=Config.MINIO_SECRET_KEY,
-    secure=Config.MINIO_SECURE,
-    http_client=http_client
-)
+def is_card_id(value):
+    # JSON ids must be integers; bool is an int subclass, so true/false would otherwise pass as ids 1 and 0
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
 def extract_text_from_pdf(file_source):
@@ -35,6 +76,7 @@ def extract_text_from_pdf(file_source):
         else:
             file_obj = file_source
 
+        import PyPDF2
         pdf_reader = PyPDF2.PdfReader(file_obj)
         for page_num, page in enumerate(pdf_reader.pages):
             page_text = page.extract_text()
@@ -51,11 +93,14 @@ def extract_text_from_pdf(file_source):
 
 class DeckService:
     # Receives repositories via constructor injection (dependency injection)
-    def __init__(self, deck_repo, card_repo, user_repo, stats_repo):
-        self.deck_repo = deck_repo    # deck CRUD
-        self.card_repo = card_repo    # card CRUD
-        self.user_repo = user_repo    # user lookups
-        self.stats_repo = stats_repo  # update deck count in user stats
+    def __init__(self, deck_repo, card_repo, user_repo, stats_repo, metrics_repo, deck_cache, change_log_repo):
+        self.deck_repo = deck_repo        # deck CRUD
+        self.card_repo = card_repo        # card CRUD
+        self.user_repo = user_repo        # user lookups
+        self.stats_repo = stats_repo      # update deck count in user stats
+        self.metrics_repo = metrics_repo  # admin dashboard rollups
+        self.deck_cache = deck_cache      # serialized deck payloads (LRU)
+        self.change_log_repo = change_log_repo  # delta sync log
 
     def upload_and_generate(self, user_id, file, filename, mode):
         # Main upload flow: read PDF, store in MinIO, extract text, generate cards via AI
@@ -70,6 +115,7 @@ class DeckService:
         # Upload PDF to MinIO - if this fails we log and continue without blocking
         bucket_name = Config.MINIO_BUCKET
         try:
+            minio_client = get_minio_client()
             if not minio_client.bucket_exists(bucket_name):
                 minio_client.make_bucket(bucket_name)
             minio_client.put_object(
@@ -90,6 +136,7 @@ class DeckService:
             return {'error': 'Не удалось извлечь текст из PDF или текст слишком короткий'}, 400
 
         # Send text to AI and get back a list of question-answer cards
+        from ai_service import generate_cards_from_text
         result = generate_cards_from_text(text, mode)
         if 'error' in result:
             return result, 500
@@ -121,6 +168,13 @@ class DeckService:
         if user_stats:
             user_stats.total_decks_created += 1
 
+        today = datetime.utcnow().date()
+        self.metrics_repo.increment(today, 'decks_created')
+        self.metrics_repo.increment(today, 'ai_generations')
+
+        db.session.flush()  # card IDs for the change log
+        self.change_log_repo.record(user_id, [('deck', deck.id, 'upsert', deck.id), ('stats', user_id, 'upsert', None)]
+                                    + [('card', card.id, 'upsert', deck.id) for card in created_cards])
         db.session.commit()
 
         # Patch the result cards with their real database IDs
@@ -134,16 +188,88 @@ class DeckService:
     def get_user_decks(self, user_id, sort_by, page, per_page,
                        search=None, min_cards=None, max_cards=None,
                        date_from=None, date_to=None):
-        # Return a paginated list of decks for a user with optional filtering
-        return self.deck_repo.get_user_decks(
+        # Return (decks, total, pages) for one page of the user's decks with optional filtering
+        pagination = self.deck_repo.get_user_decks(
             user_id, sort_by, page, per_page,
             search=search, min_cards=min_cards, max_cards=max_cards,
             date_from=date_from, date_to=date_to
         )
+        return [deck_row_to_dict(row) for row in pagination.items], pagination.total, pagination.pages
+
+    def get_user_decks_keyset(self, user_id, sort_by, limit, cursor=None, with_total=False,
+                              search=None, min_cards=None, max_cards=None,
+                              date_from=None, date_to=None):
+        # Cursor-paginated variant: returns (decks, next_cursor, total or None)
+        rows, next_cursor, total = self.deck_repo.get_user_decks_keyset(
+            user_id, sort_by, limit, cursor=cursor, with_total=with_total,
+            search=search, min_cards=min_cards, max_cards=max_cards,
+            date_from=date_from, date_to=date_to
+        )
+        return [deck_row_to_dict(row) for row in rows], next_cursor, total
 
     def get_deck(self, deck_id):
         return self.deck_repo.get_by_id(deck_id)
 
+    def get_deck_marker(self, deck_id):
+        return self.deck_repo.get_version(deck_id)
+
+    def get_user_decks_marker(self, user_id):
+        return self.deck_repo.get_user_decks_marker(user_id)
+
+    def get_deck_payload(self, deck_id, include_cards=True, fields=None, cards_limit=None, cards_cursor=None):
+        # JSON body of the deck with its cards. Repeat opens are served from the LRU cache after
+        # a single-row version check; the deck and its cards are only loaded on a miss.
+        # fields (card columns), cards_limit/cards_cursor (keyset page of cards) and include_cards=False
+        # shrink the document to what the client renders; each variant is cached separately.
+        # Raises ValueError for an invalid cards_cursor.
+        after_id = decode_cursor(cards_cursor)[1] if cards_cursor else None
+        version = self.deck_repo.get_version(deck_id)
+        if version is None:
+            return None
+        keys = tuple(fields) if fields else CARD_KEYS
+        cache_key = deck_id if (include_cards, fields, cards_limit, cards_cursor) == (True, None, None, None) \
+            else (deck_id, include_cards, keys, cards_limit, after_id)
+        payload = self.deck_cache.get(cache_key, version)
+        if payload is None:
+            # Plain rows instead of ORM entities: no identity map, no per-card Python accuracy
+            deck = self.deck_repo.get_summary(deck_id)
+            if deck is None:
+                return None
+            result = deck_row_to_dict(deck)
+            if include_cards:
+                # id is always selected (first) for the cursor but only returned if requested
+                selected = keys if 'id' in keys else ('id',) + keys
+                skip = len(selected) - len(keys)
+                fetch = cards_limit + 1 if cards_limit else None  # one extra row tells if there is a next page
+                rows = self.card_repo.get_deck_card_rows(deck_id, selected, limit=fetch, after_id=after_id)
+                if cards_limit:
+                    result['next_cards_cursor'] = None
+                    if len(rows) > cards_limit:
+                        rows = rows[:cards_limit]
+                        result['next_cards_cursor'] = encode_cursor([None, rows[-1][selected.index('id')]])
+                result['cards'] = [dict(zip(keys, row[skip:])) for row in rows]
+            payload = current_app.json.dumps(result).encode('utf-8')
+            self.deck_cache.set(cache_key, version, payload)
+        return payload
+
+    def export_deck(self, deck_id, current_user_id, export_format='csv'):
+        # Ownership check up front; the returned 'chunks' generator reads the cards lazily in
+        # EXPORT_BATCH_SIZE batches while the response is being sent
+        deck = self.deck_repo.get_summary(deck_id)
+        if not deck:
+            return {'error': 'Not found'}, 404
+        if deck.user_id != current_user_id:
+            return {'error': 'Unauthorized'}, 403
+
+        batches = self.card_repo.iter_deck_card_batches(deck_id, current_app.config.get('EXPORT_BATCH_SIZE', 500))
+        if export_format == 'apkg':
+            # Anki deck id: stable per deck (creation time in ms, like ids Anki generates itself)
+            anki_deck_id = int(deck.created_at.timestamp() * 1000)
+            chunks = stream_apkg(anki_deck_id, deck.title, batches)
+        else:
+            chunks = csv_chunks(batches)
+        return {'title': deck.title, 'chunks': chunks}, 200
+
     def update_deck(self, deck_id, current_user_id, data):
         # Update deck title/description/emoji - only the owner can do this
         deck = self.deck_repo.get_by_id(deck_id)
@@ -159,18 +285,45 @@ class DeckService:
         if 'emoji' in data:
             deck.emoji = data['emoji']
 
+        self.deck_repo.bump_version(deck_id)
+        self.change_log_repo.record(deck.user_id, [('deck', deck_id, 'upsert', deck_id)])
         db.session.commit()
         return deck.to_dict(), 200
 
     def delete_deck(self, deck_id):
-        # Delete a deck; all child cards are removed via cascade
+        # Delete a deck; child cards, files and sessions are removed by the database cascade.
+        # Attachment object names are collected first so MinIO can be cleaned up afterwards.
         deck = self.deck_repo.get_by_id(deck_id)
         if not deck:
             return {'error': 'Not found'}, 404
+        file_objects = self.deck_repo.get_file_objects(deck_id)
+        self.change_log_repo.forget_deck_children(deck.user_id, deck_id)
+        self.change_log_repo.record(deck.user_id, [('deck', deck_id, 'delete', deck_id)])
         self.deck_repo.delete(deck)
+        self.metrics_repo.increment_total('storage_bytes', -sum(size for _, size in file_objects))
         db.session.commit()
+        self.deck_cache.discard(deck_id)
+        remove_storage_objects([name for name, _ in file_objects])
         return {'message': 'Колода удалена'}, 200
 
+    def search_cards(self, user_id, term, limit, cursor=None):
+        # Search cards across all of the user's decks; matched words are wrapped in <mark> (HTML-escaped)
+        rows, next_cursor = self.card_repo.search(user_id, term, limit, cursor=cursor)
+        stems = build_stems(term)
+        cards = []
+        for card, deck_title, score in rows:
+            cards.append({
+                **card.to_dict(),
+                'deck_title': deck_title,
+                'score': score,
+                'highlight': {
+                    'question': highlight(card.question, stems),
+                    'answer': highlight(card.answer, stems),
+                    'source': highlight(card.source, stems)
+                }
+            })
+        return {'cards': cards, 'next_cursor': next_cursor}, 200
+
     def update_card(self, card_id, data):
         card = self.card_repo.get_by_id(card_id)
         if not card:
@@ -183,6 +336,9 @@ class DeckService:
         if 'source' in data:
             card.source = data['source']
 
+        self.deck_repo.bump_version(card.deck_id)
+        self.change_log_repo.record(self.deck_repo.get_owner_id(card.deck_id),
+                                    [('card', card.id, 'upsert', card.deck_id)])
         db.session.commit()
         return card.to_dict(), 200
 
@@ -191,6 +347,10 @@ class DeckService:
         if not card:
             return {'error': 'Not found'}, 404
         self.card_repo.delete(card)
+        self.deck_repo.bump_version(card.deck_id)
+        self.change_log_repo.record(self.deck_repo.get_owner_id(card.deck_id), [
+            ('card', card.id, 'delete', card.deck_id), ('deck', card.deck_id, 'upsert', card.deck_id)
+        ])
         db.session.commit()
         return {'message': 'Карточка удалена'}, 200
 
@@ -207,9 +367,92 @@ class DeckService:
             deck_id=deck_id
         )
         self.card_repo.add(card)
+        self.deck_repo.bump_version(deck_id)
+        db.session.flush()
+        self.change_log_repo.record(deck.user_id, [
+            ('card', card.id, 'upsert', deck_id), ('deck', deck_id, 'upsert', deck_id)
+        ])
         db.session.commit()
         return card.to_dict(), 201
 
+    def batch_cards(self, deck_id, current_user_id, operations):
+        # Mixed create/update/delete operations for one deck: ownership is checked once, valid
+        # operations are applied with one INSERT, one UPDATE and one DELETE in a single transaction,
+        # and every operation gets its own result (invalid ones are reported, not applied)
+        deck = self.deck_repo.get_summary(deck_id)
+        if not deck:
+            return {'error': 'Not found'}, 404
+        if deck.user_id != current_user_id:
+            return {'error': 'Unauthorized'}, 403
+        if not isinstance(operations, list) or not operations:
+            return {'error': 'operations должен быть непустым списком'}, 400
+        max_operations = current_app.config.get('CARD_BATCH_MAX_OPERATIONS', 500)
+        if len(operations) > max_operations:
+            return {'error': f'Не более {max_operations} операций за запрос'}, 400
+
+        referenced = {op.get('id') for op in operations
+                      if isinstance(op, dict) and op.get('op') in ('update', 'delete') and is_card_id(op.get('id'))}
+        existing = self.card_repo.get_ids_in_deck(deck_id, referenced)
+
+        results = [None] * len(operations)
+        creates, updates, deletes, touched = [], {}, set(), set()
+        for index, op in enumerate(operations):
+            kind = op.get('op') if isinstance(op, dict) else None
+            fields = {f: op[f] for f in ('question', 'answer', 'source') if isinstance(op, dict) and f in op}
+            error, status = None, 400
+            if kind not in ('create', 'update', 'delete'):
+                error = 'op должен быть create, update или delete'
+            elif any(not isinstance(value, str) for value in fields.values()):
+                error = 'Поля карточки должны быть строками'
+            elif 'source' in fields and len(fields['source']) > 200:
+                error = 'source не длиннее 200 символов'
+            elif kind == 'create':
+                if not fields.get('question', '').strip() or not fields.get('answer', '').strip():
+                    error = 'Для создания нужны question и answer'
+            elif not is_card_id(op.get('id')) or op['id'] not in existing:
+                error, status = 'Карточка не найдена в этой колоде', 404
+            elif op['id'] in touched:
+                error = 'Карточка уже изменена в этом пакете'
+            elif kind == 'update' and not fields:
+                error = 'Нет полей для изменения'
+            elif kind == 'update' and any(not fields[f].strip() for f in ('question', 'answer') if f in fields):
+                error = 'question и answer не могут быть пустыми'
+
+            if error:
+                results[index] = {'index': index, 'op': kind, 'status': status, 'error': error}
+            elif kind == 'create':
+                creates.append((index, {'question': fields['question'], 'answer': fields['answer'],
+                                        'source': fields.get('source', 'Создано вручную')}))
+            elif kind == 'update':
+                touched.add(op['id'])
+                updates[op['id']] = fields
+                results[index] = {'index': index, 'op': kind, 'status': 200, 'id': op['id']}
+            else:
+                touched.add(op['id'])
+                deletes.add(op['id'])
+                results[index] = {'index': index, 'op': kind, 'status': 200, 'id': op['id']}
+
+        created_ids = self.card_repo.create_many(deck_id, [card for _, card in creates])
+        for (index, _), card_id in zip(creates, created_ids):
+            results[index] = {'index': index, 'op': 'create', 'status': 201, 'id': card_id}
+        self.card_repo.update_many(deck_id, updates)
+        self.card_repo.delete_many(deck_id, deletes)
+        if creates or updates or deletes:
+            self.deck_repo.bump_version(deck_id)
+            self.change_log_repo.record(current_user_id,
+                                        [('card', card_id, 'upsert', deck_id) for card_id in created_ids + list(updates)]
+                                        + [('card', card_id, 'delete', deck_id) for card_id in deletes]
+                                        + [('deck', deck_id, 'upsert', deck_id)])
+        db.session.commit()
+
+        # Current state of created/updated cards, loaded with one query
+        cards = self.card_repo.get_rows_by_ids(list(updates) + created_ids)
+        for result in results:
+            if result['status'] in (200, 201) and result['op'] != 'delete':
+                result['card'] = cards.get(result['id'])
+        applied = sum(1 for result in results if result['status'] in (200, 201))
+        return {'results': results, 'applied': applied, 'failed': len(results) - applied}, 200
+
     def upload_deck_file(self, deck_id, current_user_id, file, filename):
         # Check deck ownership
         deck = self.deck_repo.get_by_id(deck_id)
@@ -235,6 +478,7 @@ class DeckService:
         bucket_name = Config.MINIO_BUCKET
 
         try:
+            minio_client = get_minio_client()
             if not minio_client.bucket_exists(bucket_name):
                 minio_client.make_bucket(bucket_name)
             minio_client.put_object(
@@ -256,6 +500,9 @@ class DeckService:
             mime_type=file.content_type
         )
         db.session.add(deck_file)
+        self.metrics_repo.increment_total('storage_bytes', file_size)
+        db.session.flush()
+        self.change_log_repo.record(current_user_id, [('file', deck_file.id, 'upsert', deck_id)])
         db.session.commit()
 
         return deck_file.to_dict(), 201
@@ -281,7 +528,7 @@ class DeckService:
 
         try:
             # Presigned URL is valid for 1 hour
-            url = minio_client.presigned_get_object(
+            url = get_minio_client().presigned_get_object(
                 Config.MINIO_BUCKET,
                 deck_file.object_name,
             )
@@ -300,11 +547,13 @@ class DeckService:
 
         # Remove from MinIO
         try:
-            minio_client.remove_object(Config.MINIO_BUCKET, deck_file.object_name)
+            get_minio_client().remove_object(Config.MINIO_BUCKET, deck_file.object_name)
         except Exception as e:
             print(f"MinIO delete error (non-fatal): {e}")
 
         # Remove from DB
         db.session.delete(deck_file)
+        self.metrics_repo.increment_total('storage_bytes', -deck_file.size_bytes)
+        self.change_log_repo.record(current_user_id, [('file', deck_file.id, 'delete', deck_file.deck_id)])
         db.session.commit()
         return {'message': 'Файл удалён'}, 200
@@ -0,0 +1,243 @@
+# Service for bulk deck import from CSV/TSV files and Anki packages (.apkg) - no AI involved.
+# The upload is saved to a temporary file and parsed as a stream by a background task;
+# cards are inserted IMPORT_BATCH_SIZE at a time (COPY / executemany), and every batch is
+# committed together with the job's progress so the client can poll GET /api/imports/<id>.
+
+import csv
+import html
+import io
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime
+from flask import current_app
+from models import db, Deck, ImportJob
+from core.tasks import run_in_background
+
+IMPORT_FORMATS = {'.csv': 'csv', '.tsv': 'tsv', '.txt': 'tsv', '.apkg': 'apkg'}
+
+# Header rows that are skipped instead of being imported as a card
+_HEADERS = {('question', 'answer'), ('вопрос', 'ответ'), ('front', 'back')}
+# Anki plain-text exports start with "#separator:tab", "#html:true", ... lines
+_ANKI_DIRECTIVE = re.compile(r'^#[a-z ]+:', re.IGNORECASE)
+_BREAK_TAGS = re.compile(r'<\s*(br|/div|/p|/li)\s*/?\s*>', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>')
+_SOUND = re.compile(r'\[sound:[^\]]*\]')
+
+SOURCE_MAX_LENGTH = 200  # cards.source column size
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def _html_to_text(value):
+    # Anki fields are HTML; cards here are plain text (media references are dropped)
+    value = _BREAK_TAGS.sub('\n', value)
+    value = _SOUND.sub('', _TAGS.sub('', value))
+    return html.unescape(value).strip()
+
+
+def read_delimited(path, source_format):
+    # Returns (generator of (question, answer, source), progress function 0..1).
+    # Tab-separated files use tabs; for CSV the delimiter is sniffed (',' or ';' from Excel).
+    size = os.path.getsize(path) or 1
+    raw = open(path, 'rb')
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    if source_format == 'tsv':
+        delimiter = '\t'
+    else:
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t').delimiter
+        except csv.Error:
+            delimiter = ','
+
+    def rows():
+        try:
+            at_start = True
+            for row in csv.reader(text, delimiter=delimiter):
+                if at_start and row and _ANKI_DIRECTIVE.match(row[0]):
+                    continue
+                cells = [cell.strip() for cell in row]
+                if at_start and tuple(cell.lower() for cell in cells[:2]) in _HEADERS:
+                    at_start = False
+                    continue
+                at_start = False
+                if len(cells) < 2 or not cells[0] or not cells[1]:
+                    continue
+                source = cells[2][:SOURCE_MAX_LENGTH] if len(cells) > 2 and cells[2] else 'Импорт из файла'
+                yield cells[0], cells[1], source
+        finally:
+            text.close()
+
+    return rows(), lambda: min(raw.tell() / size, 1.0) if not raw.closed else 1.0
+
+
+def read_apkg(path, workdir):
+    # Returns (generator of (question, answer, source), progress function 0..1) over the notes
+    # of the package's collection; the first two fields of each note become question and answer
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        # Newer Anki exports carry the real collection as .anki21 next to a placeholder .anki2
+        member = next((name for name in ('collection.anki21', 'collection.anki2') if name in names), None)
+        if member is None:
+            if 'collection.anki21b' in names:
+                raise ImportFileError('Формат Anki 2.1.50+ не поддерживается - '
+                                      'экспортируйте колоду с опцией «Поддержка старых версий Anki»')
+            raise ImportFileError('В пакете .apkg нет коллекции Anki')
+        collection = archive.extract(member, workdir)
+
+    conn = sqlite3.connect(collection)
+    total = conn.execute('SELECT count(*) FROM notes').fetchone()[0] or 1
+    done = [0]
+
+    def rows():
+        try:
+            for (fields,) in conn.execute('SELECT flds FROM notes ORDER BY id'):
+                done[0] += 1
+                parts = fields.split('\x1f')
+                if len(parts) < 2:
+                    continue
+                question, answer = _html_to_text(parts[0]), _html_to_text(parts[1])
+                if question and answer:
+                    yield question, answer, 'Импорт из Anki'
+        finally:
+            conn.close()
+
+    return rows(), lambda: done[0] / total
+
+
+class ImportService:
+    # Receives repositories via constructor injection (dependency injection)
+    def __init__(self, deck_repo, card_repo, stats_repo, metrics_repo, import_repo, change_log_repo):
+        self.deck_repo = deck_repo        # target deck
+        self.card_repo = card_repo        # batched card inserts
+        self.stats_repo = stats_repo      # total decks created
+        self.metrics_repo = metrics_repo  # admin dashboard rollups
+        self.import_repo = import_repo    # import job progress
+        self.change_log_repo = change_log_repo  # delta sync log
+
+    def start_import(self, user_id, file, filename, title=None):
+        # Save the upload, create the target deck and the job, and hand the parsing to a background task
+        extension = os.path.splitext(filename)[1].lower()
+        source_format = IMPORT_FORMATS.get(extension)
+        if not source_format:
+            return {'error': 'Поддерживаются файлы .csv, .tsv, .txt и .apkg'}, 400
+
+        fd, path = tempfile.mkstemp(prefix='import_', suffix=extension)
+        os.close(fd)
+        file.save(path)
+
+        deck = Deck(
+            title=(title or os.path.splitext(filename)[0] or 'Импорт')[:200],
+            description=f"Импортировано из файла {filename}",
+            user_id=user_id
+        )
+        self.deck_repo.add(deck)
+        db.session.flush()
+        job = ImportJob(user_id=user_id, deck_id=deck.id, filename=filename[:500], source_format=source_format)
+        self.import_repo.add(job)
+
+        user_stats = self.stats_repo.get_by_user_id(user_id)
+        if user_stats:
+            user_stats.total_decks_created += 1
+        self.metrics_repo.increment(datetime.utcnow().date(), 'decks_created')
+        self.change_log_repo.record(user_id, [('deck', deck.id, 'upsert', deck.id), ('stats', user_id, 'upsert', None)])
+        db.session.commit()
+
+        run_in_background(self.run_import, job.id, path)
+        db.session.refresh(job)  # the task may already have finished (inline mode)
+        return {'job': job.to_dict()}, 202
+
+    def get_job(self, job_id, current_user_id):
+        job = self.import_repo.get_by_id(job_id)
+        if not job or job.user_id != current_user_id:
+            return {'error': 'Not found'}, 404
+        return job.to_dict(), 200
+
+    def run_import(self, job_id, path):
+        # Background task body: stream-parse the file and insert the cards batch by batch
+        job = self.import_repo.get_by_id(job_id)
+        job.status = 'running'
+        db.session.commit()
+
+        workdir = tempfile.mkdtemp(prefix='import_')
+        try:
+            if job.source_format == 'apkg':
+                rows, progress = read_apkg(path, workdir)
+            else:
+                rows, progress = read_delimited(path, job.source_format)
+
+            batch, last_id = [], 0
+            batch_size = current_app.config.get('IMPORT_BATCH_SIZE', 1000)
+            for card in rows:
+                batch.append(card)
+                if len(batch) >= batch_size:
+                    last_id = self._write_batch(job, batch, progress(), last_id)
+                    batch = []
+            self._write_batch(job, batch, 1.0, last_id)
+
+            if not job.cards_imported:
+                raise ImportFileError('В файле не найдено ни одной карточки (нужны столбцы: вопрос, ответ)')
+            job.status = 'done'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if isinstance(e, UnicodeDecodeError):
+                message = 'Файл должен быть в кодировке UTF-8'
+            elif isinstance(e, (zipfile.BadZipFile, sqlite3.DatabaseError)):
+                message = 'Файл .apkg поврежден или не является пакетом Anki'
+            elif isinstance(e, ImportFileError):
+                message = str(e)
+            else:
+                print(f"Import {job_id} failed: {e}")
+                message = 'Не удалось импортировать файл'
+            self._fail(job_id, message)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _write_batch(self, job, batch, fraction, last_id):
+        # One COPY/executemany per batch, committed with the job's progress and change log entries;
+        # returns the highest card id seen so the next batch only logs its own cards
+        if batch:
+            self.card_repo.bulk_insert(job.deck_id, batch)
+            self.deck_repo.bump_version(job.deck_id)
+            job.cards_imported += len(batch)
+            card_ids = self.card_repo.get_deck_ids_after(job.deck_id, last_id)
+            self.change_log_repo.record(job.user_id, [('card', card_id, 'upsert', job.deck_id) for card_id in card_ids]
+                                        + [('deck', job.deck_id, 'upsert', job.deck_id)])
+            last_id = card_ids[-1] if card_ids else last_id
+        job.progress = fraction * 100
+        db.session.commit()
+        return last_id
+
+    def _fail(self, job_id, message):
+        # Partially imported cards are removed together with the import's deck, and the deck
+        # counted by start_import is taken back out of the user's stats and the dashboard
+        job = self.import_repo.get_by_id(job_id)
+        deck = self.deck_repo.get_by_id(job.deck_id) if job.deck_id else None
+        if deck:
+            self.change_log_repo.forget_deck_children(job.user_id, deck.id)
+            changes = [('deck', deck.id, 'delete', deck.id)]
+            user_stats = self.stats_repo.get_by_user_id(job.user_id)
+            if user_stats and user_stats.total_decks_created:
+                user_stats.total_decks_created -= 1
+                changes.append(('stats', job.user_id, 'upsert', None))
+            self.metrics_repo.increment((job.created_at or datetime.utcnow()).date(), 'decks_created', -1)
+            self.change_log_repo.record(job.user_id, changes)
+            self.deck_repo.delete(deck)
+        job.deck_id = None
+        job.status = 'failed'
+        job.error = message
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
@@ -0,0 +1,44 @@
+# SM-2 spaced-repetition scheduling (SuperMemo 2, as used by Anki's classic scheduler).
+# Pure functions over a plain state dict so the service can apply a whole session in memory
+# and write the result with one upsert.
+
+from datetime import timedelta
+
+MIN_EASE = 1.3
+DEFAULT_EASE = 2.5
+MAX_INTERVAL_DAYS = 36500  # Anki's cap; keeps next_due within datetime range
+
+# Binary answers from the study UI map onto SM-2 grades: "knew it" = 4, "didn't" = 2
+CORRECT_QUALITY = 4
+INCORRECT_QUALITY = 2
+
+
+def new_state():
+    return {'repetitions': 0, 'interval_days': 0, 'ease': DEFAULT_EASE, 'lapses': 0}
+
+
+def review(state, quality, now):
+    # Next state after one answer graded 0..5 (>= 3 counts as recalled)
+    repetitions, interval, ease, lapses = (state['repetitions'], state['interval_days'],
+                                           state['ease'], state['lapses'])
+    if quality >= 3:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = min(MAX_INTERVAL_DAYS, max(1, round(interval * ease)))
+        repetitions += 1
+    else:
+        # Forgotten: start over, see it again tomorrow
+        repetitions, interval = 0, 1
+        lapses += 1
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {
+        'repetitions': repetitions,
+        'interval_days': interval,
+        'ease': round(ease, 4),
+        'lapses': lapses,
+        'next_due': now + timedelta(days=interval),
+        'last_reviewed': now
+    }
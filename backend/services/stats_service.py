@@ -1,16 +1,31 @@
 # Service for study statistics - tracks streaks and saves study sessions
 
+from flask import current_app
 from models import db, UserStats, StudySession, Deck, Card
-from datetime import datetime
+from datetime import datetime, timedelta
+from repositories.stats_repository import DAILY_COUNTERS
+from repositories.card_repository import CARD_KEYS
+from repositories.schedule_repository import SCHEDULE_FIELDS
+from repositories.leaderboard_repository import ALL_TIME, week_period
+from services import scheduler
+
+# Cards per UPDATE statement when flushing buffered counters
+COUNTER_FLUSH_CHUNK = 1000
 
 
 class StatsService:
     # Receives repositories via constructor injection (dependency injection)
-    def __init__(self, stats_repo, deck_repo, card_repo, user_repo):
-        self.stats_repo = stats_repo  # stats CRUD
-        self.deck_repo = deck_repo    # update deck's last_studied date
-        self.card_repo = card_repo    # update per-card statistics
-        self.user_repo = user_repo    # user lookups
+    def __init__(self, stats_repo, deck_repo, card_repo, user_repo, metrics_repo, schedule_repo, change_log_repo,
+                 counter_buffer, leaderboard_repo):
+        self.stats_repo = stats_repo      # stats CRUD
+        self.deck_repo = deck_repo        # update deck's last_studied date
+        self.card_repo = card_repo        # update per-card statistics
+        self.user_repo = user_repo        # user lookups
+        self.metrics_repo = metrics_repo  # admin dashboard rollups
+        self.schedule_repo = schedule_repo  # spaced-repetition state per card and user
+        self.change_log_repo = change_log_repo  # delta sync log
+        self.counter_buffer = counter_buffer    # write-behind card counters (CARD_COUNTER_WRITE_BEHIND)
+        self.leaderboard_repo = leaderboard_repo  # incrementally maintained rankings
 
     def create_session(self, user_id, data):
         # Save study session results and update all related statistics
@@ -29,27 +44,92 @@ class StatsService:
             self.stats_repo.add_stats(user_stats)
             db.session.flush()
 
-        # Process each card result
+        # Normalize card results; malformed entries are skipped like missing cards.
+        # An optional SM-2 grade (quality 0-5) refines the binary correct flag for scheduling
+        graded = []
         for card_result in data.get('card_results', []):
-            card = self.card_repo.get_by_id(card_result['card_id'])
-            if card:
-                card.times_studied += 1
-                card.last_studied = datetime.utcnow()
-
-                if card_result['correct']:
-                    card.times_correct += 1
-                    user_stats.add_unique_card(card.id)
-                    user_stats.increment_streak(card.id)
-                else:
-                    # Reset streak on incorrect answer
-                    user_stats.reset_streak()
+            try:
+                correct = bool(card_result['correct'])
+                quality = card_result.get('quality')
+                quality = min(max(int(quality), 0), 5) if quality is not None else \
+                    (scheduler.CORRECT_QUALITY if correct else scheduler.INCORRECT_QUALITY)
+                graded.append((int(card_result['card_id']), correct, quality))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+
+        # Load all referenced cards in one IN query, keeping only those from this user's deck
+        owned_ids = self.card_repo.get_owned_ids({card_id for card_id, _, _ in graded}, data['deck_id'], user_id)
+        graded = [entry for entry in graded if entry[0] in owned_ids]
+        results = [(card_id, correct) for card_id, correct, _ in graded]
+
+        # Spaced repetition: one SM-2 review per card per session - repeats within the session are
+        # practice and the card's last answer grades it; all states are upserted at once
+        now = datetime.utcnow()
+        last_quality = {}
+        for card_id, _, quality in graded:
+            last_quality[card_id] = quality
+        states = self.schedule_repo.get_states(user_id, set(last_quality))
+        for card_id, quality in last_quality.items():
+            states[card_id] = scheduler.review(states.get(card_id) or scheduler.new_state(), quality, now)
+        self.schedule_repo.save_states(user_id, data['deck_id'], states)
+
+        # Aggregate per-card deltas and apply them as a single SQL-side UPDATE, or hand them to the
+        # write-behind buffer so hot card rows are not locked by every session
+        studied, correct_counts = {}, {}
+        for card_id, correct in results:
+            studied[card_id] = studied.get(card_id, 0) + 1
+            if correct:
+                correct_counts[card_id] = correct_counts.get(card_id, 0) + 1
+        write_behind = current_app.config.get('CARD_COUNTER_WRITE_BEHIND', False)
+        if write_behind:
+            self.counter_buffer.add(current_app._get_current_object(), studied, correct_counts, now)
+        else:
+            self.card_repo.increment_study_counters(studied, correct_counts, now)
+
+        # Streak state is computed in memory and written once
+        peak_streak = user_stats.apply_card_results(results)
 
         # Update the deck's last studied timestamp
         deck = self.deck_repo.get_by_id(data['deck_id'])
         if deck:
             deck.last_studied = datetime.utcnow()
+            self.deck_repo.bump_version(deck.id)  # card counters in the cached payload changed
 
         self.stats_repo.add_session(session)
+
+        # Delta sync: studied cards (counters), the deck (last_studied) and the stats changed;
+        # buffered counters are logged by the flush instead
+        changes = [] if write_behind else [('card', card_id, 'upsert', data['deck_id']) for card_id in studied]
+        if deck and deck.user_id == user_id:
+            changes.append(('deck', deck.id, 'upsert', deck.id))
+        changes.append(('stats', user_id, 'upsert', None))
+        self.change_log_repo.record(user_id, changes)
+
+        # Per-user history and admin dashboard rollups, written in the same transaction as the session
+        today = datetime.utcnow().date()
+        self.stats_repo.add_daily_stats(
+            user_id, today, session.deck_id,
+            sessions=1,
+            cards_studied=session.cards_studied or 0,
+            cards_correct=session.cards_correct or 0,
+            duration_seconds=session.duration_seconds or 0
+        )
+
+        # Leaderboards: all-time best streak and unique cards studied; this week's best streak and cards
+        # answered - counted from the validated answers, never from the client's cards_studied
+        week = week_period(today)
+        scores = self.leaderboard_repo.get_user_scores(user_id, periods=(ALL_TIME, week), lock=True)
+        self.leaderboard_repo.save_scores(user_id, scores, {
+            ('streak', ALL_TIME): user_stats.max_correct_streak or 0,
+            ('cards', ALL_TIME): len(user_stats.get_unique_cards_studied()),
+            ('streak', week): max(scores.get(('streak', week), 0), peak_streak),
+            ('cards', week): scores.get(('cards', week), 0) + len(results),
+        })
+
+        if self.metrics_repo.mark_active(today, user_id):
+            self.metrics_repo.increment(today, 'active_users')
+        self.metrics_repo.increment(today, 'sessions')
+        self.metrics_repo.increment(today, 'cards_studied', session.cards_studied or 0)
         db.session.commit()
 
         return {
@@ -57,20 +137,127 @@ class StatsService:
             'user_stats': user_stats.to_dict()
         }, 201
 
+    def flush_card_counters(self, studied, correct, studied_at):
+        # Write-behind flush: set-based UPDATEs in card id order (the same lock order in every worker),
+        # then invalidate the affected decks' cached payloads and log the cards for delta sync
+        card_ids = sorted(studied)
+        for start in range(0, len(card_ids), COUNTER_FLUSH_CHUNK):
+            chunk = card_ids[start:start + COUNTER_FLUSH_CHUNK]
+            self.card_repo.increment_study_counters(
+                {card_id: studied[card_id] for card_id in chunk},
+                {card_id: correct[card_id] for card_id in chunk if card_id in correct},
+                {card_id: studied_at[card_id] for card_id in chunk}
+            )
+        changes = {}
+        for card_id, deck_id, user_id in self.card_repo.get_owners(card_ids):
+            changes.setdefault(user_id, {}).setdefault(deck_id, []).append(card_id)
+        for user_id, decks in changes.items():
+            for deck_id in decks:
+                self.deck_repo.bump_version(deck_id)
+            self.change_log_repo.record(user_id, [('card', card_id, 'upsert', deck_id)
+                                                  for deck_id, ids in decks.items() for card_id in ids])
+        db.session.commit()
+
     def get_stats(self, user_id):
-        # Return user statistics, creating a fresh record if one doesn't exist yet
+        # Return user statistics; a user without a record yet gets zeroed stats. Nothing is written
+        # here (the route may read from the replica) - the record is created by the write paths
         user_stats = self.stats_repo.get_by_user_id(user_id)
         if not user_stats:
-            user_stats = UserStats(user_id=user_id)
-            self.stats_repo.add_stats(user_stats)
-            db.session.commit()
+            user_stats = UserStats(user_id=user_id, total_decks_created=0, max_correct_streak=0, current_streak=0)
         return user_stats.to_dict(), 200
 
+    def get_due_cards(self, user_id, deck_id, limit=20, include_new=True):
+        # Study queue for the deck: cards whose next review is due (most overdue first),
+        # topped up with never-reviewed cards when include_new is set
+        deck = self.deck_repo.get_summary(deck_id)
+        if not deck:
+            return {'error': 'Not found'}, 404
+        if deck.user_id != user_id:
+            return {'error': 'Unauthorized'}, 403
+
+        now = datetime.utcnow()
+        cards = []
+        for row in self.schedule_repo.get_due(user_id, deck_id, now, limit):
+            card = dict(zip(CARD_KEYS, row[:len(CARD_KEYS)]))
+            schedule = dict(zip(SCHEDULE_FIELDS, row[len(CARD_KEYS):]))
+            schedule['next_due'] = schedule['next_due'].isoformat()
+            schedule['last_reviewed'] = schedule['last_reviewed'].isoformat() if schedule['last_reviewed'] else None
+            cards.append({**card, 'schedule': schedule})
+        if include_new and len(cards) < limit:
+            cards += [{**dict(zip(CARD_KEYS, row)), 'schedule': None}
+                      for row in self.schedule_repo.get_new(user_id, deck_id, limit - len(cards))]
+
+        return {
+            'deck_id': deck_id,
+            'due_total': self.schedule_repo.count_due(user_id, deck_id, now),
+            'cards': cards
+        }, 200
+
+    def get_leaderboard(self, user_id, board, period='all', limit=10):
+        # Top-N of a leaderboard plus the caller's own rank; period is 'all' or 'week' (current ISO week)
+        key = ALL_TIME if period == 'all' else week_period(datetime.utcnow().date())
+        entries, rank, previous = [], 0, None
+        for position, (entry_user_id, username, score) in enumerate(self.leaderboard_repo.get_top(board, key, limit), 1):
+            if score != previous:
+                rank, previous = position, score
+            entries.append({'rank': rank, 'user_id': entry_user_id, 'username': username, 'score': score})
+
+        me = None
+        score = self.leaderboard_repo.get_score(board, key, user_id)
+        my_rank, total = self.leaderboard_repo.get_rank(board, key, score if score is not None else 0)
+        if score is not None:
+            me = {'rank': my_rank, 'score': score}
+        return {'board': board, 'period': key, 'entries': entries, 'me': me, 'total_users': total}, 200
+
+    def get_stats_marker(self, user_id):
+        # Users without a stats row yet all get the zeroed stats, versioned by a fixed marker
+        return self.stats_repo.get_marker(user_id) or ('new',)
+
+    def get_history(self, user_id, day_from, day_to, granularity='day'):
+        # Studied/correct/duration series per period and per deck plus a daily activity heatmap,
+        # aggregated from the user_daily_stats rollup (cost is independent of the session count)
+        def period_of(day):
+            if granularity == 'week':
+                return day - timedelta(days=day.weekday())  # Monday of that week
+            if granularity == 'month':
+                return day.replace(day=1)
+            return day
+
+        def empty():
+            return {name: 0 for name in DAILY_COUNTERS}
+
+        totals, decks, heatmap = {}, {}, {}
+        for row, deck_title in self.stats_repo.get_daily_stats(user_id, day_from, day_to):
+            period = period_of(row.day)
+            deck = decks.setdefault(row.deck_id, {'deck_id': row.deck_id, 'title': deck_title, 'periods': {}})
+            for bucket in (totals.setdefault(period, empty()), deck['periods'].setdefault(period, empty())):
+                for name in DAILY_COUNTERS:
+                    bucket[name] += getattr(row, name)
+            heatmap[row.day] = heatmap.get(row.day, 0) + row.cards_studied
+
+        def as_series(periods):
+            return [{'period': period.isoformat(), **values} for period, values in sorted(periods.items())]
+
+        return {
+            'from': day_from.isoformat(),
+            'to': day_to.isoformat(),
+            'granularity': granularity,
+            'series': as_series(totals),
+            'decks': [
+                {'deck_id': d['deck_id'], 'title': d['title'], 'series': as_series(d['periods'])}
+                for d in decks.values()
+            ],
+            'heatmap': [{'date': day.isoformat(), 'cards_studied': count} for day, count in sorted(heatmap.items())]
+        }, 200
+
     def reset_stats(self, user_id):
         # Reset all stats for the user; decks and cards are not affected
         user_stats = self.stats_repo.get_by_user_id(user_id)
         if user_stats:
             user_stats.reset_stats()
+            self.change_log_repo.record(user_id, [('stats', user_id, 'upsert', None)])
+            scores = self.leaderboard_repo.get_user_scores(user_id, periods=(ALL_TIME,), lock=True)
+            self.leaderboard_repo.save_scores(user_id, scores, {('streak', ALL_TIME): 0, ('cards', ALL_TIME): 0})
             db.session.commit()
             return {'message': 'Статистика сброшена', 'stats': user_stats.to_dict()}, 200
         return {'error': 'Статистика не найдена'}, 404
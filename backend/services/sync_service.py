@@ -0,0 +1,88 @@
+# Delta sync service - GET /api/sync returns what changed in the user's decks, cards, files and
+# stats after a cursor, so clients can keep a local copy (and study offline) instead of refetching.
+# Upserts carry the entity's current state, loaded with one query per entity type for the page;
+# a deck tombstone also removes that deck's cards and files on the client.
+
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db
+from repositories.deck_repository import encode_cursor, decode_cursor
+
+# Cursor timestamps are backdated so an entry written while the cursor was issued
+# cannot be purged before the cursor itself expires
+_CURSOR_SLACK_SECONDS = 300
+
+
+class SyncService:
+    # Receives repositories via constructor injection (dependency injection)
+    def __init__(self, change_log_repo, deck_repo, card_repo, stats_repo):
+        self.change_log_repo = change_log_repo  # per-user change log
+        self.deck_repo = deck_repo              # deck summaries and attachments
+        self.card_repo = card_repo              # card rows
+        self.stats_repo = stats_repo            # user statistics
+
+    def _cursor(self, seq):
+        return encode_cursor([int(time.time()) - _CURSOR_SLACK_SECONDS, seq])
+
+    def get_changes(self, user_id, cursor=None, limit=500):
+        # One page of changes after the cursor. Without a cursor, or when it is older than the
+        # retained log, the response has reset=true: the client reloads everything through the
+        # regular endpoints and continues from next_cursor. Raises ValueError on a malformed cursor.
+        head = self.change_log_repo.get_head(user_id) or 0
+        since = None
+        if cursor:
+            issued_at, since = decode_cursor(cursor)
+            if not isinstance(issued_at, int) or since < 0:
+                raise ValueError('Invalid cursor')
+            horizon = time.time() - current_app.config.get('SYNC_LOG_RETENTION_DAYS', 30) * 86400
+            if issued_at < horizon or since > head:
+                since = None
+        if since is None:
+            return {'reset': True, 'changes': [], 'next_cursor': self._cursor(head), 'has_more': False}, 200
+
+        rows = self.change_log_repo.get_page(user_id, since, limit)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        upserts = {}
+        for row in rows:
+            if row.op == 'upsert':
+                upserts.setdefault(row.entity, set()).add(row.entity_id)
+        states = {
+            'deck': self.deck_repo.get_summaries(upserts.get('deck')),
+            'card': self.card_repo.get_rows_by_ids(upserts.get('card')),
+            'file': self.deck_repo.get_files_by_ids(upserts.get('file')),
+            'stats': {},
+        }
+        if 'stats' in upserts:
+            user_stats = self.stats_repo.get_by_user_id(user_id)
+            if user_stats:
+                states['stats'][user_id] = user_stats.to_dict()
+
+        changes = []
+        for row in rows:
+            data = states[row.entity].get(row.entity_id) if row.op == 'upsert' else None
+            # An upsert whose row is gone by now was deleted later (its tombstone follows or the deck's did)
+            changes.append({
+                'seq': row.seq,
+                'entity': row.entity,
+                'id': row.entity_id,
+                'deck_id': row.deck_id,
+                'op': 'upsert' if data is not None else 'delete',
+                'data': data
+            })
+
+        return {
+            'reset': False,
+            'changes': changes,
+            'next_cursor': self._cursor(rows[-1].seq if rows else since),
+            'has_more': has_more
+        }, 200
+
+    def compact(self):
+        # Purge entries older than the retention window; cursors issued before it get a reset
+        before = datetime.utcnow() - timedelta(days=current_app.config.get('SYNC_LOG_RETENTION_DAYS', 30))
+        purged = self.change_log_repo.purge_before(before)
+        db.session.commit()
+        return purged
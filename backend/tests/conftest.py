@@ -54,11 +54,21 @@ def app():
                 )
             """))
             conn.commit()
+
+        from core.container import container
+        from core.security import clear_token_version_cache
+        container.deck_search_repository.ensure_index(db.engine)
+        container.card_search_repository.ensure_index(db.engine)
+        container.deck_repository.ensure_card_counts(db.engine)
             
         yield flask_app
         
         # Full teardown after each test
         db.session.remove()
+        clear_token_version_cache()
+        container.deck_cache.clear()
+        container.deck_search_repository.drop_index(db.engine)
+        container.card_search_repository.drop_index(db.engine)
         db.drop_all()
 
 @pytest.fixture
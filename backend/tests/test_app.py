@@ -0,0 +1,100 @@
+# Тесты фабрики приложения (create_app) и ленивых импортов
+import json
+import os
+import subprocess
+import sys
+from sqlalchemy import delete, inspect
+from app import create_app
+from config import Config
+from models import db, User, Deck, Card
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_create_app_initializes_fresh_database(tmp_path):
+    # Новое приложение со своей БД: схема создаётся при старте, спецификация Swagger отдаётся из кэша
+    class FreshConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'fresh.db'}"
+
+    app = create_app(FreshConfig)
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        assert {'users', 'decks', 'cards', 'change_log'} <= set(tables)
+        db.engine.dispose()
+
+    client = app.test_client()
+    first = client.get('/api/swagger.json')
+    assert first.status_code == 200
+    assert first.get_data() == client.get('/api/swagger.json').get_data()
+    assert '/api/sync' in json.loads(first.get_data())['paths']
+
+
+def test_app_without_auto_init_keeps_engine_hooks_and_search(tmp_path):
+    # AUTO_INIT_DB=false на уже созданной БД: прагмы (каскадное удаление) и FTS5-поиск всё равно работают
+    from core.container import container
+
+    class InitConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'existing.db'}"
+
+    class ServingConfig(InitConfig):
+        AUTO_INIT_DB = False
+
+    create_app(InitConfig)
+    repo = container.deck_search_repository
+    repo._fts5_ready.clear()  # as in a worker that never ran the migrations
+
+    app = create_app(ServingConfig)
+    with app.app_context():
+        user = User(username='cascade', email='cascade@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        deck = Deck(title='Cascade deck', user_id=user.id)
+        db.session.add(deck)
+        db.session.flush()
+        db.session.add(Card(question='Q', answer='A', deck_id=deck.id))
+        db.session.commit()
+
+        db.session.execute(delete(Deck).where(Deck.id == deck.id))
+        db.session.commit()
+        assert db.session.query(Card).count() == 0
+        assert repo.fts5_ready(db.engine)
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_create_app_configures_container_from_config(app, tmp_path):
+    # Размер кэша колод и параметры буфера счётчиков берутся из конфигурации приложения, а не из класса Config
+    from core.container import container
+
+    class SmallCacheConfig(Config):
+        TESTING = True
+        AUTO_INIT_DB = False
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'cache.db'}"
+        DECK_CACHE_MAX_ENTRIES = 2
+        DECK_CACHE_MAX_BYTES = 1000
+        CARD_COUNTER_FLUSH_SECONDS = 0.5
+        CARD_COUNTER_MAX_PENDING = 10
+
+    try:
+        container.deck_cache.clear()
+        for key in range(3):
+            container.deck_cache.set(key, 1, b'x')
+        create_app(SmallCacheConfig)
+        stats = container.deck_cache.stats()
+        assert (stats['max_entries'], stats['max_bytes'], stats['entries']) == (2, 1000, 2)
+        buffer = container.card_counter_buffer
+        assert (buffer.interval, buffer.max_pending) == (0.5, 10)
+    finally:
+        container.init_app(app)
+
+
+def test_startup_does_not_import_heavy_modules():
+    # minio, PyPDF2 и requests загружаются только при первом запросе, которому они нужны
+    code = ("import sys, app; app.create_app(); "
+            "print('heavy:' + ','.join(m for m in ('minio', 'PyPDF2', 'requests') if m in sys.modules))")
+    env = dict(os.environ, AUTO_INIT_DB='false')
+    output = subprocess.run([sys.executable, '-c', code], cwd=BACKEND, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == 'heavy:'
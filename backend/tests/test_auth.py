@@ -80,3 +80,126 @@ def test_protected_route_with_token(client, auth_headers):
     response = client.get('/api/decks', headers=auth_headers)
     assert response.status_code == 200
     assert isinstance(response.get_json()['decks'], list)
+
+
+def test_active_refresh_tokens_are_capped(client, test_user, app, monkeypatch):
+    # Количество активных refresh-токенов пользователя ограничено, старые удаляются
+    from models import RefreshToken
+    monkeypatch.setitem(app.config, 'MAX_ACTIVE_REFRESH_TOKENS', 3)
+    for _ in range(5):
+        client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    with app.app_context():
+        assert RefreshToken.query.filter_by(user_id=test_user['id'], revoked=False).count() == 3
+
+
+def test_expired_refresh_tokens_do_not_count_toward_cap(client, test_user, app, monkeypatch):
+    # Просроченные, но не отозванные токены не считаются активными и не вытесняют живые сессии
+    from datetime import datetime, timedelta
+    from models import db, RefreshToken
+    monkeypatch.setitem(app.config, 'MAX_ACTIVE_REFRESH_TOKENS', 2)
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.add_all([RefreshToken(token=f'expired-{i}', user_id=test_user['id'], expires_at=now - timedelta(days=1),
+                                         created_at=now + timedelta(hours=1)) for i in range(3)])
+        db.session.commit()
+    for _ in range(2):
+        client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    with app.app_context():
+        now = datetime.utcnow()
+        assert RefreshToken.query.filter(RefreshToken.user_id == test_user['id'], RefreshToken.expires_at > now).count() == 2
+
+
+def test_prune_tokens_cli(runner, test_user, app):
+    # CLI-команда удаляет просроченные и отозванные токены пачками, активные не трогает
+    from datetime import datetime, timedelta
+    from models import db, RefreshToken
+    with app.app_context():
+        now = datetime.utcnow()
+        tokens = [RefreshToken(token=f'expired-{i}', user_id=test_user['id'], expires_at=now - timedelta(days=1)) for i in range(5)]
+        tokens += [RefreshToken(token=f'revoked-{i}', user_id=test_user['id'], expires_at=now + timedelta(days=1), revoked=True) for i in range(4)]
+        tokens.append(RefreshToken(token='active', user_id=test_user['id'], expires_at=now + timedelta(days=1)))
+        db.session.add_all(tokens)
+        db.session.commit()
+
+    result = runner.invoke(args=['prune-tokens', '--batch-size', '2'])
+    assert 'Deleted 9' in result.output
+    with app.app_context():
+        assert [t.token for t in RefreshToken.query.all()] == ['active']
+
+
+def test_refresh_rotates_token(client, test_user):
+    # Ротация: старый refresh-токен отзывается, новый выдается в куке
+    client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    response = client.post('/api/auth/refresh')
+    assert response.status_code == 200
+    assert 'access_token' in response.get_json()
+
+
+def test_delete_user_cascades_in_database(client, auth_headers, test_user, app, mocker):
+    # Удаление аккаунта: БД каскадно удаляет все данные, файлы из MinIO удаляются по заранее собранным именам
+    from models import db, Deck, Card, DeckFile, StudySession, RefreshToken, User
+    remove = mocker.patch('services.deck_service.remove_storage_objects')
+    with app.app_context():
+        deck = Deck(title='D', user_id=test_user['id'])
+        db.session.add(deck)
+        db.session.flush()
+        db.session.add_all([Card(question='Q', answer='A', deck_id=deck.id) for _ in range(3)])
+        db.session.add(DeckFile(deck_id=deck.id, object_name='deck_obj.pdf', original_name='a.pdf', size_bytes=1))
+        db.session.add(StudySession(user_id=test_user['id'], deck_id=deck.id))
+        db.session.commit()
+
+    response = client.delete('/api/auth/user', headers=auth_headers)
+    assert response.status_code == 200
+    remove.assert_called_once_with(['deck_obj.pdf'])
+    with app.app_context():
+        db.session.expire_all()
+        assert db.session.get(User, test_user['id']) is None
+        for model in (Deck, Card, DeckFile, StudySession, RefreshToken):
+            assert model.query.count() == 0
+
+
+def test_login_rehashes_with_configured_method(client, test_user, app, monkeypatch):
+    # Хэш со старыми параметрами пересчитывается при успешном входе
+    from models import db, User
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    credentials = {'username': test_user['username'], 'password': test_user['password']}
+    assert client.post('/api/auth/login', json=credentials).status_code == 200
+    with app.app_context():
+        assert db.session.get(User, test_user['id']).password_hash.startswith('pbkdf2:sha256:1000$')
+    assert client.post('/api/auth/login', json=credentials).status_code == 200
+    assert client.post('/api/auth/login', json={**credentials, 'password': 'wrong'}).status_code == 401
+
+
+def test_login_busy_hasher_returns_503(client, test_user, monkeypatch):
+    # Переполненная очередь хэширования отвечает 503, а не копит запросы
+    import core.passwords as passwords
+    def busy(*args):
+        raise passwords.PasswordHasherBusy()
+    monkeypatch.setattr(passwords, '_run', busy)
+    response = client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    assert response.status_code == 503
+
+
+def test_password_hash_settings_come_from_app_config(client, test_user, app, monkeypatch):
+    # PASSWORD_HASH_WORKERS=0 в конфиге приложения хэширует в самом запросе, пул не запускается
+    import core.passwords as passwords
+    def no_pool():
+        raise AssertionError('pool started')
+    monkeypatch.setattr(passwords, '_get_pool', no_pool)
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 0)
+    response = client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    assert response.status_code == 200
+
+
+def test_login_recovers_from_dead_hashing_process(client, test_user):
+    # Убитый процесс пула хэширования (OOM, segfault) не ломает входы до перезапуска воркера
+    import os
+    import core.passwords as passwords
+    pool, _ = passwords._get_pool()
+    try:
+        pool.submit(os._exit, 1).result()
+    except Exception:
+        pass  # пул перешёл в состояние BrokenProcessPool
+    response = client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    assert response.status_code == 200
+    assert passwords._get_pool()[0] is not pool
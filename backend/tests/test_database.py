@@ -0,0 +1,123 @@
+# Тесты профилей движка БД (пул соединений, прагмы SQLite, таймауты Postgres)
+import pytest
+from sqlalchemy import create_engine, text
+from core.database import resolve_profile, engine_options, install_engine_hooks
+
+
+def test_profile_is_detected_from_uri():
+    # Профиль выбирается по схеме URI, явное значение имеет приоритет
+    assert resolve_profile(None, 'sqlite:///study_cards.db') == 'sqlite'
+    assert resolve_profile(None, 'postgresql://admin@db/study_cards') == 'postgres'
+    assert resolve_profile('default', 'postgresql://admin@db/study_cards') == 'default'
+    with pytest.raises(ValueError):
+        resolve_profile('turbo', 'sqlite://')
+
+
+def test_postgres_profile_options():
+    # Для Postgres включены pre-ping, размеры пула и statement_timeout
+    options = engine_options('postgres')
+    assert options['pool_pre_ping'] is True
+    assert options['pool_size'] > 0
+    assert 'statement_timeout=' in options['connect_args']['options']
+    assert 'pragmas' not in options
+
+
+def test_sqlite_profile_sets_wal_and_busy_timeout(tmp_path):
+    # Прагмы SQLite применяются к каждому новому соединению; ожидание блокировки задаёт только busy_timeout
+    assert 'connect_args' not in engine_options('sqlite')
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}", **engine_options('sqlite'))
+    install_engine_hooks(engine, 'sqlite')
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+    engine.dispose()
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    # Вторая SQLite-база как заглушка реплики: та же схема, но свои данные
+    from models import db
+    from core.routing import get_replica_engine, _recent_writers
+    app.config['SQLALCHEMY_REPLICA_URI'] = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = get_replica_engine(app)
+    db.metadata.create_all(engine)
+    yield engine
+    app.config['SQLALCHEMY_REPLICA_URI'] = None
+    _recent_writers.clear()
+    engine.dispose()
+
+
+def test_read_only_endpoint_uses_replica(client, auth_headers, test_user, replica):
+    # GET-запросы читают из реплики: колода, существующая только в реплике, видна через API
+    with replica.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, password_hash, role) VALUES (:uid, 'u', 'u@example.com', 'x', 'user')"),
+                     {'uid': test_user['id']})
+        conn.execute(text("INSERT INTO decks (id, title, user_id, created_at) VALUES (777, 'Replica Deck', :uid, CURRENT_TIMESTAMP)"),
+                     {'uid': test_user['id']})
+    response = client.get('/api/decks/777')
+    assert response.status_code == 200
+    assert response.get_json()['title'] == 'Replica Deck'
+
+
+def test_reads_after_write_stay_on_primary(client, auth_headers, test_user, replica, app):
+    # После записи чтения того же пользователя идут в основную БД (read-your-writes)
+    from models import db, Deck
+    with app.app_context():
+        deck = Deck(title='Primary Deck', user_id=test_user['id'])
+        db.session.add(deck)
+        db.session.commit()
+        deck_id = deck.id
+
+    # В реплике колоды нет - она еще "не доехала"
+    assert client.get('/api/decks', headers=auth_headers).get_json()['decks'] == []
+
+    client.put(f'/api/decks/{deck_id}', headers=auth_headers, json={'title': 'Renamed'})
+    data = client.get('/api/decks', headers=auth_headers).get_json()
+    assert [d['title'] for d in data['decks']] == ['Renamed']
+
+
+def test_stats_read_does_not_create_row(client, auth_headers, test_user, replica, app):
+    # GET /api/stats может читать из реплики, поэтому ничего не пишет: без записи отдаются нулевые значения
+    from models import db, UserStats
+    response = client.get('/api/stats', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json() == {'total_decks': 0, 'cards_studied': 0, 'max_streak': 0, 'current_streak': 0}
+    with app.app_context():
+        assert db.session.query(UserStats).filter_by(user_id=test_user['id']).count() == 0
+
+
+def test_recent_writers_are_swept():
+    # Истёкшие записи read-your-writes удаляются при следующей записи, словарь не растёт бесконечно
+    import time
+    from core.routing import _recent_writers, _last_sweep, remember_writer
+    now = time.time()
+    _recent_writers.update({uid: now - 1 for uid in range(1000, 1100)})
+    _last_sweep[0] = 0.0
+    remember_writer(1, now + 5, 5)
+    assert _recent_writers == {1: now + 5}
+    _recent_writers.clear()
+
+
+def test_upgrade_foreign_keys_rebuilds_legacy_sqlite_tables(tmp_path):
+    # Старые таблицы без ON DELETE CASCADE пересобираются с сохранением данных
+    from models import db
+    from core.database import upgrade_foreign_keys
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    install_engine_hooks(engine, 'sqlite')
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(255) NOT NULL, created_at DATETIME, role VARCHAR(20) NOT NULL)"))
+        conn.execute(text("CREATE TABLE decks (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, description TEXT, user_id INTEGER NOT NULL REFERENCES users(id), created_at DATETIME, last_studied DATETIME)"))
+        conn.execute(text("INSERT INTO users (id, username, email, password_hash, role) VALUES (1, 'u', 'u@e', 'x', 'user')"))
+        conn.execute(text("INSERT INTO decks (id, title, user_id) VALUES (5, 'Old', 1)"))
+    db.metadata.create_all(engine)
+
+    upgrade_foreign_keys(engine, db.metadata)
+
+    with engine.begin() as conn:
+        rules = {row[3]: row[6] for row in conn.execute(text("PRAGMA foreign_key_list(decks)"))}
+        assert rules['user_id'] == 'CASCADE'
+        assert conn.execute(text("SELECT title FROM decks WHERE id = 5")).scalar() == 'Old'
+        conn.execute(text("DELETE FROM users WHERE id = 1"))
+        assert conn.execute(text("SELECT COUNT(*) FROM decks")).scalar() == 0
+    engine.dispose()
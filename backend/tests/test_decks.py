@@ -85,3 +85,369 @@ def test_mocked_ai_generation(client, auth_headers, mocker):
     assert response.status_code == 201
     assert response.get_json()['message'] == 'Mocked cards generated'
     mock_generate.assert_called_once()
+
+
+@pytest.fixture
+def many_decks(app, test_user):
+    # 7 колод с разным количеством карточек и одинаковым временем создания (проверка tiebreaker по id)
+    from datetime import datetime
+    from models import db, Deck, Card
+    with app.app_context():
+        created = datetime(2024, 1, 1, 12, 0, 0)
+        for i in range(7):
+            deck = Deck(title=f'Deck {i % 3}', user_id=test_user['id'], created_at=created)
+            db.session.add(deck)
+            db.session.flush()
+            db.session.add_all([Card(question='Q', answer='A', deck_id=deck.id) for _ in range(i % 4)])
+        db.session.commit()
+
+
+@pytest.mark.parametrize('sort_by', ['newest', 'oldest', 'name', 'cards'])
+def test_cursor_pagination_matches_offset(client, auth_headers, many_decks, sort_by):
+    # Курсорная пагинация проходит все колоды без дублей и в том же порядке сортировки
+    seen = []
+    response = client.get(f'/api/decks?pagination=cursor&per_page=3&sort_by={sort_by}&with_total=1', headers=auth_headers)
+    data = response.get_json()
+    assert data['total'] == 7
+    while True:
+        assert response.status_code == 200
+        seen.extend(data['decks'])
+        if not data['next_cursor']:
+            break
+        response = client.get(f'/api/decks?cursor={data["next_cursor"]}&per_page=3&sort_by={sort_by}', headers=auth_headers)
+        data = response.get_json()
+        assert 'total' not in data
+
+    assert len({d['id'] for d in seen}) == 7
+    if sort_by == 'cards':
+        counts = [d['card_count'] for d in seen]
+        assert counts == sorted(counts, reverse=True)
+    if sort_by == 'name':
+        titles = [d['title'] for d in seen]
+        assert titles == sorted(titles)
+
+
+def test_cursor_pagination_with_filters(client, auth_headers, many_decks):
+    # Фильтры работают и в курсорном режиме
+    response = client.get('/api/decks?pagination=cursor&min_cards=2&with_total=true', headers=auth_headers)
+    data = response.get_json()
+    assert data['total'] == 3
+    assert all(d['card_count'] >= 2 for d in data['decks'])
+
+
+def test_cursor_pagination_invalid_cursor(client, auth_headers):
+    # Испорченный курсор отклоняется с ошибкой 400
+    response = client.get('/api/decks?cursor=not-a-cursor', headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_cursor_pagination_rejects_cursor_of_other_sort(client, auth_headers, many_decks):
+    # Курсор помнит сортировку: с другим sort_by он отклоняется, а не отдаёт чужую страницу
+    data = client.get('/api/decks?pagination=cursor&per_page=3&sort_by=cards', headers=auth_headers).get_json()
+    assert data['next_cursor']
+    response = client.get(f'/api/decks?cursor={data["next_cursor"]}&per_page=3&sort_by=name', headers=auth_headers)
+    assert response.status_code == 400
+    response = client.get(f'/api/decks?cursor={data["next_cursor"]}&per_page=3&sort_by=cards', headers=auth_headers)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('values', [
+    ['name', [1], 5], ['cards', {'a': 1}, 5], ['cards', True, 5], ['cards', 'x', 5],
+    ['newest', 7, 5], ['oldest', 'not-a-date', 5],
+])
+def test_cursor_pagination_rejects_tampered_sort_value(client, auth_headers, many_decks, values):
+    # Значение сортировки в курсоре проверяется по типу ключа: подделка даёт 400, а не 500
+    from repositories.deck_repository import encode_cursor
+    response = client.get(f'/api/decks?cursor={encode_cursor(values)}&sort_by={values[0]}', headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_deck_card_count_follows_card_inserts_and_deletes(app, test_user):
+    # Счётчик карточек колоды ведут триггеры: пакетная вставка, удаление, а при пересоздании триггеров - пересчёт
+    from sqlalchemy import delete, insert, text
+    from models import db, Deck, Card
+    from core.container import container
+    with app.app_context():
+        deck = Deck(title='Счётчик', user_id=test_user['id'])
+        db.session.add(deck)
+        db.session.commit()
+        db.session.execute(insert(Card), [{'question': f'Q{i}', 'answer': 'A', 'deck_id': deck.id} for i in range(5)])
+        db.session.execute(delete(Card).where(Card.deck_id == deck.id, Card.question == 'Q0'))
+        db.session.commit()
+        assert db.session.query(Deck.card_count).filter(Deck.id == deck.id).scalar() == 4
+
+        with db.engine.connect() as conn:
+            conn.execute(text("DROP TRIGGER cards_card_count_ai"))
+            conn.execute(text("UPDATE decks SET card_count = 0"))
+            conn.commit()
+        container.deck_repository.ensure_card_counts(db.engine)
+        assert db.session.query(Deck.card_count).filter(Deck.id == deck.id).scalar() == 4
+
+
+@pytest.fixture
+def searchable_decks(app, test_user):
+    # Колоды с русскими названиями для полнотекстового поиска
+    from models import db, Deck
+    with app.app_context():
+        decks = [
+            Deck(title='Основы химии', description='Органические соединения', user_id=test_user['id']),
+            Deck(title='История России', description='Химическая промышленность и карточки по химии', user_id=test_user['id']),
+            Deck(title='Английский язык', description='Неправильные глаголы', user_id=test_user['id']),
+        ]
+        db.session.add_all(decks)
+        db.session.commit()
+        return [d.id for d in decks]
+
+
+def test_search_russian_inflection_and_relevance(client, auth_headers, searchable_decks):
+    # Поиск находит словоформы ("химия" -> "химии") и ставит совпадение в названии выше описания
+    response = client.get('/api/decks?search=химия&sort_by=relevance', headers=auth_headers)
+    assert response.status_code == 200
+    ids = [d['id'] for d in response.get_json()['decks']]
+    assert ids == [searchable_decks[0], searchable_decks[1]]
+
+
+def test_search_index_follows_updates_and_deletes(client, auth_headers, searchable_decks):
+    # Индекс синхронизируется при изменении и удалении колоды
+    deck_id = searchable_decks[2]
+    client.put(f'/api/decks/{deck_id}', headers=auth_headers, json={'title': 'Немецкий язык'})
+    assert client.get('/api/decks?search=английский', headers=auth_headers).get_json()['total'] == 0
+    assert client.get('/api/decks?search=немецкий', headers=auth_headers).get_json()['total'] == 1
+
+    client.delete(f'/api/decks/{deck_id}', headers=auth_headers)
+    assert client.get('/api/decks?search=немецкий', headers=auth_headers).get_json()['total'] == 0
+
+
+def test_search_relevance_with_cursor(client, auth_headers, searchable_decks):
+    # Сортировка по релевантности поддерживается и в курсорном режиме
+    response = client.get('/api/decks?pagination=cursor&per_page=1&search=химия&sort_by=relevance', headers=auth_headers)
+    data = response.get_json()
+    assert [d['id'] for d in data['decks']] == [searchable_decks[0]]
+    response = client.get(f'/api/decks?cursor={data["next_cursor"]}&per_page=1&search=химия&sort_by=relevance', headers=auth_headers)
+    assert [d['id'] for d in response.get_json()['decks']] == [searchable_decks[1]]
+
+
+def test_card_search_across_decks(client, auth_headers, test_user, admin_user, app):
+    # Поиск карточек по всем колодам пользователя, с подсветкой и курсором; чужие карточки не видны
+    from models import db, Deck, Card
+    with app.app_context():
+        mine = [Deck(title='Физика', user_id=test_user['id']), Deck(title='Химия', user_id=test_user['id'])]
+        other = Deck(title='Чужая', user_id=admin_user['id'])
+        db.session.add_all(mine + [other])
+        db.session.flush()
+        db.session.add_all([
+            Card(question='Что такое энергия?', answer='Мера <движения>', deck_id=mine[0].id),
+            Card(question='Закон сохранения', answer='Энергия не исчезает', deck_id=mine[1].id),
+            Card(question='Кинетическая энергия', answer='mv^2/2', deck_id=other.id),
+            Card(question='Валентность', answer='Число связей', deck_id=mine[1].id),
+        ])
+        db.session.commit()
+
+    response = client.get('/api/cards/search?q=энергии&limit=1', headers=auth_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data['cards']) == 1
+    first = data['cards'][0]
+    assert first['question'] == 'Что такое энергия?'
+    assert '<mark>энергия</mark>' in first['highlight']['question']
+    assert '&lt;движения&gt;' in first['highlight']['answer']
+
+    response = client.get(f'/api/cards/search?q=энергии&limit=1&cursor={data["next_cursor"]}', headers=auth_headers)
+    data = response.get_json()
+    assert [c['question'] for c in data['cards']] == ['Закон сохранения']
+    assert data['next_cursor'] is None
+
+
+@pytest.mark.parametrize('values', [[[1], 3], [True, 3], ['0.5', 3]])
+def test_card_search_rejects_tampered_cursor(client, auth_headers, sample_deck, values):
+    # Подделанная оценка релевантности в курсоре поиска даёт 400, а не 500
+    from repositories.deck_repository import encode_cursor
+    response = client.get(f'/api/cards/search?q=энергии&cursor={encode_cursor(values)}', headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_card_search_index_follows_card_mutations(client, auth_headers, sample_deck):
+    # Индекс обновляется при создании, изменении и удалении карточек
+    response = client.post(f'/api/decks/{sample_deck["id"]}/cards', json={'question': 'Фотосинтез', 'answer': 'Хлорофилл'})
+    card_id = response.get_json()['id']
+    assert len(client.get('/api/cards/search?q=фотосинтез', headers=auth_headers).get_json()['cards']) == 1
+
+    client.put(f'/api/cards/{card_id}', json={'question': 'Дыхание'})
+    assert client.get('/api/cards/search?q=фотосинтез', headers=auth_headers).get_json()['cards'] == []
+    assert len(client.get('/api/cards/search?q=дыхание', headers=auth_headers).get_json()['cards']) == 1
+
+    client.delete(f'/api/cards/{card_id}')
+    assert client.get('/api/cards/search?q=дыхание', headers=auth_headers).get_json()['cards'] == []
+
+
+def test_deck_payload_cache_invalidation(client, auth_headers, sample_deck):
+    # Повторное открытие колоды отдается из кэша; любые изменения колоды/карточек его инвалидируют
+    from core.container import container
+    deck_url = f'/api/decks/{sample_deck["id"]}'
+    first = client.get(deck_url)
+    assert client.get(deck_url).get_data() == first.get_data()
+    assert container.deck_cache.stats()['hits'] == 1
+
+    card_id = first.get_json()['cards'][0]['id']
+    client.put(f'/api/cards/{card_id}', headers=auth_headers, json={'question': 'Новый вопрос'})
+    assert client.get(deck_url).get_json()['cards'][0]['question'] == 'Новый вопрос'
+
+    client.post(f'/api/decks/{sample_deck["id"]}/cards', headers=auth_headers, json={'question': 'Q3', 'answer': 'A3'})
+    assert client.get(deck_url).get_json()['card_count'] == 3
+
+    client.post('/api/sessions', headers=auth_headers, json={
+        'deck_id': sample_deck['id'], 'cards_studied': 1, 'cards_correct': 1,
+        'card_results': [{'card_id': card_id, 'correct': True}]
+    })
+    cards = {c['id']: c for c in client.get(deck_url).get_json()['cards']}
+    assert cards[card_id]['times_studied'] == 1
+
+    client.delete(deck_url, headers=auth_headers)
+    assert client.get(deck_url).status_code == 404
+
+
+def test_lru_cache_bounds():
+    # LRU вытесняет давно не использованные записи по числу и по объему
+    from core.cache import LRUCache
+    cache = LRUCache(max_entries=2, max_bytes=10)
+    cache.set(1, 0, b'aaaa')
+    cache.set(2, 0, b'bbbb')
+    assert cache.get(1, 0) == b'aaaa'
+    cache.set(3, 0, b'cccc')  # вытесняет ключ 2
+    assert cache.get(2, 0) is None
+    assert cache.get(1, 1) is None  # другая версия - промах
+    cache.set(4, 0, b'dddddddd')  # превышение объема
+    assert cache.stats()['bytes'] <= 10
+
+
+def test_conditional_get_deck_and_list(client, auth_headers, sample_deck):
+    # Неизмененные колода и список колод возвращают 304 по If-None-Match
+    deck_url = f'/api/decks/{sample_deck["id"]}'
+    first = client.get(deck_url)
+    etag = first.headers['ETag']
+    assert 'no-cache' in first.headers['Cache-Control']
+    cached = client.get(deck_url, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.get_data() == b''
+
+    listing = client.get('/api/decks?per_page=5', headers=auth_headers)
+    list_etag = listing.headers['ETag']
+    assert 'Authorization' in listing.headers['Vary']
+    assert client.get('/api/decks?per_page=5', headers={**auth_headers, 'If-None-Match': list_etag}).status_code == 304
+    # Другие параметры запроса - другой ETag
+    assert client.get('/api/decks?per_page=6', headers={**auth_headers, 'If-None-Match': list_etag}).status_code == 200
+
+    client.put(deck_url, headers=auth_headers, json={'title': 'Renamed'})
+    assert client.get(deck_url, headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/api/decks?per_page=5', headers={**auth_headers, 'If-None-Match': list_etag}).status_code == 200
+
+
+def test_projection_matches_orm_serialization(client, auth_headers, sample_deck, app):
+    # Быстрый путь без ORM отдает те же данные, что и Deck.to_dict(include_cards=True)
+    from models import db, Deck, Card
+    with app.app_context():
+        cards = Card.query.filter_by(deck_id=sample_deck['id']).order_by(Card.id).all()
+        cards[0].times_studied, cards[0].times_correct = 3, 1
+        db.session.commit()
+        expected = db.session.get(Deck, sample_deck['id']).to_dict(include_cards=True)
+
+    assert client.get(f'/api/decks/{sample_deck["id"]}').get_json() == expected
+    listed = client.get('/api/decks', headers=auth_headers).get_json()['decks'][0]
+    assert listed == {k: v for k, v in expected.items() if k != 'cards'}
+
+    export = client.get(f'/api/decks/{sample_deck["id"]}/export', headers=auth_headers)
+    assert export.status_code == 200
+    assert export.get_data(as_text=True).splitlines() == ['Q1,A1', 'Q2,A2']
+
+
+def test_deck_detail_card_pages_and_fields(client, app, test_user):
+    # Карточки колоды можно листать курсором и запрашивать только нужные поля
+    from models import db, Deck, Card
+    with app.app_context():
+        deck = Deck(title='Big', user_id=test_user['id'])
+        db.session.add(deck)
+        db.session.flush()
+        db.session.add_all([Card(question=f'Q{i}', answer=f'A{i}', deck_id=deck.id) for i in range(7)])
+        db.session.commit()
+        deck_id = deck.id
+
+    meta = client.get(f'/api/decks/{deck_id}?include_cards=false').get_json()
+    assert 'cards' not in meta and meta['card_count'] == 7
+
+    questions, cursor = [], None
+    while True:
+        url = f'/api/decks/{deck_id}?fields=question&cards_limit=3'
+        data = client.get(url + (f'&cards_cursor={cursor}' if cursor else '')).get_json()
+        assert all(set(card) == {'question'} for card in data['cards'])
+        questions += [card['question'] for card in data['cards']]
+        cursor = data['next_cards_cursor']
+        if not cursor:
+            break
+    assert questions == [f'Q{i}' for i in range(7)]
+
+    assert client.get(f'/api/decks/{deck_id}?fields=id,secret').status_code == 400
+    assert client.get(f'/api/decks/{deck_id}?cards_limit=0').status_code == 400
+    assert client.get(f'/api/decks/{deck_id}?cards_limit=3&cards_cursor=bad').status_code == 400
+
+
+def test_export_streams_csv_and_apkg(client, auth_headers, sample_deck, tmp_path):
+    # Экспорт отдается потоком: CSV и пакет Anki (.apkg = zip с SQLite внутри)
+    import io
+    import sqlite3
+    import zipfile
+    url = f'/api/decks/{sample_deck["id"]}/export'
+    csv_response = client.get(url, headers=auth_headers)
+    assert csv_response.is_streamed
+    assert csv_response.get_data(as_text=True).splitlines() == ['Q1,A1', 'Q2,A2']
+
+    apkg = client.get(url + '?format=apkg', headers=auth_headers)
+    assert apkg.status_code == 200
+    assert '.apkg' in apkg.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(apkg.get_data())) as archive:
+        assert archive.read('media') == b'{}'
+        (tmp_path / 'collection.anki2').write_bytes(archive.read('collection.anki2'))
+    conn = sqlite3.connect(tmp_path / 'collection.anki2')
+    notes = [row[0] for row in conn.execute('SELECT flds FROM notes ORDER BY id')]
+    assert notes == ['Q1\x1fA1', 'Q2\x1fA2']
+    assert conn.execute('SELECT count(*) FROM cards').fetchone()[0] == 2
+    conn.close()
+
+    assert client.get(url + '?format=pdf', headers=auth_headers).status_code == 400
+
+
+def test_batch_card_operations(client, auth_headers, sample_deck, admin_headers, app, monkeypatch):
+    # Смешанные операции над карточками применяются одной транзакцией с результатом по каждой
+    deck_url = f'/api/decks/{sample_deck["id"]}'
+    first, second = [c['id'] for c in client.get(deck_url).get_json()['cards']]
+    response = client.post(f'{deck_url}/cards:batch', headers=auth_headers, json={'operations': [
+        {'op': 'create', 'question': 'Q3', 'answer': 'A3'},
+        {'op': 'update', 'id': first, 'answer': 'Новый ответ'},
+        {'op': 'delete', 'id': second},
+        {'op': 'delete', 'id': 999999},
+        {'op': 'update', 'id': first, 'question': 'дубль'},
+        {'op': 'create', 'question': 'без ответа'},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [r['status'] for r in data['results']] == [201, 200, 200, 404, 400, 400]
+    assert data['applied'] == 3 and data['failed'] == 3
+    assert data['results'][0]['card']['question'] == 'Q3'
+    assert data['results'][1]['card']['answer'] == 'Новый ответ'
+
+    cards = {c['id']: c for c in client.get(deck_url).get_json()['cards']}
+    assert second not in cards and len(cards) == 2
+    assert cards[first]['question'] == 'Q1' and cards[first]['answer'] == 'Новый ответ'
+
+    # Чужая колода и пустой пакет
+    other = client.post(f'{deck_url}/cards:batch', headers=admin_headers, json={'operations': [{'op': 'delete', 'id': first}]})
+    assert other.status_code == 403
+    assert client.post(f'{deck_url}/cards:batch', headers=auth_headers, json={'operations': []}).status_code == 400
+
+    # true/false не считаются id карточки; лимит операций берется из конфигурации приложения
+    response = client.post(f'{deck_url}/cards:batch', headers=auth_headers, json={'operations': [
+        {'op': 'delete', 'id': True}, {'op': 'update', 'id': False, 'answer': 'x'}
+    ]})
+    assert [r['status'] for r in response.get_json()['results']] == [404, 404]
+    monkeypatch.setitem(app.config, 'CARD_BATCH_MAX_OPERATIONS', 1)
+    assert client.post(f'{deck_url}/cards:batch', headers=auth_headers,
+                       json={'operations': [{'op': 'delete', 'id': first}] * 2}).status_code == 400
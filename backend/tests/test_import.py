@@ -0,0 +1,78 @@
+# Тесты массового импорта колод из CSV/TSV и пакетов Anki
+import io
+import pytest
+
+
+@pytest.fixture
+def inline_tasks(app):
+    # Фоновые задачи выполняются синхронно внутри запроса
+    app.config['BACKGROUND_TASKS_INLINE'] = True
+    yield
+    app.config['BACKGROUND_TASKS_INLINE'] = False
+
+
+def _upload(client, auth_headers, name, content, **form):
+    return client.post('/api/decks/import', headers=auth_headers, content_type='multipart/form-data',
+                       data={'file': (io.BytesIO(content), name), **form})
+
+
+def test_import_csv_in_batches(client, auth_headers, inline_tasks, app, monkeypatch):
+    # Импорт CSV с заголовком и разделителем ';' вставляет карточки пачками
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 100)
+    rows = ['Вопрос;Ответ'] + [f'Q{i};"A{i}; с точкой с запятой"' for i in range(250)]
+    response = _upload(client, auth_headers, 'words.csv', '\n'.join(rows).encode('utf-8'))
+    assert response.status_code == 202
+    job = response.get_json()['job']
+    assert job['status'] == 'done' and job['cards_imported'] == 250 and job['progress'] == 100
+
+    status = client.get(response.headers['Location'], headers=auth_headers).get_json()
+    assert status['deck_id'] == job['deck_id']
+    deck = client.get(f"/api/decks/{job['deck_id']}?fields=question,answer&cards_limit=1").get_json()
+    assert deck['title'] == 'words' and deck['card_count'] == 250
+    assert deck['cards'][0] == {'question': 'Q0', 'answer': 'A0; с точкой с запятой'}
+
+
+def test_import_apkg_roundtrip(client, auth_headers, inline_tasks, sample_deck_with_cards):
+    # Пакет Anki, выгруженный экспортом, импортируется обратно в новую колоду
+    apkg = client.get(f'/api/decks/{sample_deck_with_cards}/export?format=apkg', headers=auth_headers).get_data()
+    job = _upload(client, auth_headers, 'anki.apkg', apkg, title='Из Anki').get_json()['job']
+    assert job['status'] == 'done' and job['cards_imported'] == 3
+    deck = client.get(f"/api/decks/{job['deck_id']}").get_json()
+    assert deck['title'] == 'Из Anki'
+    assert [(c['question'], c['answer']) for c in deck['cards']] == [
+        ('Q0', 'A0'), ('Строка 1\nстрока 2', '<b>жирный</b>'), ('Q2', 'A2')
+    ]
+
+
+def test_import_failures(client, auth_headers, test_user, inline_tasks, app):
+    # Неподдерживаемый формат отклоняется сразу, поврежденный файл - через статус задачи
+    from models import db, UserStats, DailyMetric
+    with app.app_context():
+        db.session.add(UserStats(user_id=test_user['id']))
+        db.session.commit()
+    assert _upload(client, auth_headers, 'deck.pdf', b'%PDF').status_code == 400
+    job = _upload(client, auth_headers, 'broken.apkg', b'not a zip').get_json()['job']
+    assert job['status'] == 'failed' and job['deck_id'] is None and job['error']
+    job = _upload(client, auth_headers, 'empty.tsv', b'only one column\n').get_json()['job']
+    assert job['status'] == 'failed'
+
+    # Колоды неудачных импортов не учитываются ни в статистике пользователя, ни в метриках
+    assert client.get('/api/stats', headers=auth_headers).get_json()['total_decks'] == 0
+    with app.app_context():
+        assert db.session.query(db.func.sum(DailyMetric.value)).filter_by(metric='decks_created').scalar() == 0
+
+
+@pytest.fixture
+def sample_deck_with_cards(app, test_user):
+    from models import db, Deck, Card
+    with app.app_context():
+        deck = Deck(title='Export me', user_id=test_user['id'])
+        db.session.add(deck)
+        db.session.flush()
+        db.session.add_all([
+            Card(question='Q0', answer='A0', deck_id=deck.id),
+            Card(question='Строка 1\nстрока 2', answer='<b>жирный</b>', deck_id=deck.id),
+            Card(question='Q2', answer='A2', deck_id=deck.id),
+        ])
+        db.session.commit()
+        return deck.id
@@ -28,3 +28,387 @@ def test_admin_change_role(client, admin_headers, test_user):
     response = client.put(f'/api/admin/users/{user_id}/role', headers=admin_headers, json={'role': 'admin'})
     data = response.get_json()
     assert 'message' in data
+
+
+def test_role_change_revokes_old_tokens(client, admin_headers, auth_headers, test_user, app):
+    # Роль берется из токена без запроса к users; смена роли отзывает старые токены
+    from sqlalchemy import event
+    from models import db
+    with app.app_context():
+        engine = db.engine
+    client.get('/api/admin/users', headers=admin_headers)  # прогрев кэша версий токенов
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        assert client.get('/api/admin/metrics', headers=admin_headers).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert not any('token_version' in s for s in statements)
+
+    user_id = test_user['id']
+    assert client.put(f'/api/admin/users/{user_id}/role', headers=admin_headers, json={'role': 'admin'}).status_code == 200
+    # Старый токен выдан с ролью 'user' - он больше не принимается
+    assert client.get('/api/admin/users', headers=auth_headers).status_code == 401
+    # Новый вход выдает токен с ролью 'admin'
+    login = client.post('/api/auth/login', json={'username': test_user['username'], 'password': test_user['password']})
+    new_headers = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+    assert client.get('/api/admin/users', headers=new_headers).status_code == 200
+
+
+def _make_deck(app, user_id, n_cards):
+    # Вспомогательная функция: колода с n карточками для указанного юзера
+    from models import db, Deck, Card
+    with app.app_context():
+        deck = Deck(title='Session Deck', user_id=user_id)
+        db.session.add(deck)
+        db.session.flush()
+        cards = [Card(question=f'Q{i}', answer=f'A{i}', deck_id=deck.id) for i in range(n_cards)]
+        db.session.add_all(cards)
+        db.session.commit()
+        return deck.id, [c.id for c in cards]
+
+
+def test_session_updates_counters_and_streak(client, auth_headers, test_user, admin_user, app):
+    # Сессия обновляет счетчики карточек и серию; чужие карточки игнорируются
+    deck_id, card_ids = _make_deck(app, test_user['id'], 3)
+    _, foreign_ids = _make_deck(app, admin_user['id'], 1)
+    results = [
+        {'card_id': card_ids[0], 'correct': True},
+        {'card_id': card_ids[1], 'correct': False},
+        {'card_id': card_ids[1], 'correct': True},
+        {'card_id': card_ids[2], 'correct': True},
+        {'card_id': foreign_ids[0], 'correct': True},
+    ]
+    response = client.post('/api/sessions', headers=auth_headers, json={
+        'deck_id': deck_id, 'cards_studied': 3, 'cards_correct': 2, 'card_results': results
+    })
+    assert response.status_code == 201
+    stats = response.get_json()['user_stats']
+    assert stats['cards_studied'] == 3
+    assert stats['current_streak'] == 2
+    assert stats['max_streak'] == 2
+
+    from models import db, Card
+    with app.app_context():
+        assert db.session.get(Card, card_ids[1]).times_studied == 2
+        assert db.session.get(Card, card_ids[1]).times_correct == 1
+        assert db.session.get(Card, foreign_ids[0]).times_studied == 0
+
+
+def test_session_query_count_is_constant(client, auth_headers, test_user, app):
+    # Количество SQL-запросов не зависит от числа карточек в сессии
+    from sqlalchemy import event
+    from models import db
+
+    def count_queries(n_cards):
+        deck_id, card_ids = _make_deck(app, test_user['id'], n_cards)
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            client.post('/api/sessions', headers=auth_headers, json={
+                'deck_id': deck_id, 'cards_studied': n_cards, 'cards_correct': n_cards,
+                'card_results': [{'card_id': cid, 'correct': True} for cid in card_ids]
+            })
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        return len(statements)
+
+    count_queries(1)  # первая сессия создает запись UserStats
+    assert count_queries(5) == count_queries(200)
+
+
+def test_admin_users_paginated_with_aggregates(client, admin_headers, test_user, app):
+    # Постраничный список пользователей с поиском, сортировкой и агрегатами по колодам/карточкам/сессиям
+    from models import db, User, Deck, Card, StudySession
+    with app.app_context():
+        db.session.add_all([User(username=f'student{i}', email=f's{i}@uni.ru', password_hash='x') for i in range(5)])
+        deck = Deck(title='D', user_id=test_user['id'])
+        db.session.add(deck)
+        db.session.flush()
+        db.session.add_all([Card(question='Q', answer='A', deck_id=deck.id) for _ in range(4)])
+        db.session.add(StudySession(user_id=test_user['id'], deck_id=deck.id))
+        db.session.commit()
+
+    response = client.get('/api/admin/users?search=student&per_page=2&page=3&sort_by=username', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers['X-Total-Count'] == '5'
+    assert response.headers['X-Total-Pages'] == '3'
+    assert [u['username'] for u in response.get_json()] == ['student4']
+
+    response = client.get('/api/admin/users?sort_by=cards&order=desc', headers=admin_headers)
+    top = response.get_json()[0]
+    assert top['username'] == test_user['username']
+    assert (top['deck_count'], top['card_count'], top['session_count']) == (1, 4, 1)
+
+    # Курсорная пагинация проходит все страницы без OFFSET; курсор другой сортировки отклоняется
+    names, url = [], '/api/admin/users?search=student&per_page=2&sort_by=username&order=desc'
+    while url:
+        response = client.get(url, headers=admin_headers)
+        names += [u['username'] for u in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/admin/users?search=student&per_page=2&sort_by=username&order=desc&cursor={cursor}' if cursor else None
+    assert names == [f'student{i}' for i in range(4, -1, -1)]
+    first = client.get('/api/admin/users?per_page=1&sort_by=sessions&order=desc', headers=admin_headers)
+    assert first.get_json()[0]['session_count'] == 1
+    cursor = first.headers['X-Next-Cursor']
+    assert client.get(f'/api/admin/users?per_page=1&sort_by=sessions&order=desc&cursor={cursor}',
+                      headers=admin_headers).get_json()[0]['session_count'] == 0
+    assert client.get(f'/api/admin/users?sort_by=id&cursor={cursor}', headers=admin_headers).status_code == 400
+
+
+def test_admin_metrics_from_rollups(client, admin_headers, auth_headers, test_user, app, runner):
+    # Метрики дашборда обновляются инкрементально при записи сессий и читаются из rollup-таблиц
+    deck_id, card_ids = _make_deck(app, test_user['id'], 2)
+    for _ in range(2):
+        client.post('/api/sessions', headers=auth_headers, json={
+            'deck_id': deck_id, 'cards_studied': 2, 'cards_correct': 1,
+            'card_results': [{'card_id': card_ids[0], 'correct': True}, {'card_id': card_ids[1], 'correct': False}]
+        })
+
+    response = client.get('/api/admin/metrics?days=7', headers=admin_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data['daily']) == 7
+    today = data['daily'][-1]
+    assert (today['active_users'], today['sessions'], today['cards_studied']) == (1, 2, 4)
+
+    # Перестроение из исходных таблиц дает те же значения
+    result = runner.invoke(args=['compact-metrics', '--rebuild-days', '3'])
+    assert result.exit_code == 0
+    today = client.get('/api/admin/metrics?days=1', headers=admin_headers).get_json()['daily'][-1]
+    assert (today['active_users'], today['sessions'], today['cards_studied']) == (1, 2, 4)
+
+
+def test_metrics_rebuild_keeps_deleted_decks(client, admin_headers, test_user, app, runner):
+    # Перестроение не занижает историю: удалённая колода остаётся в decks_created, потерянный счётчик восстанавливается
+    from datetime import datetime
+    from models import db, DailyMetric
+    _make_deck(app, test_user['id'], 1)
+    with app.app_context():
+        # Счётчик потерян: перестроение поднимает его до числа сохранившихся колод
+        db.session.merge(DailyMetric(day=datetime.utcnow().date(), metric='decks_created', value=0))
+        db.session.commit()
+
+    assert runner.invoke(args=['compact-metrics', '--rebuild-days', '1']).exit_code == 0
+    today = client.get('/api/admin/metrics?days=1', headers=admin_headers).get_json()['daily'][-1]
+    assert today['decks_created'] == 1
+
+    with app.app_context():
+        # Вторая колода дня была удалена: инкрементальное значение 2 сохраняется
+        DailyMetric.query.filter_by(metric='decks_created').update({'value': 2})
+        db.session.commit()
+    assert runner.invoke(args=['compact-metrics', '--rebuild-days', '1']).exit_code == 0
+    today = client.get('/api/admin/metrics?days=1', headers=admin_headers).get_json()['daily'][-1]
+    assert today['decks_created'] == 2
+
+
+def test_stats_history_rollup(client, auth_headers, test_user, app):
+    # История обучения по дням и колодам читается из user_daily_stats
+    first_deck, first_cards = _make_deck(app, test_user['id'], 2)
+    second_deck, second_cards = _make_deck(app, test_user['id'], 1)
+    for deck_id, card_ids, duration in ((first_deck, first_cards, 60), (first_deck, first_cards, 30), (second_deck, second_cards, 10)):
+        client.post('/api/sessions', headers=auth_headers, json={
+            'deck_id': deck_id, 'cards_studied': len(card_ids), 'cards_correct': 1, 'duration_seconds': duration,
+            'card_results': [{'card_id': cid, 'correct': True} for cid in card_ids]
+        })
+
+    response = client.get('/api/stats/history?granularity=week', headers=auth_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data['series']) == 1
+    week = data['series'][0]
+    assert (week['sessions'], week['cards_studied'], week['cards_correct'], week['duration_seconds']) == (3, 5, 3, 100)
+    per_deck = {d['deck_id']: d['series'][0]['sessions'] for d in data['decks']}
+    assert per_deck == {first_deck: 2, second_deck: 1}
+    assert data['heatmap'][0]['cards_studied'] == 5
+
+
+def test_stats_history_validation(client, auth_headers):
+    # Некорректные параметры истории отклоняются
+    assert client.get('/api/stats/history?granularity=year', headers=auth_headers).status_code == 400
+    assert client.get('/api/stats/history?from=2024-02-01&to=2024-01-01', headers=auth_headers).status_code == 400
+    assert client.get('/api/stats/history?from=bad', headers=auth_headers).status_code == 400
+
+
+def test_stats_conditional_get(client, auth_headers, test_user, app):
+    # GET /api/stats отдает 304, пока запись статистики не изменилась
+    first = client.get('/api/stats', headers=auth_headers)
+    etag = first.headers['ETag']
+    assert client.get('/api/stats', headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
+
+    deck_id, card_ids = _make_deck(app, test_user['id'], 1)
+    client.post('/api/sessions', headers=auth_headers, json={
+        'deck_id': deck_id, 'cards_studied': 1, 'cards_correct': 1,
+        'card_results': [{'card_id': card_ids[0], 'correct': True}]
+    })
+    changed = client.get('/api/stats', headers={**auth_headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['cards_studied'] == 1
+
+
+def test_due_queue_follows_sm2_schedule(client, auth_headers, admin_headers, test_user, app):
+    # Очередь повторения: новые карточки, затем отвеченные уходят на интервал SM-2
+    deck_id, card_ids = _make_deck(app, test_user['id'], 3)
+    queue = client.get(f'/api/decks/{deck_id}/due', headers=auth_headers).get_json()
+    assert [c['id'] for c in queue['cards']] == card_ids
+    assert queue['due_total'] == 0 and queue['cards'][0]['schedule'] is None
+
+    client.post('/api/sessions', headers=auth_headers, json={
+        'deck_id': deck_id, 'cards_studied': 2, 'cards_correct': 1,
+        'card_results': [{'card_id': card_ids[0], 'correct': True},
+                         {'card_id': card_ids[1], 'correct': False, 'quality': 1}]
+    })
+    # Обе отвеченные карточки отложены на день - в очереди остается только новая
+    queue = client.get(f'/api/decks/{deck_id}/due', headers=auth_headers).get_json()
+    assert [c['id'] for c in queue['cards']] == [card_ids[2]]
+
+    from datetime import datetime, timedelta
+    from models import db, CardSchedule
+    with app.app_context():
+        state = db.session.get(CardSchedule, (test_user['id'], card_ids[0]))
+        assert (state.repetitions, state.interval_days) == (1, 1)
+        lapsed = db.session.get(CardSchedule, (test_user['id'], card_ids[1]))
+        assert (lapsed.repetitions, lapsed.lapses) == (0, 1)
+        lapsed.next_due = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+    queue = client.get(f'/api/decks/{deck_id}/due', headers=auth_headers).get_json()
+    assert [c['id'] for c in queue['cards']] == [card_ids[1], card_ids[2]]
+    assert queue['due_total'] == 1
+    assert queue['cards'][0]['schedule']['lapses'] == 1
+    assert client.get(f'/api/decks/{deck_id}/due?new=false', headers=auth_headers).get_json()['cards'][0]['id'] == card_ids[1]
+    assert client.get(f'/api/decks/{deck_id}/due?limit=0', headers=auth_headers).status_code == 400
+    assert client.get(f'/api/decks/{deck_id}/due', headers=admin_headers).status_code == 403
+
+
+def test_repeated_answers_in_session_review_card_once(client, auth_headers, test_user, app):
+    # Повторные ответы на карточку в одной сессии не продвигают SM-2 дальше одного повторения
+    from models import db, CardSchedule
+    deck_id, card_ids = _make_deck(app, test_user['id'], 2)
+    client.post('/api/sessions', headers=auth_headers, json={
+        'deck_id': deck_id, 'cards_studied': 4, 'cards_correct': 3,
+        'card_results': [{'card_id': card_ids[0], 'correct': True}, {'card_id': card_ids[0], 'correct': True},
+                         {'card_id': card_ids[1], 'correct': True}, {'card_id': card_ids[1], 'correct': False}]
+    })
+    with app.app_context():
+        state = db.session.get(CardSchedule, (test_user['id'], card_ids[0]))
+        assert (state.repetitions, state.interval_days) == (1, 1)
+        # Оценку ставит последний ответ сессии
+        lapsed = db.session.get(CardSchedule, (test_user['id'], card_ids[1]))
+        assert (lapsed.repetitions, lapsed.lapses) == (0, 1)
+
+
+def test_write_behind_card_counters(client, auth_headers, test_user, app, monkeypatch):
+    # Счетчики карточек копятся в памяти и записываются одним UPDATE при сбросе буфера
+    import time
+    from core.container import container
+    from models import db, Card, Deck
+    buffer = container.card_counter_buffer
+    monkeypatch.setitem(app.config, 'CARD_COUNTER_WRITE_BEHIND', True)
+    monkeypatch.setattr(buffer, 'interval', 3600)
+    deck_id, card_ids = _make_deck(app, test_user['id'], 2)
+    for correct in (True, False):
+        response = client.post('/api/sessions', headers=auth_headers, json={
+            'deck_id': deck_id, 'cards_studied': 2, 'cards_correct': int(correct),
+            'card_results': [{'card_id': cid, 'correct': correct} for cid in card_ids]
+        })
+        assert response.status_code == 201
+    time.sleep(0.01)
+    client.post('/api/sessions', headers=auth_headers, json={
+        'deck_id': deck_id, 'cards_studied': 1, 'cards_correct': 1,
+        'card_results': [{'card_id': card_ids[1], 'correct': True}]
+    })
+    with app.app_context():
+        assert db.session.get(Card, card_ids[0]).times_studied == 0
+        version = db.session.get(Deck, deck_id).version
+    assert buffer.pending() == 2
+
+    assert buffer.flush() == 2
+    with app.app_context():
+        card = db.session.get(Card, card_ids[0])
+        assert (card.times_studied, card.times_correct) == (2, 1)
+        # Время последнего изучения своё у каждой карточки, а не одно на весь сброс
+        later = db.session.get(Card, card_ids[1])
+        assert later.times_studied == 3 and card.last_studied < later.last_studied
+        assert db.session.get(Deck, deck_id).version > version
+    assert buffer.pending() == 0
+
+
+def test_counter_buffer_flushes_each_app_in_its_own_context():
+    # Буфер общий для всех приложений контейнера: дельты каждого приложения пишутся в его контексте
+    from flask import Flask, current_app
+    from core.write_behind import CounterBuffer
+    flushed = []
+    buffer = CounterBuffer(lambda studied, correct, at: flushed.append((current_app.name, studied, at)), 3600)
+    first, second = Flask('first'), Flask('second')
+    buffer.add(first, {1: 1}, {1: 1}, 10)
+    buffer.add(second, {1: 2}, {}, 20)
+    buffer.add(first, {2: 1}, {}, 30)
+    assert buffer.flush() == 3
+    assert sorted(flushed) == [('first', {1: 1, 2: 1}, {1: 10, 2: 30}), ('second', {1: 2}, {1: 20})]
+    buffer._stopped.set()
+    buffer._wake.set()
+
+
+def test_leaderboards_ranks(client, auth_headers, admin_headers, test_user, admin_user, app):
+    # Рейтинги обновляются при сохранении сессий; место считается по гистограмме очков
+    for user, headers, correct in ((test_user, auth_headers, 3), (admin_user, admin_headers, 1)):
+        deck_id, card_ids = _make_deck(app, user['id'], 3)
+        client.post('/api/sessions', headers=headers, json={
+            'deck_id': deck_id, 'cards_studied': 3, 'cards_correct': correct,
+            'card_results': [{'card_id': cid, 'correct': i < correct} for i, cid in enumerate(card_ids)]
+        })
+
+    board = client.get('/api/leaderboards/streak', headers=admin_headers).get_json()
+    assert [(e['username'], e['rank'], e['score']) for e in board['entries']] == [('testuser', 1, 3), ('adminuser', 2, 1)]
+    assert board['me'] == {'rank': 2, 'score': 1} and board['total_users'] == 2
+
+    # За неделю считаются все ответы, поэтому у обоих по 3 карточки и общее первое место
+    week = client.get('/api/leaderboards/cards?period=week', headers=admin_headers).get_json()
+    assert [e['rank'] for e in week['entries']] == [1, 1] and week['period'].count('-W') == 1
+
+    # Заявленный клиентом cards_studied не влияет на рейтинг - считаются только проверенные ответы
+    client.post('/api/sessions', headers=admin_headers, json={
+        'deck_id': deck_id, 'cards_studied': 10 ** 6, 'cards_correct': 0,
+        'card_results': [{'card_id': card_ids[0], 'correct': False}]
+    })
+    week = client.get('/api/leaderboards/cards?period=week', headers=admin_headers).get_json()
+    assert [(e['username'], e['score']) for e in week['entries']] == [('adminuser', 4), ('testuser', 3)]
+
+    client.post('/api/stats/reset', headers=auth_headers)
+    assert client.get('/api/leaderboards/streak', headers=admin_headers).get_json()['me']['rank'] == 1
+
+    client.delete('/api/auth/user', headers=auth_headers)
+    board = client.get('/api/leaderboards/streak', headers=admin_headers).get_json()
+    assert board['total_users'] == 1 and len(board['entries']) == 1
+
+    assert client.get('/api/leaderboards/xp', headers=admin_headers).status_code == 400
+    assert client.get('/api/leaderboards/cards?period=year', headers=admin_headers).status_code == 400
+
+
+def test_prune_leaderboards_drops_past_weeks(client, admin_headers, admin_user, app, runner):
+    # Прошедшие недели и пустые корзины гистограммы удаляются, текущая неделя и all-time остаются
+    from models import db, LeaderboardEntry, LeaderboardScore
+    deck_id, card_ids = _make_deck(app, admin_user['id'], 1)
+    client.post('/api/sessions', headers=admin_headers, json={
+        'deck_id': deck_id, 'cards_studied': 1, 'cards_correct': 1,
+        'card_results': [{'card_id': card_ids[0], 'correct': True}]
+    })
+    with app.app_context():
+        db.session.add(LeaderboardEntry(board='cards', period='2020-W01', user_id=admin_user['id'], score=7))
+        db.session.add(LeaderboardScore(board='cards', period='2020-W01', score=7, users=1))
+        db.session.add(LeaderboardScore(board='streak', period='all', score=99, users=0))
+        db.session.commit()
+
+    result = runner.invoke(args=['prune-leaderboards', '--keep-weeks', '2'])
+    assert result.exit_code == 0 and 'Deleted 1 ' in result.output
+    with app.app_context():
+        periods = {period for (period,) in db.session.query(LeaderboardEntry.period).distinct()}
+        assert '2020-W01' not in periods and 'all' in periods and len(periods) == 2
+        assert db.session.query(LeaderboardScore).filter(
+            db.or_(LeaderboardScore.period == '2020-W01', LeaderboardScore.users <= 0)).count() == 0
+    assert client.get('/api/leaderboards/cards?period=week', headers=admin_headers).get_json()['me']['score'] == 1
@@ -0,0 +1,79 @@
+# Тесты дельта-синхронизации по журналу изменений (GET /api/sync)
+import time
+
+
+def _sync(client, auth_headers, since=None, **params):
+    query = {'since': since, **params} if since else params
+    response = client.get('/api/sync', headers=auth_headers, query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _create_deck(app, user_id):
+    from models import db, Deck
+    with app.app_context():
+        deck = Deck(title='Sync Deck', user_id=user_id)
+        db.session.add(deck)
+        db.session.commit()
+        return deck.id
+
+
+def test_sync_returns_changes_after_cursor(client, auth_headers, test_user, app):
+    # Без курсора - полная перезагрузка; дальше только изменения после курсора
+    deck_id = _create_deck(app, test_user['id'])
+    first = _sync(client, auth_headers)
+    assert first['reset'] is True and first['changes'] == []
+    cursor = first['next_cursor']
+
+    card_ids = [client.post(f'/api/decks/{deck_id}/cards', headers=auth_headers,
+                            json={'question': f'Q{i}', 'answer': f'A{i}'}).get_json()['id'] for i in range(3)]
+    client.put(f'/api/cards/{card_ids[0]}', headers=auth_headers, json={'answer': 'new'})
+    client.delete(f'/api/cards/{card_ids[1]}', headers=auth_headers)
+
+    page = _sync(client, auth_headers, cursor)
+    assert page['reset'] is False and page['has_more'] is False
+    # Журнал сжат: по одной записи на сущность, в порядке последнего изменения
+    changes = {(c['entity'], c['id']): c for c in page['changes']}
+    assert len(changes) == len(page['changes']) == 4
+    assert changes[('card', card_ids[0])]['data']['answer'] == 'new'
+    assert changes[('card', card_ids[1])]['op'] == 'delete'
+    assert changes[('deck', deck_id)]['data']['card_count'] == 2
+    assert [c['seq'] for c in page['changes']] == sorted(c['seq'] for c in page['changes'])
+
+    # Постраничная выдача и пустой ответ после последней страницы
+    partial = _sync(client, auth_headers, cursor, limit=3)
+    assert partial['has_more'] is True and len(partial['changes']) == 3
+    rest = _sync(client, auth_headers, partial['next_cursor'])
+    assert len(rest['changes']) == 1 and rest['has_more'] is False
+    assert _sync(client, auth_headers, rest['next_cursor'])['changes'] == []
+
+
+def test_sync_deck_tombstone_replaces_children(client, auth_headers, test_user, app):
+    # Удаление колоды оставляет только ее надгробие, записи карточек удаляются
+    deck_id = _create_deck(app, test_user['id'])
+    cursor = _sync(client, auth_headers)['next_cursor']
+    client.post(f'/api/decks/{deck_id}/cards', headers=auth_headers, json={'question': 'Q', 'answer': 'A'})
+    client.delete(f'/api/decks/{deck_id}', headers=auth_headers)
+
+    changes = _sync(client, auth_headers, cursor)['changes']
+    assert [(c['entity'], c['id'], c['op']) for c in changes] == [('deck', deck_id, 'delete')]
+
+
+def test_sync_expired_and_invalid_cursor(client, auth_headers, test_user, app, monkeypatch, runner):
+    # Курсор старше срока хранения журнала требует полной перезагрузки
+    from models import db, ChangeLogEntry
+    deck_id = _create_deck(app, test_user['id'])
+    cursor = _sync(client, auth_headers)['next_cursor']
+    client.put(f'/api/decks/{deck_id}', headers=auth_headers, json={'title': 'Renamed'})
+
+    monkeypatch.setitem(app.config, 'SYNC_LOG_RETENTION_DAYS', 0)
+    monkeypatch.setattr(time, 'time', lambda: 10 ** 10)
+    assert _sync(client, auth_headers, cursor)['reset'] is True
+
+    result = runner.invoke(args=['compact-changelog'])
+    assert 'Purged 1' in result.output
+    with app.app_context():
+        assert db.session.query(ChangeLogEntry).count() == 0
+
+    response = client.get('/api/sync?since=garbage', headers=auth_headers)
+    assert response.status_code == 400
@@ -1,24 +1,47 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
+import { ChevronLeft, ChevronRight, Search } from 'lucide-react';
 import { useAuth, User } from '../context/AuthContext';
 import { apiFetch } from '../api/client';
 import SEO from '../components/SEO';
 
+const PER_PAGE = 50;
+
+interface AdminUser extends User {
+    deck_count: number;
+    card_count: number;
+    session_count: number;
+}
+
 const AdminPanel: React.FC = () => {
     const { token } = useAuth();
-    const [users, setUsers] = useState<User[]>([]);
+    const [users, setUsers] = useState<AdminUser[]>([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    const [page, setPage] = useState(1);
+    const [totalPages, setTotalPages] = useState(1);
+    const [totalCount, setTotalCount] = useState(0);
+    const [search, setSearch] = useState('');
+    const [localSearch, setLocalSearch] = useState('');
+    // курсор для каждой уже открытой страницы (X-Next-Cursor) - следующая страница грузится без OFFSET
+    const cursors = useRef<Record<number, string>>({});
 
     useEffect(() => {
         fetchUsers();
-    }, []);
+    }, [page, search]);
 
     const fetchUsers = async () => {
         try {
-            const response = await apiFetch('/admin/users');
+            let qs = `/admin/users?page=${page}&per_page=${PER_PAGE}`;
+            if (search) qs += `&search=${encodeURIComponent(search)}`;
+            if (cursors.current[page]) qs += `&cursor=${encodeURIComponent(cursors.current[page])}`;
+            const response = await apiFetch(qs);
             if (!response.ok) throw new Error('Failed to fetch users');
             const data = await response.json();
             setUsers(data);
+            setTotalCount(parseInt(response.headers.get('X-Total-Count') || '0', 10));
+            setTotalPages(Math.max(1, parseInt(response.headers.get('X-Total-Pages') || '1', 10)));
+            const nextCursor = response.headers.get('X-Next-Cursor');
+            if (nextCursor) cursors.current[page + 1] = nextCursor;
         } catch (err: any) {
             setError(err.message);
         } finally {
@@ -26,6 +49,13 @@ const AdminPanel: React.FC = () => {
         }
     };
 
+    const handleSearch = (e: React.FormEvent) => {
+        e.preventDefault();
+        cursors.current = {};
+        setPage(1);
+        setSearch(localSearch.trim());
+    };
+
     const handleRoleChange = async (userId: number, newRole: 'user' | 'admin') => {
         try {
             const response = await apiFetch(`/admin/users/${userId}/role`, {
@@ -52,6 +82,19 @@ const AdminPanel: React.FC = () => {
                 noIndex={true}
             />
             <h1>Панель администратора</h1>
+            <form onSubmit={handleSearch} style={{ display: 'flex', gap: '10px', marginBottom: '20px' }}>
+                <Search size={18} style={{ alignSelf: 'center', color: 'var(--text-light)' }} />
+                <input
+                    type="text"
+                    value={localSearch}
+                    onChange={e => setLocalSearch(e.target.value)}
+                    placeholder="Поиск по имени или email..."
+                    className="form-input"
+                    style={{ flex: 1 }}
+                />
+                <button type="submit" className="btn btn-primary">Найти</button>
+            </form>
+            <p>Пользователей: {totalCount}</p>
             <div className="card">
                 <table style={{ width: '100%', borderCollapse: 'collapse' }}>
                     <thead>
@@ -59,6 +102,9 @@ const AdminPanel: React.FC = () => {
                             <th style={{ padding: '10px' }}>ID</th>
                             <th style={{ padding: '10px' }}>Username</th>
                             <th style={{ padding: '10px' }}>Email</th>
+                            <th style={{ padding: '10px' }}>Decks</th>
+                            <th style={{ padding: '10px' }}>Cards</th>
+                            <th style={{ padding: '10px' }}>Sessions</th>
                             <th style={{ padding: '10px' }}>Role</th>
                             <th style={{ padding: '10px' }}>Actions</th>
                         </tr>
@@ -69,6 +115,9 @@ const AdminPanel: React.FC = () => {
                                 <td style={{ padding: '10px' }}>{user.id}</td>
                                 <td style={{ padding: '10px' }}>{user.username}</td>
                                 <td style={{ padding: '10px' }}>{user.email}</td>
+                                <td style={{ padding: '10px' }}>{user.deck_count}</td>
+                                <td style={{ padding: '10px' }}>{user.card_count}</td>
+                                <td style={{ padding: '10px' }}>{user.session_count}</td>
                                 <td style={{ padding: '10px' }}>
                                     <span style={{
                                         padding: '4px 8px',
@@ -94,6 +143,29 @@ const AdminPanel: React.FC = () => {
                     </tbody>
                 </table>
             </div>
+            {totalPages > 1 && (
+                <div className="pagination">
+                    <button
+                        className="btn btn-secondary"
+                        onClick={() => setPage(Math.max(1, page - 1))}
+                        disabled={page === 1}
+                    >
+                        <ChevronLeft size={20} />
+                        Назад
+                    </button>
+                    <span className="pagination-info">
+                        Страница {page} из {totalPages}
+                    </span>
+                    <button
+                        className="btn btn-secondary"
+                        onClick={() => setPage(Math.min(totalPages, page + 1))}
+                        disabled={page === totalPages}
+                    >
+                        Вперед
+                        <ChevronRight size={20} />
+                    </button>
+                </div>
+            )}
         </div>
     );
 };